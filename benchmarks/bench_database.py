@@ -0,0 +1,104 @@
+"""
+Micro-benchmarks for every method of the game client's Database class
+(game/DATABASE.py) against a seeded synthetic database.
+
+Read methods are called `--repeat` times with random users; write methods
+run against fresh synthetic users so they do not disturb each other.
+Methods that run the password KDF (create_user, authenticate) are called
+`--repeat-kdf` times, and whole-table methods (construction,
+get_all_users, load_leaderboard and the batch settle_offline_progress)
+`--repeat-slow` times.
+
+    python benchmarks/bench_database.py --users 100000 --output results.jsonl
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, '..', 'game'))
+from DATABASE import Database
+from common import print_table, summarize, write_results
+from seed import seed_database, username
+
+
+def timed(fn, args_iter):
+    timings = []
+    for args in args_iter:
+        start = time.perf_counter()
+        fn(*args)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--users', type=int, default=10_000)
+    parser.add_argument('--repeat', type=int, default=2000)
+    parser.add_argument('--repeat-slow', type=int, default=3)
+    parser.add_argument('--repeat-kdf', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--database', help='reuse a database made by seed.py instead of seeding one')
+    parser.add_argument('--output', help='append results to this JSON Lines file')
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+    n = args.users
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = args.database
+        seed_time = None
+        if path is None:
+            path = os.path.join(tmp, 'bench.db')
+            seed_time = seed_database(path, n, seed=args.seed)
+        results = {}
+
+        results['__init__'] = summarize(timed(lambda: Database(path).conn.close(), [()] * args.repeat_slow))
+        db = Database(path)
+        # Filled lazily; keep the first ranking query's load out of its timings
+        db.load_leaderboard()
+        upgrade_ids = [row['id'] for row in db.get_all_upgrades()]
+
+        def users(count=args.repeat):
+            return [(rng.randint(1, n),) for _ in range(count)]
+
+        results['get_user'] = summarize(timed(db.get_user, [(username(u),) for (u,) in users()]))
+        results['get_user_save'] = summarize(timed(db.get_user_save, users()))
+        results['get_user_upgrades'] = summarize(timed(db.get_user_upgrades, users()))
+        results['get_all_upgrades'] = summarize(timed(db.get_all_upgrades, [()] * args.repeat))
+        results['get_leaderboard'] = summarize(timed(db.get_leaderboard, [(10,)] * args.repeat))
+        results['get_rank'] = summarize(timed(db.get_rank, users()))
+        results['get_neighbors'] = summarize(timed(db.get_neighbors, users()))
+        results['update_user_save'] = summarize(timed(
+            db.update_user_save, [(u, rng.randint(0, 10_000), rng.randint(0, 1000)) for (u,) in users()]
+        ))
+        results['add_user_upgrade'] = summarize(timed(
+            db.add_user_upgrade, [(u, rng.choice(upgrade_ids)) for (u,) in users()]
+        ))
+        results['settle_offline_progress_user'] = summarize(timed(db.settle_offline_progress, users()))
+
+        new_names = [(f'bench{i}', 'password') for i in range(args.repeat_kdf)]
+        results['create_user'] = summarize(timed(db.create_user, new_names))
+        results['authenticate'] = summarize(timed(db.authenticate, new_names))
+        new_ids = [(db.get_user(name)['id'],) for name, _ in new_names]
+        results['delete_user'] = summarize(timed(db.delete_user, new_ids))
+
+        results['get_all_users'] = summarize(timed(db.get_all_users, [()] * args.repeat_slow))
+        results['load_leaderboard'] = summarize(timed(db.load_leaderboard, [()] * args.repeat_slow))
+        results['settle_offline_progress_all'] = summarize(timed(db.settle_offline_progress, [()] * args.repeat_slow))
+        db.conn.close()
+
+    params = {'users': n, 'repeat': args.repeat, 'repeat_slow': args.repeat_slow,
+              'repeat_kdf': args.repeat_kdf, 'seed': args.seed}
+    if seed_time is not None:
+        params['seed_seconds'] = seed_time
+    print(f'users={n} repeat={args.repeat}' + (f' seeded in {seed_time:.2f}s' if seed_time else ''))
+    print_table(results)
+    if args.output:
+        write_results(args.output, 'database', params, results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+"""
+Headless render benchmark for the pygame client (SDL dummy video driver).
+
+Compares the old immediate-mode frame (fill, render every label, flip at
+60 FPS) with the retained widget layer in game/ui.py: per-frame cost when
+idle and when the score changes every frame, and the CPU share of an idle
+client over a few seconds of wall time.
+
+    python benchmarks/bench_game_render.py --seconds 3
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+
+GAME_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'game')
+sys.path.insert(0, GAME_DIR)
+
+import pygame
+
+
+def legacy_frame(game):
+    # The per-frame work main_loop() did before the widget layer
+    game.screen.fill((240, 240, 240))
+    for text, pos in ((f"Score: {game.score}", (20, 20)), (f"Clicks: {game.clicks}", (20, 50))):
+        game.screen.blit(game.font.render(text, True, (0, 0, 0)), pos)
+    buttons = [("CLICK ME!", (300, 200, 200, 100), (100, 200, 100))]
+    for i, upgrade in enumerate(game.upgrade_catalog):
+        buttons.append((f"{upgrade['name']} - {upgrade['cost']}", (500, 100 + i * 60, 200, 50), (200, 100, 100)))
+    for text, rect, color in buttons:
+        pygame.draw.rect(game.screen, color, rect)
+        surface = game.font.render(text, True, (0, 0, 0))
+        game.screen.blit(surface, surface.get_rect(center=pygame.Rect(rect).center))
+    pygame.display.flip()
+
+
+def retained_frame(game):
+    game.score_label.set_text(f"Score: {game.score}")
+    game.clicks_label.set_text(f"Clicks: {game.clicks}")
+    rects = game.ui.render(game.screen)
+    if rects:
+        pygame.display.update(rects)
+
+
+def per_frame(fn, game, frames, mutate):
+    start = time.perf_counter()
+    for _ in range(frames):
+        if mutate:
+            game.click()
+        fn(game)
+    return (time.perf_counter() - start) / frames * 1000
+
+
+def cpu_share(run, seconds):
+    wall = time.perf_counter()
+    cpu = time.process_time()
+    run(seconds)
+    return (time.process_time() - cpu) / (time.perf_counter() - wall) * 100
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--frames', type=int, default=2000)
+    parser.add_argument('--seconds', type=float, default=3.0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # ClickerGame opens ../database/clicker.db relative to the cwd
+        os.makedirs(os.path.join(tmp, 'database'))
+        os.makedirs(os.path.join(tmp, 'run'))
+        os.chdir(os.path.join(tmp, 'run'))
+        import main as game_main
+
+        game = game_main.ClickerGame()
+        game.build_ui()
+
+        print(f'frames={args.frames}')
+        for mutate in (False, True):
+            label = 'score changing' if mutate else 'idle'
+            legacy = per_frame(legacy_frame, game, args.frames, mutate)
+            retained_frame(game)
+            retained = per_frame(retained_frame, game, args.frames, mutate)
+            print(f'{label:>15}: legacy {legacy:.3f} ms/frame, retained {retained:.3f} ms/frame')
+        cache = game.text_cache
+        print(f'text cache: {cache.hits} hits, {cache.misses} misses')
+
+        def legacy_loop(seconds):
+            end = time.perf_counter() + seconds
+            while time.perf_counter() < end:
+                pygame.event.get()
+                legacy_frame(game)
+                game.clock.tick(60)
+
+        def retained_loop(seconds):
+            pygame.time.set_timer(pygame.event.Event(pygame.QUIT), int(seconds * 1000), 1)
+            try:
+                game.main_loop()
+            except SystemExit:
+                pass
+
+        legacy_cpu = cpu_share(legacy_loop, args.seconds)
+        retained_cpu = cpu_share(retained_loop, args.seconds)
+        print(f'idle client CPU over {args.seconds}s: legacy {legacy_cpu:.1f}%, retained {retained_cpu:.1f}%')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+"""
+Load test for the leaderboard pub/sub hub behind /leaderboard/stream.
+
+Starts N idle subscriber threads consuming LeaderboardHub.listen() the
+same way the SSE endpoint does, publishes rank changes at a fixed rate
+and reports broadcast latency (publish -> subscriber wake-up) and how many
+changes were coalesced away.
+
+    python benchmarks/bench_leaderboard_stream.py --subscribers 2000 --updates 500
+"""
+import argparse
+import os
+import statistics
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'web'))
+from leaderboard_hub import LeaderboardHub
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--subscribers', type=int, default=1000)
+    parser.add_argument('--updates', type=int, default=500)
+    parser.add_argument('--rate', type=float, default=500.0, help='updates per second')
+    parser.add_argument('--users', type=int, default=100, help='distinct users being updated')
+    parser.add_argument('--min-interval', type=float, default=0.0)
+    args = parser.parse_args()
+
+    threading.stack_size(256 * 1024)
+    hub = LeaderboardHub(max_subscribers=args.subscribers)
+    latencies = []
+    received = [0]
+    lock = threading.Lock()
+    done = threading.Event()
+    ready = threading.Barrier(args.subscribers + 1)
+
+    def subscriber():
+        hub.try_subscribe()
+        local = []
+        count = 0
+        listener = hub.listen(hub.version, heartbeat=0.5, min_interval=args.min_interval)
+        ready.wait()
+        for _, changes in listener:
+            now = time.perf_counter()
+            if changes:
+                count += len(changes)
+                local.extend(now - change['ts'] for change in changes)
+            if done.is_set() and not changes:
+                break
+        hub.unsubscribe()
+        with lock:
+            latencies.extend(local)
+            received[0] += count
+
+    threads = [threading.Thread(target=subscriber, daemon=True) for _ in range(args.subscribers)]
+    for thread in threads:
+        thread.start()
+    ready.wait()
+    time.sleep(0.2)
+
+    interval = 1.0 / args.rate
+    start = time.perf_counter()
+    for i in range(args.updates):
+        hub.publish({'user_id': i % args.users, 'score': i, 'rank': 1, 'ts': time.perf_counter()})
+        next_at = start + (i + 1) * interval
+        delay = next_at - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+    publish_time = time.perf_counter() - start
+    time.sleep(0.5)
+    done.set()
+    for thread in threads:
+        thread.join()
+
+    sent = args.updates * args.subscribers
+    print(f'subscribers={args.subscribers} updates={args.updates} rate={args.rate}/s publish_time={publish_time:.2f}s')
+    print(f'deliveries: {received[0]} of {sent} ({100 - received[0] / sent * 100:.1f}% coalesced)')
+    if latencies:
+        print('broadcast latency: '
+              f'p50={percentile(latencies, 50) * 1000:.2f} ms '
+              f'p95={percentile(latencies, 95) * 1000:.2f} ms '
+              f'p99={percentile(latencies, 99) * 1000:.2f} ms '
+              f'max={max(latencies) * 1000:.2f} ms '
+              f'mean={statistics.mean(latencies) * 1000:.2f} ms')
+    print(hub.stats())
+
+
+if __name__ == '__main__':
+    main()
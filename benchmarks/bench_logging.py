@@ -0,0 +1,90 @@
+"""
+Per-call overhead of the web app's logging on the request thread, with the
+old synchronous RotatingFileHandler setup and with the async queue
+pipeline in web/log_pipeline.py.
+
+Each mode logs the same request-style INFO lines into a throwaway
+directory with a small rotation size, so rollovers happen during the run,
+and reports the latency of the logging call itself. Output to stderr is
+left out so the numbers reflect file I/O rather than the terminal.
+
+    python benchmarks/bench_logging.py --records 50000
+"""
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import time
+from logging.handlers import RotatingFileHandler
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'web'))
+from log_pipeline import TEXT_FORMAT, BlockingStopListener, DroppingQueueHandler, JsonFormatter
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+def run(logger, records, rate):
+    timings = []
+    interval = 1.0 / rate if rate else 0.0
+    for i in range(records):
+        start = time.perf_counter()
+        logger.info('User %s incremented their score', i)
+        timings.append(time.perf_counter() - start)
+        if interval:
+            time.sleep(interval)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--records', type=int, default=50000)
+    parser.add_argument('--max-bytes', type=int, default=1_000_000)
+    parser.add_argument('--queue-size', type=int, default=10000)
+    parser.add_argument('--rate', type=float, default=0.0, help='records per second (0 = as fast as possible)')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        results = {}
+        for mode in ('sync-text', 'async-json'):
+            logger = logging.getLogger(f'bench.{mode}')
+            logger.setLevel(logging.INFO)
+            logger.propagate = False
+            file_handler = RotatingFileHandler(
+                os.path.join(tmp, f'{mode}.log'), maxBytes=args.max_bytes, backupCount=5
+            )
+            queue_handler = listener = None
+            if mode == 'sync-text':
+                file_handler.setFormatter(logging.Formatter(TEXT_FORMAT))
+                logger.addHandler(file_handler)
+            else:
+                file_handler.setFormatter(JsonFormatter())
+                queue_handler = DroppingQueueHandler(args.queue_size)
+                listener = BlockingStopListener(queue_handler.queue, file_handler)
+                listener.start()
+                logger.addHandler(queue_handler)
+
+            start = time.perf_counter()
+            timings = run(logger, args.records, args.rate)
+            caller_time = time.perf_counter() - start
+            if listener is not None:
+                listener.stop()
+            drained_time = time.perf_counter() - start
+            file_handler.close()
+            results[mode] = (timings, caller_time, drained_time,
+                             queue_handler.stats()['dropped'] if queue_handler else 0)
+
+        print(f'{args.records} records, rotation at {args.max_bytes} bytes')
+        print(f'{"mode":<12} {"p50 us":>8} {"p99 us":>8} {"max us":>9} {"caller s":>9} {"drained s":>10} {"dropped":>8}')
+        for mode, (timings, caller_time, drained_time, dropped) in results.items():
+            print(f'{mode:<12} {percentile(timings, 50) * 1e6:>8.1f} {percentile(timings, 99) * 1e6:>8.1f} '
+                  f'{max(timings) * 1e6:>9.1f} {caller_time:>9.3f} {drained_time:>10.3f} {dropped:>8}')
+
+
+if __name__ == '__main__':
+    main()
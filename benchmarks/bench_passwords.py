@@ -0,0 +1,126 @@
+"""
+Login cost and throughput per password hashing setting.
+
+For each cost setting, measures single-threaded hash and verify latency,
+then runs `--clients` concurrent login threads through a PasswordPool with
+`--workers` hashing threads. That gives login throughput, login latency
+under load, and how long a cheap request waits for the CPU while logins
+run. Verification cache hits are reported separately.
+
+    python benchmarks/bench_passwords.py --clients 16 --workers 2 --output results.jsonl
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, '..'))
+sys.path.insert(0, os.path.join(BENCH_DIR, '..', 'web'))
+from common import print_table, summarize, write_results
+from password_pool import PasswordBusy, PasswordPool
+from shared.passwords import PasswordHasher
+
+SETTINGS = {
+    'scrypt n=2^12': dict(algorithm='scrypt', scrypt_n=2 ** 12),
+    'scrypt n=2^14': dict(algorithm='scrypt', scrypt_n=2 ** 14),
+    'scrypt n=2^15': dict(algorithm='scrypt', scrypt_n=2 ** 15),
+    'pbkdf2 100k': dict(algorithm='pbkdf2_sha256', pbkdf2_iterations=100_000),
+    'pbkdf2 310k': dict(algorithm='pbkdf2_sha256', pbkdf2_iterations=310_000),
+    'pbkdf2 600k': dict(algorithm='pbkdf2_sha256', pbkdf2_iterations=600_000),
+}
+
+
+def timed(fn, count):
+    timings = []
+    for _ in range(count):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def under_load(pool, stored, clients, logins):
+    """
+    Run `clients` threads doing `logins` verifications each, while a probe
+    thread measures how long a trivial unit of work takes to get the CPU.
+    """
+    timings = []
+    probes = []
+    rejected = [0]
+    lock = threading.Lock()
+    done = threading.Event()
+
+    def client():
+        local = []
+        for _ in range(logins):
+            start = time.perf_counter()
+            try:
+                pool.verify('password', stored)
+            except PasswordBusy:
+                with lock:
+                    rejected[0] += 1
+                continue
+            local.append(time.perf_counter() - start)
+        with lock:
+            timings.extend(local)
+
+    def probe():
+        while not done.is_set():
+            start = time.perf_counter()
+            sum(range(1000))
+            probes.append(time.perf_counter() - start)
+            time.sleep(0.005)
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    prober = threading.Thread(target=probe)
+    prober.start()
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - start
+    done.set()
+    prober.join()
+    return summarize(timings, wall), summarize(probes), rejected[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--setting', action='append', choices=sorted(SETTINGS),
+                        help='cost setting to run (repeatable; default all)')
+    parser.add_argument('--repeat', type=int, default=10, help='single-threaded hashes and verifications')
+    parser.add_argument('--clients', type=int, default=8)
+    parser.add_argument('--logins', type=int, default=5, help='logins per client thread')
+    parser.add_argument('--workers', type=int, default=max(1, (os.cpu_count() or 2) // 2))
+    parser.add_argument('--max-pending', type=int, default=64)
+    parser.add_argument('--output', help='append results to this JSON Lines file')
+    args = parser.parse_args()
+
+    results = {}
+    for name in args.setting or SETTINGS:
+        hasher = PasswordHasher(cache_size=0, **SETTINGS[name])
+        stored = hasher.hash('password')
+        results[f'{name} hash'] = summarize(timed(lambda: hasher.hash('password'), args.repeat))
+        results[f'{name} verify'] = summarize(timed(lambda: hasher.verify('password', stored), args.repeat))
+        pool = PasswordPool(hasher, workers=args.workers, max_pending=args.max_pending)
+        login, probe, rejected = under_load(pool, stored, args.clients, args.logins)
+        results[f'{name} login under load'] = dict(login, rejected=rejected)
+        results[f'{name} probe under load'] = probe
+
+    cached = PasswordHasher()
+    stored = cached.hash('password')
+    cached.verify('password', stored)
+    results['cache hit verify'] = summarize(timed(lambda: cached.verify('password', stored), args.repeat * 100))
+
+    print(f'clients={args.clients} logins={args.logins} workers={args.workers} cpus={os.cpu_count()}')
+    print_table(results)
+    if args.output:
+        params = {key: value for key, value in vars(args).items() if key != 'output'}
+        write_results(args.output, 'passwords', params, results)
+
+
+if __name__ == '__main__':
+    main()
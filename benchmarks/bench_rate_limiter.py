@@ -0,0 +1,106 @@
+"""
+Per-request cost and memory of the rate limiter (web/rate_limiter.py).
+
+Times RateLimiter.check() for a hot key, two scopes at once, a rejected
+request and a stream of new keys that keeps the LRU evicting, then the
+app's whole before_request hook for a rate-limited POST. A no-op call is
+timed as the baseline for timer overhead. Memory per bucket is measured
+with tracemalloc while `--keys` buckets are created.
+
+    python benchmarks/bench_rate_limiter.py --calls 200000 --output results.jsonl
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, '..', 'web'))
+from bench_web import load_app
+from common import print_table, summarize, write_results
+from rate_limiter import RateLimiter
+from seed import seed_database
+
+
+def timed(fn, args_iter):
+    timings = []
+    for args in args_iter:
+        start = time.perf_counter()
+        fn(*args)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def ip(i):
+    return f'10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}'
+
+
+def bytes_per_key(keys):
+    limiter = RateLimiter(max_keys=keys)
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    for i in range(keys):
+        limiter.check([(('increment_score', 'ip', ip(i)), 50, 100)])
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return (after - before) / keys
+
+
+def time_hook(calls):
+    """
+    Per-call time of the app's enforce_rate_limits hook for a logged-in
+    POST /increment_score, inside one pushed request context.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'bench.db')
+        seed_database(path, 10)
+        web_app = load_app(path, tmp)
+        web_app.RATE_LIMITS['increment_score'] = {'user': (1e9, 1e9), 'ip': (1e9, 1e9)}
+        with web_app.app.test_request_context('/increment_score', method='POST',
+                                              environ_base={'REMOTE_ADDR': '10.0.0.1'}):
+            web_app.session['user_id'] = 1
+            return timed(web_app.enforce_rate_limits, [()] * calls)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--calls', type=int, default=100_000)
+    parser.add_argument('--keys', type=int, default=100_000, help='buckets for the memory measurement')
+    parser.add_argument('--max-keys', type=int, default=10_000, help='LRU size for the churn case')
+    parser.add_argument('--output', help='append results to this JSON Lines file')
+    args = parser.parse_args()
+    n = args.calls
+
+    results = {}
+    results['no-op baseline'] = summarize(timed(lambda: None, [()] * n))
+
+    limiter = RateLimiter()
+    hot = [(('increment_score', 'ip', '10.0.0.1'), 1e9, 1e9)]
+    results['check hot key'] = summarize(timed(limiter.check, [(hot,)] * n))
+
+    two = hot + [(('increment_score', 'user', 1), 1e9, 1e9)]
+    results['check two scopes'] = summarize(timed(limiter.check, [(two,)] * n))
+
+    empty = [(('login', 'ip', '10.0.0.2'), 1e-9, 1)]
+    limiter.check(empty)
+    results['check rejected'] = summarize(timed(limiter.check, [(empty,)] * n))
+
+    churn = RateLimiter(max_keys=args.max_keys)
+    new_keys = [([(('increment_score', 'ip', ip(i)), 50, 100)],) for i in range(n)]
+    results['check new key + evict'] = summarize(timed(churn.check, new_keys))
+
+    results['before_request hook'] = summarize(time_hook(n))
+
+    per_key = bytes_per_key(args.keys)
+    print(f'calls={n} bytes/key={per_key:.0f} ({args.keys} keys -> {per_key * args.keys / 2 ** 20:.1f} MiB)')
+    print_table(results)
+    if args.output:
+        params = {key: value for key, value in vars(args).items() if key != 'output'}
+        params['bytes_per_key'] = per_key
+        write_results(args.output, 'rate_limiter', params, results)
+
+
+if __name__ == '__main__':
+    main()
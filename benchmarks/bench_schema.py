@@ -0,0 +1,115 @@
+"""
+Query-plan and latency comparison for the hot leaderboard and per-user
+queries, before and after shared/migrations.py is applied.
+
+Builds a throwaway database with the legacy web/init_db.py schema, times
+the queries, migrates it and times them again.
+
+    python benchmarks/bench_schema.py --users 200000
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from shared.migrations import migrate
+
+LEGACY_SCHEMA = '''
+CREATE TABLE users (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    username TEXT UNIQUE NOT NULL,
+    password TEXT NOT NULL,
+    is_admin INTEGER DEFAULT 0,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+CREATE TABLE game_saves (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL,
+    score INTEGER DEFAULT 0,
+    clicks INTEGER DEFAULT 0,
+    FOREIGN KEY(user_id) REFERENCES users(id)
+);
+'''
+
+QUERIES = {
+    'leaderboard_top10': ('''
+        SELECT u.username, gs.score
+        FROM game_saves gs
+        JOIN users u ON gs.user_id = u.id
+        ORDER BY gs.score DESC
+        LIMIT 10
+    ''', lambda n, mid: ()),
+    'leaderboard_keyset_page': ('''
+        SELECT gs.user_id, u.username, gs.score, gs.clicks
+        FROM game_saves gs
+        JOIN users u ON gs.user_id = u.id
+        WHERE gs.score <= ? AND (gs.score < ? OR gs.user_id > ?)
+        ORDER BY gs.score DESC, gs.user_id
+        LIMIT 50
+    ''', lambda n, mid: (mid, mid, n // 2)),
+    'user_score_lookup': (
+        'SELECT score FROM game_saves WHERE user_id = ?',
+        lambda n, mid: (random.randint(1, n),)
+    ),
+}
+
+
+def seed(conn, users):
+    conn.executescript(LEGACY_SCHEMA)
+    conn.executemany(
+        'INSERT INTO users (id, username, password) VALUES (?, ?, ?)',
+        ((i, f'user{i}', 'pw') for i in range(1, users + 1))
+    )
+    conn.executemany(
+        'INSERT INTO game_saves (user_id, score, clicks) VALUES (?, ?, ?)',
+        ((i, random.randint(0, 1_000_000), random.randint(0, 10_000)) for i in range(1, users + 1))
+    )
+    conn.commit()
+
+
+def measure(conn, users, repeat):
+    mid = conn.execute('SELECT score FROM game_saves WHERE user_id = ?', (users // 2,)).fetchone()[0]
+    results = {}
+    for name, (sql, params) in QUERIES.items():
+        plan = [row[3] for row in conn.execute('EXPLAIN QUERY PLAN ' + sql, params(users, mid))]
+        start = time.perf_counter()
+        for _ in range(repeat):
+            conn.execute(sql, params(users, mid)).fetchall()
+        elapsed = (time.perf_counter() - start) / repeat
+        results[name] = (elapsed, plan)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--users', type=int, default=100_000)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    random.seed(args.seed)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        conn = sqlite3.connect(os.path.join(tmp, 'bench.db'))
+        seed(conn, args.users)
+        before = measure(conn, args.users, args.repeat)
+        start = time.perf_counter()
+        applied = migrate(conn)
+        migrate_time = time.perf_counter() - start
+        after = measure(conn, args.users, args.repeat)
+        conn.close()
+
+    print(f'users={args.users} repeat={args.repeat} migrations={applied} migrate_time={migrate_time:.3f}s')
+    for name in QUERIES:
+        (t0, plan0), (t1, plan1) = before[name], after[name]
+        speedup = t0 / t1 if t1 else float('inf')
+        print(f'\n{name}: {t0 * 1000:.3f} ms -> {t1 * 1000:.3f} ms ({speedup:.1f}x)')
+        print('  before: ' + ' | '.join(plan0))
+        print('  after:  ' + ' | '.join(plan1))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,167 @@
+"""
+Cost of recording score history and speed of reading it
+(shared/score_history.py).
+
+Seeds a database and backfills `--days` of synthetic history, with
+`--active` random users making `--events` score changes in each hour,
+written the way the trigger would have: hour and day rollups throughout,
+minute rollups and raw events only as far back as their default
+retention. Then times:
+
+- click-batcher-style flushes (`--batch` users updated per transaction)
+  with the history trigger and with it dropped, for the write overhead,
+  both for new players each flush and for the same players clicking on
+- windowed leaderboards from rollups per named window, and the day window
+  summed from raw events for comparison
+- one user's hourly series for the last week
+- one prune that expires a day of rows
+
+    python benchmarks/bench_score_history.py --users 100000 --days 30 --output results.jsonl
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, '..'))
+from common import print_table, summarize, write_results
+from seed import seed_database
+from shared import score_history
+from shared.migrations import _add_score_history
+from shared.sharding import connect
+
+RAW_DAY_QUERY = '''
+    SELECT user_id, SUM(score_delta) AS score_gain
+    FROM score_events WHERE ts >= ?
+    GROUP BY user_id
+    ORDER BY score_gain DESC, user_id
+    LIMIT 10
+'''
+
+
+def backfill(conn, users, days, active, events, now, rng):
+    """
+    Synthetic history for the `days` before `now`: `events` score changes
+    for each of `active` random users in every hour. Returns rows written.
+    """
+    retention = score_history.DEFAULT_RETENTION
+    rollups = {}
+    event_rows = []
+    first_hour = (now - days * 86400) // 3600 * 3600
+    for hour in range(first_hour, now, 3600):
+        for user_id in rng.sample(range(1, users + 1), active):
+            for _ in range(events):
+                ts = hour + rng.randrange(3600)
+                gain = rng.randint(1, 50)
+                for seconds in score_history.RESOLUTIONS.values():
+                    if seconds == 60 and now - ts > retention['minute']:
+                        continue
+                    key = (seconds, ts // seconds * seconds, user_id)
+                    total, count = rollups.get(key, (0, 0))
+                    rollups[key] = (total + gain, count + 1)
+                if now - ts <= retention['events']:
+                    event_rows.append((user_id, ts, gain, 1, 0))
+    conn.executemany(
+        'INSERT INTO score_rollups VALUES (?, ?, ?, ?, ?, 0, ?)',
+        [key + (total, count, count) for key, (total, count) in sorted(rollups.items())]
+    )
+    event_rows.sort(key=lambda row: row[1])
+    conn.executemany('INSERT INTO score_events VALUES (?, ?, ?, ?, ?)', event_rows)
+    conn.commit()
+    conn.execute('ANALYZE')
+    return len(rollups) + len(event_rows)
+
+
+def time_flushes(conn, users, batch, repeat, rng, same_players):
+    """
+    Per-flush time for `batch` players: new random ones each time, whose
+    rollup rows for the current buckets do not exist yet, or the same ones
+    clicking on, whose rows are updated in place.
+    """
+    timings = []
+    players = rng.sample(range(1, users + 1), batch)
+    for _ in range(repeat):
+        if not same_players:
+            players = rng.sample(range(1, users + 1), batch)
+        rows = [(1, user_id) for user_id in players]
+        start = time.perf_counter()
+        conn.executemany('UPDATE game_saves SET score = score + ? WHERE user_id = ?', rows)
+        conn.commit()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def timed(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--users', type=int, default=10_000)
+    parser.add_argument('--days', type=int, default=30)
+    parser.add_argument('--active', type=int, default=500, help='users gaining score per hour')
+    parser.add_argument('--events', type=int, default=20, help='score changes per active user and hour')
+    parser.add_argument('--batch', type=int, default=500, help='users per flush transaction')
+    parser.add_argument('--repeat', type=int, default=50)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='append results to this JSON Lines file')
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+    active = min(args.active, args.users)
+    batch = min(args.batch, args.users)
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'bench.db')
+        seed_time = seed_database(path, args.users, seed=args.seed)
+        conn, shards = connect(path)
+        conn.execute('PRAGMA journal_mode=WAL')
+        # As the web app's connection pool does
+        conn.execute(f'PRAGMA mmap_size={64 * 1024 * 1024}')
+        now = int(time.time())
+        start = time.perf_counter()
+        rows = backfill(conn, args.users, args.days, active, args.events, now, rng)
+        backfill_time = time.perf_counter() - start
+
+        for history in ('on', 'off'):
+            if history == 'off':
+                conn.execute('DROP TRIGGER game_saves_history')
+            for players, same in (('new', False), ('same', True)):
+                results[f'flush {players} players, history {history}'] = summarize(
+                    time_flushes(conn, args.users, batch, args.repeat, rng, same))
+        _add_score_history(conn)
+        conn.commit()
+
+        for window, seconds in score_history.WINDOWS.items():
+            results[f'top 10, {window}'] = summarize(timed(
+                lambda: score_history.top_gains(conn, shards, time.time() - seconds), args.repeat))
+        results['top 10, day from raw events'] = summarize(timed(
+            lambda: conn.execute(RAW_DAY_QUERY, (time.time() - 86400,)).fetchall(), args.repeat))
+        results['series, week hourly'] = summarize(timed(
+            lambda: score_history.series(conn, shards, rng.randint(1, args.users), 'hour',
+                                         time.time() - 7 * 86400), args.repeat))
+        start = time.perf_counter()
+        deleted = score_history.prune(conn, shards, now=now + 86400)
+        results['prune one day'] = summarize([time.perf_counter() - start])
+        size = os.path.getsize(path)
+        conn.close()
+
+    print(f'users={args.users} days={args.days} active/hour={active} history rows={rows} '
+          f'(backfilled in {backfill_time:.2f}s, db {size / 2 ** 20:.1f} MiB) pruned={deleted}')
+    print_table(results)
+    if args.output:
+        params = {key: value for key, value in vars(args).items() if key != 'output'}
+        params.update(seed_seconds=seed_time, history_rows=rows)
+        write_results(args.output, 'score_history', params, results)
+
+
+if __name__ == '__main__':
+    main()
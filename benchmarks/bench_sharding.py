@@ -0,0 +1,111 @@
+"""
+Write throughput and cross-shard read cost by shard count
+(shared/sharding.py).
+
+Seeds one database, then for each `--shards` count reshards it and runs
+`--writers` processes that each commit `--writes` single-save updates to
+random users, one transaction per write as the web app's sync endpoint
+does. Writes to different shard files take different write locks, so
+aggregate throughput should grow with the shard count until the disk or
+CPUs are saturated. Also times a top-10 leaderboard read, which has to
+k-way merge every shard, and the reshard itself.
+
+    python benchmarks/bench_sharding.py --users 100000 --shards 1 2 4 8 --writers 8 --output results.jsonl
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, '..'))
+from common import print_table, summarize, write_results
+from seed import seed_database
+from shared.sharding import connect, reshard
+
+TOP_QUERY = '''
+    SELECT gs.user_id, u.username, gs.score
+    FROM {schema}.game_saves gs
+    JOIN main.users u ON gs.user_id = u.id
+    ORDER BY gs.score DESC, gs.user_id
+    LIMIT 10
+'''
+
+
+def writer(job):
+    path, users, writes, synchronous, seed = job
+    rng = random.Random(seed)
+    conn, shards = connect(path, timeout=60)
+    conn.execute('PRAGMA journal_mode=WAL')
+    for schema in shards.schemas:
+        conn.execute(f'PRAGMA {schema}.synchronous={synchronous}')
+    timings = []
+    for _ in range(writes):
+        user_id = rng.randint(1, users)
+        start = time.perf_counter()
+        conn.execute(
+            f'UPDATE {shards.schema_for(user_id)}.game_saves '
+            'SET score = score + 1, last_updated = CURRENT_TIMESTAMP WHERE user_id = ?',
+            (user_id,)
+        )
+        conn.commit()
+        timings.append(time.perf_counter() - start)
+    conn.close()
+    return timings
+
+
+def time_top(path, repeat):
+    conn, shards = connect(path)
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        rows = list(shards.merged(conn, TOP_QUERY, key=lambda row: (-row[2], row[0])))[:10]
+        timings.append(time.perf_counter() - start)
+    conn.close()
+    assert len(rows) == 10
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--users', type=int, default=10_000)
+    parser.add_argument('--shards', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--writers', type=int, default=8, help='writer processes')
+    parser.add_argument('--writes', type=int, default=500, help='committed writes per writer')
+    parser.add_argument('--synchronous', default='FULL', choices=['OFF', 'NORMAL', 'FULL'],
+                        help='FULL makes every commit wait for the disk, as durable writes do')
+    parser.add_argument('--repeat', type=int, default=200, help='top-10 reads per shard count')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='append results to this JSON Lines file')
+    args = parser.parse_args()
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'bench.db')
+        seed_time = seed_database(path, args.users, seed=args.seed)
+        with multiprocessing.get_context('spawn').Pool(args.writers) as pool:
+            for count in args.shards:
+                start = time.perf_counter()
+                reshard(path, count)
+                results[f'{count} shards: reshard'] = summarize([time.perf_counter() - start])
+                jobs = [(path, args.users, args.writes, args.synchronous, args.seed * 1000 + w)
+                        for w in range(args.writers)]
+                start = time.perf_counter()
+                timings = [t for worker_timings in pool.map(writer, jobs) for t in worker_timings]
+                results[f'{count} shards: write'] = summarize(timings, time.perf_counter() - start)
+                results[f'{count} shards: top 10'] = summarize(time_top(path, args.repeat))
+
+    print(f'users={args.users} writers={args.writers} synchronous={args.synchronous} '
+          f'cpus={os.cpu_count()} seeded in {seed_time:.2f}s')
+    print_table(results)
+    if args.output:
+        params = {key: value for key, value in vars(args).items() if key != 'output'}
+        params['seed_seconds'] = seed_time
+        write_results(args.output, 'sharding', params, results)
+
+
+if __name__ == '__main__':
+    main()
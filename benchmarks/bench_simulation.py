@@ -0,0 +1,107 @@
+"""
+Throughput of save plausibility checks (shared/simulation.py).
+
+Seeds a database, spreads account creation times over the last `--days`
+days so some seeded scores fit their play time and some do not, and
+optionally reshards it. Then times:
+
+- SaveSimulator.check() on in-memory batches of `--batch` saves, for the
+  pure rule evaluation
+- audit() over every save, which also streams saves and owned upgrades
+  from each shard
+- one audit(clamp=True), and the audit after it, which only finds saves
+  with implausible click counts
+
+    python benchmarks/bench_simulation.py --users 1000000 --shards 4 --output results.jsonl
+"""
+import argparse
+import itertools
+import os
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, '..'))
+from common import print_table, summarize, write_results
+from seed import seed_database
+from shared.simulation import audit, iter_saves, load_simulator
+from shared.sharding import connect, reshard
+
+
+def timed(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def with_rate(summary, saves):
+    """
+    `summary` plus saves checked per second at its mean.
+    """
+    return dict(summary, saves_per_sec=saves / (summary['mean_ms'] / 1000) if summary['mean_ms'] else 0.0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--users', type=int, default=100_000)
+    parser.add_argument('--days', type=int, default=30, help='spread of account ages')
+    parser.add_argument('--shards', type=int, default=1)
+    parser.add_argument('--batch', type=int, default=10_000, help='saves per check() call')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='append results to this JSON Lines file')
+    args = parser.parse_args()
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'bench.db')
+        seed_time = seed_database(path, args.users, seed=args.seed)
+        conn, _ = connect(path)
+        conn.execute(f'''
+            UPDATE users SET created_at = datetime('now', '-' || (abs(random()) % {args.days * 86400}) || ' seconds')
+        ''')
+        conn.commit()
+        conn.close()
+        if args.shards > 1:
+            reshard(path, args.shards)
+        conn, shards = connect(path)
+        simulator = load_simulator(conn)
+
+        saves = list(itertools.chain.from_iterable(iter_saves(conn, schema) for schema in shards.schemas))
+        batches = [saves[i:i + args.batch] for i in range(0, len(saves), args.batch)]
+        timings = []
+        for _ in range(args.repeat):
+            for batch in batches:
+                start = time.perf_counter()
+                simulator.check(batch)
+                timings.append(time.perf_counter() - start)
+        results[f'check(), {args.batch} saves'] = with_rate(summarize(timings), len(batches[0]))
+
+        results['audit, every save'] = with_rate(
+            summarize(timed(lambda: audit(conn, shards, simulator), args.repeat)), len(saves))
+        flagged = len(audit(conn, shards, simulator))
+        start = time.perf_counter()
+        audit(conn, shards, simulator, clamp=True)
+        results['audit and clamp'] = with_rate(summarize([time.perf_counter() - start]), len(saves))
+        remaining = len(audit(conn, shards, simulator))
+        results['audit after clamp'] = with_rate(
+            summarize(timed(lambda: audit(conn, shards, simulator), args.repeat)), len(saves))
+        conn.close()
+
+    print(f'users={args.users} shards={args.shards} flagged={flagged} '
+          f'after clamp={remaining} (seeded in {seed_time:.2f}s)')
+    print_table(results)
+    for case, summary in results.items():
+        print(f'{case}: {summary["saves_per_sec"]:.0f} saves/s')
+    if args.output:
+        params = {key: value for key, value in vars(args).items() if key != 'output'}
+        params.update(seed_seconds=seed_time, flagged=flagged, flagged_after_clamp=remaining)
+        write_results(args.output, 'simulation', params, results)
+
+
+if __name__ == '__main__':
+    main()
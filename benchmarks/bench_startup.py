@@ -0,0 +1,119 @@
+"""
+Game startup time up to the first rendered frame (game/main.py).
+
+Launches the game `--repeat` times per case in a fresh interpreter with
+SDL's dummy video driver, each in a working directory whose settings.json
+points it at a throwaway database, and has it draw and flip the login
+screen. Reports each phase and the whole time from process spawn to the
+first frame:
+
+- first launch: no database and no font cache yet, so the schema is
+  created, the admin user is seeded and system fonts are scanned
+- later launch: the same directory again, against a database seeded with
+  `--users` accounts; should not grow with the number of users
+
+    python benchmarks/bench_startup.py --users 100000 --output results.jsonl
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+GAME_DIR = os.path.join(BENCH_DIR, '..', 'game')
+from common import print_table, summarize, write_results
+from seed import seed_database
+
+PHASES = ('import', 'ClickerGame()', 'first frame', 'spawn to first frame')
+
+
+def child():
+    """
+    Runs in the launched interpreter: time each startup phase and print
+    them as JSON.
+    """
+    start = time.perf_counter()
+    sys.path.insert(0, GAME_DIR)
+    import pygame
+    import main as game_main
+    imported = time.perf_counter()
+    game = game_main.ClickerGame()
+    constructed = time.perf_counter()
+    game.draw_login_screen()
+    pygame.display.flip()
+    drawn = time.perf_counter()
+    print(json.dumps({
+        'first_frame_at': time.time(),
+        'import': imported - start,
+        'ClickerGame()': constructed - imported,
+        'first frame': drawn - constructed,
+    }))
+    game.db.conn.close()
+    pygame.quit()
+
+
+def launch(workdir):
+    env = dict(os.environ)
+    env.setdefault('SDL_VIDEODRIVER', 'dummy')
+    env['PYGAME_HIDE_SUPPORT_PROMPT'] = '1'
+    spawned = time.time()
+    out = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), '--child'],
+        cwd=workdir, env=env, check=True, capture_output=True, text=True
+    ).stdout
+    phases = json.loads(out.strip().splitlines()[-1])
+    phases['spawn to first frame'] = phases.pop('first_frame_at') - spawned
+    return phases
+
+
+def make_workdir(parent, database):
+    workdir = tempfile.mkdtemp(dir=parent)
+    with open(os.path.join(workdir, 'settings.json'), 'w') as f:
+        json.dump({'database': database}, f)
+    return workdir
+
+
+def collect(results, case, runs):
+    for phase in PHASES:
+        results[f'{case}: {phase}'] = summarize([run[phase] for run in runs])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--users', type=int, default=10_000)
+    parser.add_argument('--repeat', type=int, default=10, help='launches per case')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--output', help='append results to this JSON Lines file')
+    args = parser.parse_args()
+    if args.child:
+        child()
+        return
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        runs = []
+        for i in range(args.repeat):
+            runs.append(launch(make_workdir(tmp, os.path.join(tmp, f'new{i}.db'))))
+        collect(results, 'first launch', runs)
+
+        path = os.path.join(tmp, 'bench.db')
+        seed_time = seed_database(path, args.users, seed=args.seed)
+        workdir = make_workdir(tmp, path)
+        # Fills the font cache
+        launch(workdir)
+        collect(results, 'later launch', [launch(workdir) for _ in range(args.repeat)])
+
+    print(f'users={args.users} seeded in {seed_time:.2f}s')
+    print_table(results)
+    if args.output:
+        params = {key: value for key, value in vars(args).items() if key not in ('output', 'child')}
+        params['seed_seconds'] = seed_time
+        write_results(args.output, 'startup', params, results)
+
+
+if __name__ == '__main__':
+    main()
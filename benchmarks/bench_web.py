@@ -0,0 +1,262 @@
+"""
+Route benchmarks for the Flask app (web/app.py) against a seeded
+synthetic database.
+
+Drives /, /leaderboard (HTML and NDJSON), /increment_score, /login and
+/register in two ways: in-process through the Flask test client, which
+measures the app itself, and over HTTP against a local threaded server
+with `--http-workers` client processes, which adds sockets, the WSGI
+server and contention between concurrent requests. With
+`--gunicorn-workers` the HTTP run is repeated against web/gunicorn.conf.py
+with each given number of server processes, to show how throughput scales.
+
+    python benchmarks/bench_web.py --users 100000 --http-workers 8 --output results.jsonl
+    python benchmarks/bench_web.py --http-workers 16 --gunicorn-workers 1 2 4 --output results.jsonl
+"""
+import argparse
+import http.client
+import json
+import logging
+import multiprocessing
+import os
+import random
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+WEB_DIR = os.path.join(BENCH_DIR, '..', 'web')
+from common import print_table, summarize, write_results
+from seed import PASSWORD, seed_database, username
+
+CASES = [
+    'GET /',
+    'GET / (logged in)',
+    'GET /leaderboard',
+    'GET /leaderboard ndjson',
+    'POST /increment_score',
+    'POST /login',
+    'POST /register',
+]
+
+
+def load_app(db_path, workdir):
+    """
+    Import web/app.py against `db_path`, with its log files in `workdir`.
+    """
+    os.environ['DATABASE'] = db_path
+    os.environ.setdefault('LOG_MODE', 'async')
+    # Seeded users share one password hash; without this every login after
+    # the first would be a verification cache hit
+    os.environ.setdefault('PASSWORD_CACHE_SIZE', '0')
+    os.chdir(workdir)
+    sys.path.insert(0, WEB_DIR)
+    import app as web_app
+    # Keep the app and werkzeug access logs out of the measurements
+    logging.getLogger().setLevel(logging.WARNING)
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    # Every synthetic client shares one address and a handful of accounts,
+    # so the per-route limits would turn most requests into 429s. The
+    # environment carries this to gunicorn workers.
+    os.environ['RATE_LIMITS'] = json.dumps({endpoint: {} for endpoint in web_app.RATE_LIMITS})
+    web_app.RATE_LIMITS.clear()
+    return web_app
+
+
+def request_for(case, rng, users, tag, i):
+    """
+    (method, path, form) for one request of `case`.
+    """
+    if case == 'GET /' or case == 'GET / (logged in)':
+        return 'GET', '/', None
+    if case == 'GET /leaderboard':
+        return 'GET', '/leaderboard', None
+    if case == 'GET /leaderboard ndjson':
+        return 'GET', '/leaderboard?format=ndjson&limit=1000', None
+    if case == 'POST /increment_score':
+        return 'POST', '/increment_score', {}
+    if case == 'POST /login':
+        return 'POST', '/login', {'username': username(rng.randint(1, users)), 'password': PASSWORD}
+    if case == 'POST /register':
+        return 'POST', '/register', {'username': f'{tag}-{i}', 'password': PASSWORD}
+    raise ValueError(case)
+
+
+def needs_login(case):
+    return case in ('GET / (logged in)', 'POST /increment_score')
+
+
+def run_test_client(web_app, users, repeat, seed):
+    rng = random.Random(seed)
+    results = {}
+    for case in CASES:
+        client = web_app.app.test_client()
+        if needs_login(case):
+            client.post('/login', data={'username': username(rng.randint(1, users)), 'password': PASSWORD})
+        timings = []
+        for i in range(repeat):
+            method, path, form = request_for(case, rng, users, 'tc', i)
+            if case == 'POST /increment_score':
+                # The app ignores a second click until the page is viewed
+                with client.session_transaction() as session:
+                    session.pop('score_incremented_flash', None)
+            start = time.perf_counter()
+            response = client.open(path, method=method, data=form)
+            response.get_data()
+            timings.append(time.perf_counter() - start)
+            response.close()
+        results[case] = summarize(timings)
+    return results
+
+
+class HttpClient:
+    """
+    Keep-alive HTTP client that carries the session cookie like a browser.
+    """
+
+    def __init__(self, port):
+        self.conn = http.client.HTTPConnection('127.0.0.1', port)
+        self.cookie = None
+
+    def request(self, method, path, form=None):
+        headers = {}
+        body = None
+        if form is not None:
+            body = urllib.parse.urlencode(form)
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        if self.cookie:
+            headers['Cookie'] = self.cookie
+        self.conn.request(method, path, body=body, headers=headers)
+        response = self.conn.getresponse()
+        response.read()
+        cookie = response.getheader('Set-Cookie')
+        if cookie:
+            self.cookie = cookie.split(';', 1)[0]
+        return response.status
+
+
+def http_worker(job):
+    port, case, repeat, users, seed, worker = job
+    rng = random.Random(seed * 1000 + worker)
+    client = HttpClient(port)
+    if needs_login(case):
+        client.request('POST', '/login', {'username': username(rng.randint(1, users)), 'password': PASSWORD})
+    timings = []
+    for i in range(repeat):
+        method, path, form = request_for(case, rng, users, f'http{worker}', i)
+        start = time.perf_counter()
+        client.request(method, path, form)
+        timings.append(time.perf_counter() - start)
+        if case == 'POST /increment_score':
+            # Follow the redirect like a browser so the next click counts
+            client.request('GET', '/')
+    return timings
+
+
+def drive_http(port, users, repeat, seed, workers):
+    results = {}
+    with multiprocessing.get_context('spawn').Pool(workers) as pool:
+        for case in CASES:
+            jobs = [(port, case, repeat, users, seed, w) for w in range(workers)]
+            start = time.perf_counter()
+            timings = [t for worker_timings in pool.map(http_worker, jobs) for t in worker_timings]
+            results[case] = summarize(timings, time.perf_counter() - start)
+    return results
+
+
+def run_http(web_app, users, repeat, seed, workers):
+    from werkzeug.serving import make_server
+    server = make_server('127.0.0.1', 0, web_app.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        return drive_http(server.port, users, repeat, seed, workers)
+    finally:
+        server.shutdown()
+
+
+def run_gunicorn(workdir, server_workers, users, repeat, seed, workers):
+    """
+    Start gunicorn with web/gunicorn.conf.py and `server_workers` processes
+    against the database load_app() configured, drive it like run_http(),
+    then stop it with SIGTERM so queued clicks are flushed.
+    """
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+    env = dict(os.environ, WEB_BIND=f'127.0.0.1:{port}', WEB_WORKERS=str(server_workers))
+    with open(os.path.join(workdir, f'gunicorn-{server_workers}.log'), 'w') as log:
+        server = subprocess.Popen(
+            [sys.executable, '-m', 'gunicorn', '-c', os.path.join(WEB_DIR, 'gunicorn.conf.py')],
+            env=env, stdout=log, stderr=log,
+        )
+        try:
+            deadline = time.monotonic() + 30
+            while True:
+                try:
+                    socket.create_connection(('127.0.0.1', port), timeout=1).close()
+                    break
+                except OSError:
+                    if server.poll() is not None or time.monotonic() > deadline:
+                        raise RuntimeError(f'gunicorn did not start, see {log.name}')
+                    time.sleep(0.1)
+            return drive_http(port, users, repeat, seed, workers)
+        finally:
+            server.send_signal(signal.SIGTERM)
+            server.wait(timeout=60)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--users', type=int, default=10_000)
+    parser.add_argument('--repeat', type=int, default=500, help='requests per case (per worker over HTTP)')
+    parser.add_argument('--http-workers', type=int, default=4, help='client processes for the HTTP run; 0 skips it')
+    parser.add_argument('--gunicorn-workers', type=int, nargs='*', default=[],
+                        help='also serve with gunicorn using each of these process counts')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--database', help='copy of a database made by seed.py to run against')
+    parser.add_argument('--output', help='append results to this JSON Lines file')
+    args = parser.parse_args()
+    if args.output:
+        args.output = os.path.abspath(args.output)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.abspath(args.database) if args.database else os.path.join(tmp, 'bench.db')
+        seed_time = None
+        if args.database is None:
+            seed_time = seed_database(path, args.users, seed=args.seed)
+        web_app = load_app(path, tmp)
+        params = {'users': args.users, 'repeat': args.repeat, 'seed': args.seed}
+        if seed_time is not None:
+            params['seed_seconds'] = seed_time
+
+        print(f'users={args.users} repeat={args.repeat}' + (f' seeded in {seed_time:.2f}s' if seed_time else ''))
+        print('\nFlask test client')
+        results = run_test_client(web_app, args.users, args.repeat, args.seed)
+        print_table(results)
+        if args.output:
+            write_results(args.output, 'web_test_client', params, results)
+
+        if args.http_workers:
+            print(f'\nHTTP, {args.http_workers} client processes')
+            results = run_http(web_app, args.users, args.repeat, args.seed, args.http_workers)
+            print_table(results)
+            if args.output:
+                write_results(args.output, 'web_http', dict(params, workers=args.http_workers), results)
+        web_app.shutdown()
+
+        for server_workers in args.gunicorn_workers:
+            print(f'\ngunicorn, {server_workers} server processes, {args.http_workers} client processes')
+            results = run_gunicorn(tmp, server_workers, args.users, args.repeat, args.seed, args.http_workers)
+            print_table(results)
+            if args.output:
+                write_results(args.output, 'web_gunicorn',
+                              dict(params, workers=args.http_workers, server_workers=server_workers), results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""
+Helpers shared by the benchmark scripts: latency summaries and the
+machine-readable results file.
+
+Results are appended to a JSON Lines file, one record per benchmark run,
+tagged with the git commit they were measured at, so runs from different
+commits can be compared with compare_results.py.
+"""
+import json
+import os
+import platform
+import sqlite3
+import subprocess
+import sys
+import time
+
+REPO_ROOT = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+def summarize(timings, wall_time=None):
+    """
+    Latency summary in milliseconds for a list of per-call timings in
+    seconds. Throughput uses `wall_time` when the calls overlapped.
+    """
+    if not timings:
+        return {'count': 0}
+    total = sum(timings)
+    timings = sorted(timings)
+    return {
+        'count': len(timings),
+        'mean_ms': total / len(timings) * 1000,
+        'p50_ms': percentile(timings, 50) * 1000,
+        'p95_ms': percentile(timings, 95) * 1000,
+        'p99_ms': percentile(timings, 99) * 1000,
+        'max_ms': timings[-1] * 1000,
+        'ops_per_sec': len(timings) / (wall_time if wall_time else total) if total else 0.0,
+    }
+
+
+def git_revision():
+    """
+    (commit, dirty) of the working tree, or (None, None) outside git.
+    """
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], cwd=REPO_ROOT,
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+        status = subprocess.run(
+            ['git', 'status', '--porcelain', '--untracked-files=no'], cwd=REPO_ROOT,
+            capture_output=True, text=True, check=True
+        ).stdout
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+    return commit, bool(status.strip())
+
+
+def write_results(path, benchmark, params, results):
+    """
+    Append one run of `benchmark` to the JSON Lines file at `path`.
+    `results` maps a case name to its summarize() dict.
+    """
+    commit, dirty = git_revision()
+    record = {
+        'benchmark': benchmark,
+        'commit': commit,
+        'dirty': dirty,
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'python': sys.version.split()[0],
+        'sqlite': sqlite3.sqlite_version,
+        'platform': platform.platform(),
+        'params': params,
+        'results': results,
+    }
+    with open(path, 'a') as f:
+        f.write(json.dumps(record) + '\n')
+
+
+def print_table(results):
+    print(f'{"case":<32} {"count":>7} {"p50 ms":>9} {"p95 ms":>9} {"p99 ms":>9} {"ops/s":>10}')
+    for case, summary in results.items():
+        if not summary.get('count'):
+            continue
+        print(f'{case:<32} {summary["count"]:>7} {summary["p50_ms"]:>9.3f} {summary["p95_ms"]:>9.3f} '
+              f'{summary["p99_ms"]:>9.3f} {summary["ops_per_sec"]:>10.0f}')
@@ -0,0 +1,71 @@
+"""
+Compare benchmark runs recorded by common.write_results() across commits.
+
+For every benchmark in the results file, the latest run is compared with
+the latest run at `--baseline` (default: the most recent earlier commit).
+Cases whose p50 grew by more than `--threshold` percent are reported as
+regressions, and the exit status is 1 if there are any.
+
+    python benchmarks/compare_results.py results.jsonl --baseline HEAD~1
+"""
+import argparse
+import json
+import subprocess
+import sys
+
+from common import REPO_ROOT
+
+
+def resolve(rev):
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', rev], cwd=REPO_ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return rev
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('results')
+    parser.add_argument('--baseline', help='commit to compare against')
+    parser.add_argument('--metric', default='p50_ms')
+    parser.add_argument('--threshold', type=float, default=10.0, help='percent slowdown that counts as a regression')
+    args = parser.parse_args()
+    baseline = resolve(args.baseline) if args.baseline else None
+
+    runs = {}
+    with open(args.results) as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                runs.setdefault(record['benchmark'], []).append(record)
+
+    regressions = 0
+    for benchmark, records in runs.items():
+        current = records[-1]
+        older = [r for r in records[:-1] if r['commit'] != current['commit'] or baseline == current['commit']]
+        if baseline:
+            older = [r for r in older if r['commit'] == baseline]
+        if not older:
+            print(f'{benchmark}: no baseline run to compare with')
+            continue
+        base = older[-1]
+        print(f'{benchmark}: {str(base["commit"])[:10]} -> {str(current["commit"])[:10]}'
+              f'{" (dirty)" if current.get("dirty") else ""}')
+        for case, summary in current['results'].items():
+            before = base['results'].get(case, {}).get(args.metric)
+            after = summary.get(args.metric)
+            if not before or after is None:
+                continue
+            change = (after - before) / before * 100
+            flag = ''
+            if change > args.threshold:
+                flag = '  REGRESSION'
+                regressions += 1
+            print(f'  {case:<32} {before:>9.3f} -> {after:>9.3f} {args.metric} ({change:+.1f}%){flag}')
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
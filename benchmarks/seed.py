@@ -0,0 +1,86 @@
+"""
+Synthetic database generator for the benchmarks.
+
+Creates a database at the current schema version and bulk-loads `users`
+accounts (user1 .. userN, password 'password') with skewed scores, their
+game saves and a sprinkling of owned upgrades. Every account stores the
+same password hash, computed once at the default cost, because hashing
+millions of passwords would take hours. Rows are generated lazily
+and inserted with executemany() in fixed-size batches, one transaction per
+batch, so 10M users load in constant memory.
+
+    python benchmarks/seed.py bench.db --users 1000000
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from shared.migrations import migrate
+from shared.passwords import PasswordHasher
+
+PASSWORD = 'password'
+
+
+def username(user_id):
+    return f'user{user_id}'
+
+
+def seed_database(path, users, batch_size=50_000, seed=1, upgrade_share=0.1, hasher=None):
+    """
+    Create `path` and load `users` synthetic accounts into it. Returns the
+    load time in seconds. Durability is switched off while loading.
+    """
+    rng = random.Random(seed)
+    password_hash = (hasher or PasswordHasher()).hash(PASSWORD)
+    conn = sqlite3.connect(path)
+    migrate(conn)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=OFF')
+    upgrade_ids = [row[0] for row in conn.execute('SELECT id FROM upgrades')]
+    start = time.perf_counter()
+    for first in range(1, users + 1, batch_size):
+        ids = range(first, min(first + batch_size, users + 1))
+        conn.executemany(
+            'INSERT INTO users (id, username, password) VALUES (?, ?, ?)',
+            ((i, username(i), password_hash) for i in ids)
+        )
+        saves = []
+        for i in ids:
+            # Heavy-tailed like a real leaderboard: most players score little
+            score = int(rng.paretovariate(1.2) * 10) - 10
+            saves.append((i, score, score // max(1, rng.randint(1, 5))))
+        conn.executemany(
+            'INSERT INTO game_saves (user_id, score, clicks) VALUES (?, ?, ?)', saves
+        )
+        if upgrade_ids:
+            conn.executemany(
+                'INSERT INTO user_upgrades (user_id, upgrade_id, quantity) VALUES (?, ?, ?)',
+                ((i, rng.choice(upgrade_ids), rng.randint(1, 20))
+                 for i in ids if rng.random() < upgrade_share)
+            )
+        conn.commit()
+    conn.execute('ANALYZE')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.close()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('database')
+    parser.add_argument('--users', type=int, default=10_000)
+    parser.add_argument('--batch-size', type=int, default=50_000)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    if os.path.exists(args.database):
+        parser.error(f'{args.database} already exists')
+    elapsed = seed_database(args.database, args.users, args.batch_size, args.seed)
+    print(f'Loaded {args.users} users in {elapsed:.2f}s ({args.users / elapsed:.0f} users/s)')
+
+
+if __name__ == '__main__':
+    main()
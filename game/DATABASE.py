@@ -1,87 +1,68 @@
+import itertools
 import sqlite3
 import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from shared.leaderboard import Leaderboard
+from shared.migrations import migrate
+from shared.passwords import PasswordHasher
+from shared.sharding import ShardMap
+from shared import production
 
 class Database:
-    def __init__(self, db_path):
+    def __init__(self, db_path, hasher=None):
+        self.db_path = db_path
+        self.hasher = hasher or PasswordHasher()
         self.conn = sqlite3.connect(db_path)
         self.conn.row_factory = sqlite3.Row
+        # The upgrade catalog is static at runtime, so it is read once and
+        # kept until invalidate_upgrade_cache() is called
+        self._upgrade_cache = None
         self.create_tables()
+        # Only ranking queries need every save in memory, so the index is
+        # filled on first use instead of on every launch; updates made
+        # before then are superseded by the load
+        self.leaderboard = Leaderboard()
+        self._leaderboard_loaded = False
+    
+    def load_leaderboard(self):
+        self.leaderboard.load(itertools.chain.from_iterable(
+            self.conn.execute(f'''
+                SELECT gs.user_id, u.username, gs.score, gs.clicks
+                FROM {schema}.game_saves gs
+                JOIN main.users u ON gs.user_id = u.id
+            ''')
+            for schema in self.shards.schemas
+        ))
+        self._leaderboard_loaded = True
+    
+    def _ensure_leaderboard(self):
+        if not self._leaderboard_loaded:
+            self.load_leaderboard()
     
     def create_tables(self):
-        cursor = self.conn.cursor()
+        # Shared, versioned schema (tables, constraints, indexes, seed
+        # upgrades); a current database costs one PRAGMA user_version read
+        migrate(self.conn)
+        # Saves and owned upgrades may be split across shard files
+        self.shards = ShardMap.load(self.conn, self.db_path)
+        self.shards.attach(self.conn)
         
-        # Users table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS users (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                username TEXT UNIQUE NOT NULL,
-                password TEXT NOT NULL,
-                is_admin BOOLEAN DEFAULT FALSE,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        # Game saves table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS game_saves (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER NOT NULL,
-                score INTEGER DEFAULT 0,
-                clicks INTEGER DEFAULT 0,
-                last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE
-            )
-        ''')
-        
-        # Upgrades table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS upgrades (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL,
-                cost INTEGER NOT NULL,
-                increment INTEGER NOT NULL,
-                description TEXT
-            )
-        ''')
-        
-        # User upgrades table (M:N relationship)
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS user_upgrades (
-                user_id INTEGER,
-                upgrade_id INTEGER,
-                quantity INTEGER DEFAULT 1,
-                purchased_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                PRIMARY KEY (user_id, upgrade_id),
-                FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE,
-                FOREIGN KEY (upgrade_id) REFERENCES upgrades (id) ON DELETE CASCADE
-            )
-        ''')
-        
-        # Insert default upgrades if not exists
-        cursor.execute('SELECT COUNT(*) FROM upgrades')
-        if cursor.fetchone()[0] == 0:
-            default_upgrades = [
-                ('Auto-Clicker', 10, 1, 'Generates 1 point per second'),
-                ('Double Points', 50, 2, 'Each click gives 2 points'),
-                ('Mega Clicker', 100, 5, 'Each click gives 5 points')
-            ]
-            cursor.executemany(
-                'INSERT INTO upgrades (name, cost, increment, description) VALUES (?, ?, ?, ?)',
-                default_upgrades
-            )
-        
-        # Insert admin user if not exists
-        cursor.execute('SELECT COUNT(*) FROM users WHERE username = "admin"')
-        if cursor.fetchone()[0] == 0:
-            cursor.execute(
-                'INSERT INTO users (username, password, is_admin) VALUES (?, ?, ?)',
-                ('admin', 'admin', True)
-            )
+        # Seed the admin user whenever it is missing, whatever migrate()
+        # did; when it exists this is one indexed lookup and no hashing
+        if self.conn.execute("SELECT 1 FROM users WHERE username = 'admin'").fetchone() is not None:
+            return
+        cursor = self.conn.execute(
+            'INSERT INTO users (username, password, is_admin) '
+            'SELECT ?, ?, ? WHERE NOT EXISTS (SELECT 1 FROM users WHERE username = ?)',
+            ('admin', self.hasher.hash('admin'), True, 'admin')
+        )
+        if cursor.rowcount:
             cursor.execute(
-                'INSERT INTO game_saves (user_id) VALUES (?)',
+                f'INSERT INTO {self.shards.schema_for(cursor.lastrowid)}.game_saves (user_id) VALUES (?)',
                 (cursor.lastrowid,)
             )
-        
         self.conn.commit()
     
     def get_user(self, username):
@@ -89,74 +70,121 @@ class Database:
         cursor.execute('SELECT * FROM users WHERE username = ?', (username,))
         return cursor.fetchone()
     
+    def authenticate(self, username, password):
+        # Returns the user row for valid credentials; plaintext or outdated
+        # hashes are upgraded to the current cost on success
+        user = self.get_user(username)
+        if user is None or not self.hasher.verify(password, user['password']):
+            return None
+        if self.hasher.needs_rehash(user['password']):
+            self.conn.execute(
+                'UPDATE users SET password = ? WHERE id = ? AND password = ?',
+                (self.hasher.hash(password), user['id'], user['password'])
+            )
+            self.conn.commit()
+        return user
+    
     def create_user(self, username, password):
         try:
             cursor = self.conn.cursor()
             cursor.execute(
                 'INSERT INTO users (username, password) VALUES (?, ?)',
-                (username, password)
+                (username, self.hasher.hash(password))
             )
+            user_id = cursor.lastrowid
             cursor.execute(
-                'INSERT INTO game_saves (user_id) VALUES (?)',
-                (cursor.lastrowid,)
+                f'INSERT INTO {self.shards.schema_for(user_id)}.game_saves (user_id) VALUES (?)',
+                (user_id,)
             )
             self.conn.commit()
+            self.leaderboard.update(user_id, 0, username=username, clicks=0)
             return True
         except sqlite3.IntegrityError:
             return False
     
     def get_user_save(self, user_id):
         cursor = self.conn.cursor()
-        cursor.execute('SELECT * FROM game_saves WHERE user_id = ?', (user_id,))
+        cursor.execute(f'SELECT * FROM {self.shards.schema_for(user_id)}.game_saves WHERE user_id = ?', (user_id,))
         return cursor.fetchone()
     
     def update_user_save(self, user_id, score, clicks):
         cursor = self.conn.cursor()
         cursor.execute(
-            'UPDATE game_saves SET score = ?, clicks = ?, last_updated = CURRENT_TIMESTAMP WHERE user_id = ?',
+            f'UPDATE {self.shards.schema_for(user_id)}.game_saves '
+            'SET score = ?, clicks = ?, last_updated = CURRENT_TIMESTAMP WHERE user_id = ?',
             (score, clicks, user_id)
         )
         self.conn.commit()
+        self.leaderboard.update(user_id, score, clicks=clicks)
+    
+    def settle_offline_progress(self, user_id=None, max_offline_seconds=None):
+        # Credit passive income since last_updated for one user, or for
+        # every save in a single batch when user_id is None
+        if user_id is None:
+            updated = sum(
+                production.settle_offline_progress(self.conn, max_offline_seconds=max_offline_seconds, schema=schema)
+                for schema in self.shards.schemas
+            )
+        else:
+            updated = production.settle_offline_progress(
+                self.conn, max_offline_seconds=max_offline_seconds, user_ids=[user_id],
+                schema=self.shards.schema_for(user_id)
+            )
+        if updated:
+            if user_id is None:
+                # Reloaded on next use
+                self._leaderboard_loaded = False
+            else:
+                save = self.get_user_save(user_id)
+                self.leaderboard.update(user_id, save['score'], clicks=save['clicks'])
+        return updated
     
     def get_all_upgrades(self):
-        cursor = self.conn.cursor()
-        cursor.execute('SELECT * FROM upgrades')
-        return cursor.fetchall()
+        if self._upgrade_cache is None:
+            cursor = self.conn.cursor()
+            cursor.execute('SELECT * FROM upgrades')
+            self._upgrade_cache = tuple(cursor.fetchall())
+        return self._upgrade_cache
+    
+    def invalidate_upgrade_cache(self):
+        self._upgrade_cache = None
     
     def get_user_upgrades(self, user_id):
         cursor = self.conn.cursor()
-        cursor.execute('''
+        cursor.execute(f'''
             SELECT u.*, uu.quantity 
-            FROM upgrades u 
-            JOIN user_upgrades uu ON u.id = uu.upgrade_id 
+            FROM main.upgrades u 
+            JOIN {self.shards.schema_for(user_id)}.user_upgrades uu ON u.id = uu.upgrade_id 
             WHERE uu.user_id = ?
         ''', (user_id,))
         return cursor.fetchall()
     
     def add_user_upgrade(self, user_id, upgrade_id):
         cursor = self.conn.cursor()
+        schema = self.shards.schema_for(user_id)
         try:
             cursor.execute(
-                'INSERT INTO user_upgrades (user_id, upgrade_id) VALUES (?, ?)',
+                f'INSERT INTO {schema}.user_upgrades (user_id, upgrade_id) VALUES (?, ?)',
                 (user_id, upgrade_id)
             )
         except sqlite3.IntegrityError:
             cursor.execute(
-                'UPDATE user_upgrades SET quantity = quantity + 1 WHERE user_id = ? AND upgrade_id = ?',
+                f'UPDATE {schema}.user_upgrades SET quantity = quantity + 1 WHERE user_id = ? AND upgrade_id = ?',
                 (user_id, upgrade_id)
             )
         self.conn.commit()
     
     def get_leaderboard(self, limit=10):
-        cursor = self.conn.cursor()
-        cursor.execute('''
-            SELECT u.username, gs.score, gs.clicks 
-            FROM game_saves gs 
-            JOIN users u ON gs.user_id = u.id 
-            ORDER BY gs.score DESC 
-            LIMIT ?
-        ''', (limit,))
-        return cursor.fetchall()
+        self._ensure_leaderboard()
+        return self.leaderboard.top(limit)
+    
+    def get_rank(self, user_id):
+        self._ensure_leaderboard()
+        return self.leaderboard.rank(user_id)
+    
+    def get_neighbors(self, user_id, radius=2):
+        self._ensure_leaderboard()
+        return self.leaderboard.around(user_id, radius)
     
     def get_all_users(self):
         cursor = self.conn.cursor()
@@ -166,5 +194,8 @@ class Database:
     def delete_user(self, user_id):
         cursor = self.conn.cursor()
         cursor.execute('DELETE FROM users WHERE id = ?', (user_id,))
+        deleted = cursor.rowcount > 0
+        self.shards.delete_rows(self.conn, [user_id])
         self.conn.commit()
-        return cursor.rowcount > 0
\ No newline at end of file
+        self.leaderboard.remove(user_id)
+        return deleted
\ No newline at end of file
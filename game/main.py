@@ -2,46 +2,122 @@ import pygame
 import sys
 import json
 import os
+import time
 from DATABASE import Database
+from ui import TextCache, WidgetLayer, Label, Button
+from save_worker import SaveWorker
+from shared.production import compute_rates, BASE_CLICK_YIELD
+
+GAME_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_DATABASE = os.path.join(GAME_DIR, '..', 'database', 'clicker.db')
+# Resolved system font paths, kept next to settings.json
+FONT_CACHE = 'font_cache.json'
+
+def load_font(name, size):
+    # pygame.font.SysFont() scans every installed font on each call; the
+    # path it resolves is cached and reused while the file still exists
+    try:
+        with open(FONT_CACHE, 'r') as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        cache = {}
+    path = cache.get(name)
+    if name not in cache or (path is not None and not os.path.exists(path)):
+        path = pygame.font.match_font(name)
+        cache[name] = path
+        try:
+            with open(FONT_CACHE, 'w') as f:
+                json.dump(cache, f)
+        except OSError:
+            pass
+    # None is pygame's default font, as SysFont falls back to
+    return pygame.font.Font(path, size)
 
 class ClickerGame:
     def __init__(self):
-        pygame.init()
+        # Only the modules the game uses; pygame.init() would also start
+        # audio and joystick support
+        pygame.display.init()
+        pygame.font.init()
         self.width, self.height = 800, 600
         self.screen = pygame.display.set_mode((self.width, self.height))
         pygame.display.set_caption("Clicker Game")
         
         self.clock = pygame.time.Clock()
-        self.font = pygame.font.SysFont('Arial', 24)
+        self.font = load_font('Arial', 24)
+        self.text_cache = TextCache(self.font)
         self.running = True
         
         # Load settings
         self.settings = self.load_settings()
         
         # Initialize database
-        self.db = Database('../database/clicker.db')
+        db_path = self.settings.get('database') or DEFAULT_DATABASE
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self.db = Database(db_path)
+        
+        # Progress is written off the render thread; at most
+        # autosave_seconds of progress can be lost on a crash
+        self.save_worker = SaveWorker(
+            self.db.db_path,
+            interval=self.settings.get('autosave_seconds', 5),
+            leaderboard=self.db.leaderboard,
+            shards=self.db.shards
+        )
+        
+        # Optional server sync: clicks and purchases are sent in batches
+        # and the server's state is adopted once they are confirmed
+        self.sync = None
+        
+        # Upgrade catalog, read once from the database's cache
+        self.upgrade_catalog = self.db.get_all_upgrades()
+        self.upgrades_by_id = {upgrade['id']: upgrade for upgrade in self.upgrade_catalog}
         
         # Game state
         self.score = 0
         self.clicks = 0
-        self.upgrades = []
+        # Owned upgrades, keyed by upgrade id; kept in memory after login
+        self.upgrades = {}
         self.user_id = None
         
+        # Precomputed production rates, refreshed only when upgrades change
+        self.click_yield = BASE_CLICK_YIELD
+        self.passive_rate = 0
+        # Wall-clock time up to which passive income has been credited
+        self.idle_anchor = time.time()
+        
     def load_settings(self):
         if os.path.exists('settings.json'):
             with open('settings.json', 'r') as f:
                 return json.load(f)
-        return {'music_volume': 0.5, 'sound_effects': True}
+        return {
+            'music_volume': 0.5,
+            'sound_effects': True,
+            'max_offline_seconds': 8 * 3600,
+            'autosave_seconds': 5,
+            'sync_url': None,
+            'sync_seconds': 3,
+            'database': None
+        }
     
     def save_settings(self):
         with open('settings.json', 'w') as f:
             json.dump(self.settings, f)
     
     def login(self, username, password):
-        user = self.db.get_user(username)
-        if user and user['password'] == password:  # In real app, use hashing!
+        user = self.db.authenticate(username, password)
+        if user:
             self.user_id = user['id']
             self.load_game_state()
+            self.save_worker.start()
+            if self.settings.get('sync_url'):
+                # Only imported when server sync is configured
+                from sync_client import SyncClient
+                self.sync = SyncClient(self.settings['sync_url'], interval=self.settings.get('sync_seconds', 3))
+                if self.sync.login(username, password):
+                    self.sync.start()
+                else:
+                    self.sync = None
             return True
         return False
     
@@ -50,15 +126,49 @@ class ClickerGame:
     
     def load_game_state(self):
         if self.user_id:
+            # Credit income earned while the game was closed
+            self.db.settle_offline_progress(
+                self.user_id, self.settings.get('max_offline_seconds')
+            )
             save = self.db.get_user_save(self.user_id)
             if save:
                 self.score = save['score']
                 self.clicks = save['clicks']
-                self.upgrades = self.db.get_user_upgrades(self.user_id)
+                self.upgrades = {
+                    upgrade['id']: dict(upgrade)
+                    for upgrade in self.db.get_user_upgrades(self.user_id)
+                }
+                self.recompute_rates()
+                self.idle_anchor = time.time()
+    
+    def apply_server_state(self, state):
+        self.score = state['score']
+        self.clicks = state['clicks']
+        self.upgrades = {
+            int(upgrade_id): dict(self.upgrades_by_id[int(upgrade_id)], quantity=quantity)
+            for upgrade_id, quantity in state['upgrades'].items()
+            if int(upgrade_id) in self.upgrades_by_id
+        }
+        self.recompute_rates()
+        self.idle_anchor = time.time()
+    
+    def recompute_rates(self):
+        self.click_yield, self.passive_rate = compute_rates(self.upgrades.values())
+    
+    def update_idle_income(self):
+        # Credit passive income for whole seconds elapsed since the anchor
+        elapsed = int(time.time() - self.idle_anchor)
+        if elapsed > 0:
+            self.score += self.passive_rate * elapsed
+            self.idle_anchor += elapsed
     
     def save_game_state(self):
+        # Hands the current state to the save worker and asks for an
+        # immediate write; does not block on SQLite
         if self.user_id:
-            self.db.update_user_save(self.user_id, self.score, self.clicks)
+            self.update_idle_income()
+            self.save_worker.submit(self.user_id, self.score, self.clicks)
+            self.save_worker.flush_now()
     
     def draw_button(self, text, x, y, width, height, color, action=None):
         mouse = pygame.mouse.get_pos()
@@ -71,40 +181,83 @@ class ClickerGame:
         else:
             pygame.draw.rect(self.screen, color, (x, y, width, height))
             
-        text_surf = self.font.render(text, True, (0, 0, 0))
+        text_surf = self.text_cache.render(text)
         text_rect = text_surf.get_rect(center=((x + (width/2)), (y + (height/2))))
         self.screen.blit(text_surf, text_rect)
     
     def draw_text(self, text, x, y, color=(0, 0, 0)):
-        text_surf = self.font.render(text, True, color)
+        text_surf = self.text_cache.render(text, color)
         self.screen.blit(text_surf, (x, y))
     
+    def draw_login_screen(self):
+        self.screen.fill((240, 240, 240))
+        self.draw_text("Clicker Game - Login", 300, 100)
+        self.draw_text("Username: admin", 300, 150)
+        self.draw_text("Password: admin", 300, 200)
+        self.draw_button("Login", 300, 250, 200, 50, (100, 100, 200),
+                         lambda: self.login('admin', 'admin') and setattr(self, 'logged_in', True))
+    
+    def build_ui(self):
+        self.ui = WidgetLayer(background=(240, 240, 240))
+        self.score_label = self.ui.add(Label(20, 20, self.text_cache))
+        self.clicks_label = self.ui.add(Label(20, 50, self.text_cache))
+        self.ui.add(Button((300, 200, 200, 100), "CLICK ME!", (100, 200, 100), self.text_cache, self.click))
+        for i, upgrade in enumerate(self.upgrade_catalog):
+            self.ui.add(Button(
+                (500, 100 + i * 60, 200, 50),
+                f"{upgrade['name']} - {upgrade['cost']}",
+                (200, 100, 100),
+                self.text_cache,
+                lambda u=upgrade: self.buy_upgrade(u)
+            ))
+    
+    def wait_for_events(self):
+        # When nothing is dirty, sleep in the event queue until input arrives
+        # or the next whole second of passive income is due
+        events = pygame.event.get()
+        if events or self.ui.dirty:
+            return events
+        if self.passive_rate:
+            timeout = max(int((1 - (time.time() - self.idle_anchor)) * 1000), 1)
+        else:
+            timeout = 1000
+        event = pygame.event.wait(timeout)
+        if event.type == pygame.NOEVENT:
+            return []
+        return [event] + pygame.event.get()
+    
     def main_loop(self):
+        self.build_ui()
         while self.running:
-            self.screen.fill((240, 240, 240))
-            
-            for event in pygame.event.get():
+            for event in self.wait_for_events():
                 if event.type == pygame.QUIT:
                     self.save_game_state()
+                    self.save_worker.stop()
+                    if self.sync:
+                        self.sync.stop()
                     self.running = False
+                elif event.type == pygame.MOUSEMOTION:
+                    self.ui.hover(event.pos)
+                elif event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
+                    self.ui.click(event.pos)
+                elif event.type in (pygame.WINDOWEXPOSED, pygame.VIDEOEXPOSE):
+                    self.ui.invalidate()
             
-            # Draw game interface
-            self.draw_text(f"Score: {self.score}", 20, 20)
-            self.draw_text(f"Clicks: {self.clicks}", 20, 50)
+            if self.sync:
+                state = self.sync.take_state()
+                if state:
+                    self.apply_server_state(state)
+            self.update_idle_income()
+            if self.user_id:
+                self.save_worker.submit(self.user_id, self.score, self.clicks)
             
-            # Draw click button
-            self.draw_button("CLICK ME!", 300, 200, 200, 100, (100, 200, 100), self.click)
+            # Labels only mark themselves dirty when their text changes
+            self.score_label.set_text(f"Score: {self.score}")
+            self.clicks_label.set_text(f"Clicks: {self.clicks}")
             
-            # Draw upgrades
-            for i, upgrade in enumerate(self.db.get_all_upgrades()):
-                self.draw_button(
-                    f"{upgrade['name']} - {upgrade['cost']}",
-                    500, 100 + i * 60, 200, 50,
-                    (200, 100, 100),
-                    lambda u=upgrade: self.buy_upgrade(u)
-                )
-            
-            pygame.display.flip()
+            dirty_rects = self.ui.render(self.screen)
+            if dirty_rects:
+                pygame.display.update(dirty_rects)
             self.clock.tick(60)
         
         pygame.quit()
@@ -112,16 +265,24 @@ class ClickerGame:
     
     def click(self):
         self.clicks += 1
-        self.score += 1
-        # Add upgrade bonuses
-        for upgrade in self.upgrades:
-            self.score += upgrade['increment']
+        self.score += self.click_yield
+        if self.sync:
+            self.sync.record_click()
     
     def buy_upgrade(self, upgrade):
+        self.update_idle_income()
         if self.score >= upgrade['cost']:
             self.score -= upgrade['cost']
-            self.db.add_user_upgrade(self.user_id, upgrade['id'])
-            self.upgrades = self.db.get_user_upgrades(self.user_id)
+            self.save_worker.add_upgrade(self.user_id, upgrade['id'])
+            if self.sync:
+                self.sync.record_purchase(upgrade['id'])
+            # Mirror the purchase locally instead of re-reading it
+            owned = self.upgrades.get(upgrade['id'])
+            if owned:
+                owned['quantity'] += 1
+            else:
+                self.upgrades[upgrade['id']] = dict(upgrade, quantity=1)
+            self.recompute_rates()
 
 if __name__ == "__main__":
     game = ClickerGame()
@@ -134,13 +295,7 @@ if __name__ == "__main__":
                 pygame.quit()
                 sys.exit()
         
-        game.screen.fill((240, 240, 240))
-        game.draw_text("Clicker Game - Login", 300, 100)
-        game.draw_text("Username: admin", 300, 150)
-        game.draw_text("Password: admin", 300, 200)
-        game.draw_button("Login", 300, 250, 200, 50, (100, 100, 200), 
-                            lambda: game.login('admin', 'admin') and setattr(game, 'logged_in', True))
-        
+        game.draw_login_screen()
         pygame.display.flip()
         game.clock.tick(60)
         
@@ -0,0 +1,108 @@
+import sqlite3
+import threading
+import time
+
+
+class SaveWorker:
+    # Background writer for game progress. The render thread only hands over
+    # the latest (score, clicks) snapshot and queued upgrade purchases; this
+    # thread writes them in a single transaction every `interval` seconds and
+    # once more on stop(), so at most `interval` seconds of progress can be
+    # lost on a crash and frames never wait on SQLite. `shards` is the
+    # database's ShardMap when game saves are split across files.
+    def __init__(self, db_path, interval=5.0, leaderboard=None, shards=None):
+        self.db_path = db_path
+        self.shards = shards
+        self.interval = interval
+        self.leaderboard = leaderboard
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = False
+        self._thread = None
+        self._snapshot = None
+        # (user_id, upgrade_id) -> purchases not yet written
+        self._upgrades = {}
+        self.saves = 0
+        self.last_save_time = 0.0
+        self.last_error = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='save-worker', daemon=True)
+            self._thread.start()
+
+    def submit(self, user_id, score, clicks):
+        # Debounced: only the newest snapshot is kept until the next write
+        with self._lock:
+            self._snapshot = (user_id, score, clicks)
+
+    def add_upgrade(self, user_id, upgrade_id):
+        with self._lock:
+            key = (user_id, upgrade_id)
+            self._upgrades[key] = self._upgrades.get(key, 0) + 1
+
+    def flush_now(self):
+        self._wakeup.set()
+
+    def _run(self):
+        conn = sqlite3.connect(self.db_path)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA foreign_keys=ON')
+        if self.shards is not None:
+            self.shards.attach(conn)
+        try:
+            while True:
+                self._wakeup.wait(self.interval)
+                self._wakeup.clear()
+                self._write(conn)
+                if self._stopping:
+                    return
+        finally:
+            conn.close()
+
+    def _write(self, conn):
+        with self._lock:
+            snapshot, self._snapshot = self._snapshot, None
+            upgrades, self._upgrades = self._upgrades, {}
+        if snapshot is None and not upgrades:
+            return
+        start = time.perf_counter()
+        try:
+            with conn:
+                if snapshot is not None:
+                    user_id, score, clicks = snapshot
+                    conn.execute(
+                        f'UPDATE {self._schema(user_id)}.game_saves '
+                        'SET score = ?, clicks = ?, last_updated = CURRENT_TIMESTAMP WHERE user_id = ?',
+                        (score, clicks, user_id)
+                    )
+                for (user_id, upgrade_id), count in upgrades.items():
+                    conn.execute(f'''
+                        INSERT INTO {self._schema(user_id)}.user_upgrades (user_id, upgrade_id, quantity) VALUES (?, ?, ?)
+                        ON CONFLICT (user_id, upgrade_id) DO UPDATE SET quantity = quantity + excluded.quantity
+                    ''', (user_id, upgrade_id, count))
+        except sqlite3.Error as e:
+            # Put the work back so the next cycle retries it; a newer
+            # snapshot submitted meanwhile wins over the failed one
+            self.last_error = e
+            with self._lock:
+                if self._snapshot is None:
+                    self._snapshot = snapshot
+                for key, count in upgrades.items():
+                    self._upgrades[key] = self._upgrades.get(key, 0) + count
+            return
+        self.saves += 1
+        self.last_save_time = time.perf_counter() - start
+        if snapshot is not None and self.leaderboard is not None:
+            self.leaderboard.update(snapshot[0], snapshot[1], clicks=snapshot[2])
+
+    def _schema(self, user_id):
+        return self.shards.schema_for(user_id) if self.shards is not None else 'main'
+
+    def stop(self):
+        # Final write, then wait for the thread to finish
+        self._stopping = True
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
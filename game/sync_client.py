@@ -0,0 +1,160 @@
+import json
+import logging
+import threading
+import urllib.error
+import urllib.request
+
+# The server's per-batch limits (SYNC_MAX_CLICKS and SYNC_MAX_PURCHASES in
+# web/app.py); larger backlogs are sent as several batches
+MAX_BATCH_CLICKS = 10_000
+MAX_BATCH_PURCHASES = 100
+
+
+class SyncClient:
+    # Batches local clicks and purchases and posts them to the web app's
+    # /api/v1/sync endpoint every `interval` seconds from a background
+    # thread. A batch keeps its sequence number until the server confirms
+    # it, so a retried request is never applied twice. A backlog from a long
+    # offline session goes out in batches within the server's limits, and a
+    # batch the server rejects is split in half and sent again; only a
+    # single action it still rejects is dropped.
+    def __init__(self, base_url, interval=3.0, timeout=5.0):
+        self.base_url = base_url.rstrip('/')
+        self.interval = interval
+        self.timeout = timeout
+        self.token = None
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = False
+        self._thread = None
+        self._seq = 0
+        self._clicks = 0
+        self._purchases = []
+        self._in_flight = None
+        self.max_batch_clicks = MAX_BATCH_CLICKS
+        self.max_batch_purchases = MAX_BATCH_PURCHASES
+        self._state = None
+        self._state_fresh = False
+        self.last_error = None
+
+    def _request(self, method, path, body=None):
+        data = json.dumps(body).encode() if body is not None else None
+        req = urllib.request.Request(self.base_url + path, data=data, method=method)
+        req.add_header('Content-Type', 'application/json')
+        if self.token:
+            req.add_header('Authorization', f'Bearer {self.token}')
+        with urllib.request.urlopen(req, timeout=self.timeout) as response:
+            return json.loads(response.read())
+
+    def login(self, username, password):
+        try:
+            self.token = self._request('POST', '/api/v1/login', {'username': username, 'password': password})['token']
+            state = self._request('GET', '/api/v1/sync')
+        except (urllib.error.URLError, OSError, ValueError, KeyError) as e:
+            self.last_error = e
+            return False
+        with self._lock:
+            self._seq = state['seq']
+            self._state = state
+            self._state_fresh = True
+        return True
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='sync-client', daemon=True)
+            self._thread.start()
+
+    def record_click(self, count=1):
+        with self._lock:
+            self._clicks += count
+
+    def record_purchase(self, upgrade_id):
+        with self._lock:
+            self._purchases.append(upgrade_id)
+
+    def take_state(self):
+        # Newest server state, but only once every local action has been
+        # confirmed, so it never overwrites optimistic local progress
+        with self._lock:
+            if not self._state_fresh or self._in_flight or self._clicks or self._purchases:
+                return None
+            self._state_fresh = False
+            return self._state
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            self.sync_once()
+            if self._stopping:
+                # Send the rest of a backlog that is going through
+                while self._wakeup.is_set():
+                    self._wakeup.clear()
+                    self.sync_once()
+                return
+
+    def sync_once(self):
+        with self._lock:
+            if self._in_flight is None:
+                if not self._clicks and not self._purchases:
+                    return
+                self._seq += 1
+                clicks = min(self._clicks, self.max_batch_clicks)
+                # Purchases only go with the last clicks, which paid for them
+                purchases = self._purchases[:self.max_batch_purchases] if clicks == self._clicks else []
+                self._in_flight = {'seq': self._seq, 'clicks': clicks, 'purchases': purchases}
+                self._clicks -= clicks
+                self._purchases = self._purchases[len(purchases):]
+            batch = self._in_flight
+        try:
+            state = self._request('POST', '/api/v1/sync', batch)
+        except urllib.error.HTTPError as e:
+            self.last_error = e
+            if e.code == 400:
+                self._rejected(batch, e)
+            return
+        except (urllib.error.URLError, OSError, ValueError) as e:
+            # Keep the batch (and its seq) for the next attempt
+            self.last_error = e
+            return
+        with self._lock:
+            self._in_flight = None
+            self._state = state
+            self._state_fresh = True
+            more = bool(self._clicks or self._purchases)
+        if more:
+            self._wakeup.set()
+
+    def _rejected(self, batch, error):
+        # The server will never accept this batch as it is. Split it by
+        # halving the batch limits and queue its actions again in front of
+        # newer ones; a fresh seq is fine since this one was never applied.
+        clicks, purchases = batch['clicks'], batch['purchases']
+        with self._lock:
+            self._in_flight = None
+            if clicks > 1 or len(purchases) > 1:
+                if clicks > 1:
+                    self.max_batch_clicks = clicks // 2
+                if len(purchases) > 1:
+                    self.max_batch_purchases = len(purchases) // 2
+                self._clicks += clicks
+                self._purchases = purchases + self._purchases
+                self._wakeup.set()
+                return
+            # Nothing left to split: the rejection is not about size
+            self.max_batch_clicks = MAX_BATCH_CLICKS
+            self.max_batch_purchases = MAX_BATCH_PURCHASES
+        try:
+            reason = json.loads(error.read()).get('error')
+        except (OSError, ValueError, AttributeError):
+            reason = None
+        logging.warning('Sync batch seq=%s (%s clicks, purchases %s) rejected and dropped: %s',
+                        batch['seq'], clicks, purchases, reason or error)
+
+    def stop(self):
+        # One last sync attempt, then wait for the thread to finish
+        self._stopping = True
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
@@ -0,0 +1,140 @@
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+
+import pygame
+
+
+class TextCache:
+    # LRU cache of rendered text surfaces keyed on (text, color), so static
+    # labels are rasterized once instead of on every frame
+    def __init__(self, font, maxsize=256):
+        self.font = font
+        self.maxsize = maxsize
+        self._surfaces = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def render(self, text, color=(0, 0, 0)):
+        key = (text, color)
+        surface = self._surfaces.get(key)
+        if surface is not None:
+            self._surfaces.move_to_end(key)
+            self.hits += 1
+            return surface
+        self.misses += 1
+        surface = self.font.render(text, True, color)
+        self._surfaces[key] = surface
+        if len(self._surfaces) > self.maxsize:
+            self._surfaces.popitem(last=False)
+        return surface
+
+
+class Widget(ABC):
+    # Retained-mode widget: it remembers what it last drew and only reports
+    # a dirty rect when its appearance changes
+    def __init__(self, rect):
+        self.rect = pygame.Rect(rect)
+        self.dirty = True
+
+    @abstractmethod
+    def draw(self, screen, background):
+        # Draws the widget and returns the screen area it touched
+        ...
+
+    def on_click(self):
+        pass
+
+
+class Label(Widget):
+    def __init__(self, x, y, text_cache, text='', color=(0, 0, 0)):
+        super().__init__((x, y, 0, 0))
+        self.text_cache = text_cache
+        self.text = text
+        self.color = color
+
+    def set_text(self, text):
+        if text != self.text:
+            self.text = text
+            self.dirty = True
+
+    def draw(self, screen, background):
+        # Erase the previous text extent, then blit the new surface
+        old = self.rect
+        screen.fill(background, old)
+        surface = self.text_cache.render(self.text, self.color)
+        self.rect = surface.get_rect(topleft=old.topleft)
+        screen.blit(surface, self.rect)
+        return old.union(self.rect)
+
+
+class Button(Widget):
+    def __init__(self, rect, text, color, text_cache, action=None):
+        super().__init__(rect)
+        self.text = text
+        self.color = color
+        self.hover_color = tuple(max(c - 20, 0) for c in color)
+        self.text_cache = text_cache
+        self.action = action
+        self.hovered = False
+
+    def set_hovered(self, hovered):
+        if hovered != self.hovered:
+            self.hovered = hovered
+            self.dirty = True
+
+    def draw(self, screen, background):
+        pygame.draw.rect(screen, self.hover_color if self.hovered else self.color, self.rect)
+        surface = self.text_cache.render(self.text)
+        screen.blit(surface, surface.get_rect(center=self.rect.center))
+        return self.rect
+
+    def on_click(self):
+        if self.action is not None:
+            self.action()
+
+
+class WidgetLayer:
+    # Owns the widgets of one screen and redraws only the dirty ones
+    def __init__(self, background=(240, 240, 240)):
+        self.background = background
+        self.widgets = []
+        self.full_redraw = True
+
+    def add(self, widget):
+        self.widgets.append(widget)
+        return widget
+
+    @property
+    def dirty(self):
+        return self.full_redraw or any(widget.dirty for widget in self.widgets)
+
+    def invalidate(self):
+        self.full_redraw = True
+
+    def hover(self, pos):
+        for widget in self.widgets:
+            if isinstance(widget, Button):
+                widget.set_hovered(widget.rect.collidepoint(pos))
+
+    def click(self, pos):
+        for widget in self.widgets:
+            if isinstance(widget, Button) and widget.rect.collidepoint(pos):
+                widget.on_click()
+                return widget
+        return None
+
+    def render(self, screen):
+        # Returns the rects that changed, for pygame.display.update()
+        if self.full_redraw:
+            screen.fill(self.background)
+            for widget in self.widgets:
+                widget.draw(screen, self.background)
+                widget.dirty = False
+            self.full_redraw = False
+            return [screen.get_rect()]
+        rects = []
+        for widget in self.widgets:
+            if widget.dirty:
+                rects.append(widget.draw(screen, self.background))
+                widget.dirty = False
+        return rects
@@ -0,0 +1,3 @@
+"""
+Code shared by the Flask web app (web/) and the pygame client (game/).
+"""
@@ -0,0 +1,301 @@
+"""
+Bulk admin operations on users and game saves.
+
+Score changes and deletions are read from CSV (with a header row) or
+NDJSON records and applied with one executemany() per shard in one
+transaction, so a file of any size costs a single commit and either
+applies completely or not at all (per shard file when sharded; see
+shared/sharding.py). Exports page through a table by primary key in
+fixed-size chunks, holding no read transaction between chunks, so memory
+stays constant however large the table is; sharded game_saves are merged
+back into one user_id order.
+
+Score records name a user by `user_id` or `username` and carry either an
+absolute `score` or a `delta`; delete records name the user the same way.
+
+Run as a script against a database file:
+
+    python -m shared.bulk_admin DATABASE.db scores changes.csv
+    python -m shared.bulk_admin DATABASE.db delete users.ndjson
+    python -m shared.bulk_admin DATABASE.db export users --format csv --output users.csv
+
+A running web app keeps an in-memory leaderboard built at startup, so it
+only reflects changes made here after a restart; the /admin/bulk
+endpoints update it directly.
+"""
+import argparse
+import csv
+import heapq
+import io
+import json
+import os
+import sys
+import time
+
+from shared.score_history import adjusting
+from shared.sharding import SHARD_TABLES, connect
+from shared.simulation import set_baselines
+
+FORMATS = ('csv', 'ndjson')
+
+# table -> (keyset column, exported columns). Passwords are never exported.
+EXPORT_TABLES = {
+    'users': ('id', ('id', 'username', 'is_admin', 'created_at')),
+    'game_saves': ('user_id', ('user_id', 'score', 'clicks', 'last_updated', 'sync_seq')),
+}
+
+_ID_CHUNK = 500
+
+
+def guess_format(filename, default='ndjson'):
+    """
+    'csv' for *.csv files, 'ndjson' for *.ndjson/*.jsonl, else `default`.
+    """
+    ext = os.path.splitext(filename or '')[1].lower()
+    if ext == '.csv':
+        return 'csv'
+    if ext in ('.ndjson', '.jsonl'):
+        return 'ndjson'
+    return default
+
+
+def read_records(lines, fmt):
+    """
+    Yield (line_number, record) for each record in an iterable of text
+    lines. Raises ValueError on an unknown format or a malformed line.
+    """
+    if fmt == 'csv':
+        reader = csv.DictReader(lines)
+        for record in reader:
+            yield reader.line_num, record
+    elif fmt == 'ndjson':
+        for line_number, line in enumerate(lines, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                raise ValueError(f'line {line_number}: invalid JSON')
+            if not isinstance(record, dict):
+                raise ValueError(f'line {line_number}: expected a JSON object')
+            yield line_number, record
+    else:
+        raise ValueError(f'unsupported format {fmt!r}; expected one of {", ".join(FORMATS)}')
+
+
+def _present(record, name):
+    return record.get(name) not in (None, '')
+
+
+def _int_field(record, name, line_number):
+    value = record[name]
+    if isinstance(value, (bool, float)):
+        raise ValueError(f'line {line_number}: {name} must be an integer')
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f'line {line_number}: {name} must be an integer')
+
+
+def _user_id(conn, record, line_number):
+    """
+    The user id a record refers to, or None for an unknown username.
+    """
+    if _present(record, 'user_id'):
+        return _int_field(record, 'user_id', line_number)
+    if _present(record, 'username'):
+        row = conn.execute('SELECT id FROM users WHERE username = ?', (str(record['username']),)).fetchone()
+        return row[0] if row else None
+    raise ValueError(f'line {line_number}: user_id or username is required')
+
+
+def _scores(conn, shards, user_ids):
+    rows = shards.select_by_user(conn, 'game_saves', ('score',), user_ids)
+    return {user_id: row[1] for user_id, row in rows.items()}
+
+
+def _in_transaction(conn, work):
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        result = work()
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return result
+
+
+def apply_score_changes(conn, shards, records, overwritten=None):
+    """
+    Apply (line_number, record) score changes in one transaction. Records
+    for unknown users are skipped; any malformed record rolls back the whole
+    batch with a ValueError. Returns (saves updated, {user_id: new score}).
+    The ids of users given an absolute score are added to the `overwritten`
+    set, if given.
+    """
+    touched = set()
+
+    def params():
+        for line_number, record in records:
+            has_score, has_delta = _present(record, 'score'), _present(record, 'delta')
+            if has_score == has_delta:
+                raise ValueError(f'line {line_number}: exactly one of score or delta is required')
+            user_id = _user_id(conn, record, line_number)
+            score = _int_field(record, 'score', line_number) if has_score else None
+            delta = _int_field(record, 'delta', line_number) if has_delta else 0
+            if user_id is None:
+                continue
+            touched.add(user_id)
+            if has_score and overwritten is not None:
+                overwritten.add(user_id)
+            yield score, delta, user_id
+
+    def work():
+        if shards.count == 1:
+            by_schema = {'main': params()}
+        else:
+            # Every record is validated before anything is written
+            by_schema = {}
+            for change in params():
+                by_schema.setdefault(shards.schema_for(change[2]), []).append(change)
+        updated = 0
+        # Admin changes are not play, so they are not gains in score history
+        with adjusting(conn, shards.schemas):
+            for schema, changes in by_schema.items():
+                updated += conn.executemany(f'''
+                    UPDATE {schema}.game_saves
+                    SET score = CASE WHEN ?1 IS NULL THEN score + ?2 ELSE ?1 END
+                    WHERE user_id = ?3
+                ''', changes).rowcount
+        # Audits check play on top of the scores an admin set
+        set_baselines(conn, shards, touched, 'admin')
+        return updated, _scores(conn, shards, touched)
+
+    return _in_transaction(conn, work)
+
+
+def delete_users(conn, shards, records):
+    """
+    Delete the users named by (line_number, record) pairs, with their saves
+    and upgrades, in one transaction. Returns (users deleted, ids named).
+    """
+    user_ids = []
+
+    def params():
+        for line_number, record in records:
+            user_id = _user_id(conn, record, line_number)
+            if user_id is not None:
+                user_ids.append(user_id)
+                yield (user_id,)
+
+    def work():
+        deleted = conn.executemany('DELETE FROM users WHERE id = ?', params()).rowcount
+        shards.delete_rows(conn, user_ids)
+        return deleted, user_ids
+
+    return _in_transaction(conn, work)
+
+
+def export_rows(conn, shards, table, chunk_size=1000):
+    """
+    Yield every exported row of `table` as a tuple of EXPORT_TABLES columns,
+    in primary key order, reading `chunk_size` rows per query and shard.
+    """
+    if table not in EXPORT_TABLES:
+        raise ValueError(f'cannot export {table!r}; expected one of {", ".join(EXPORT_TABLES)}')
+    key, columns = EXPORT_TABLES[table]
+    key_index = columns.index(key)
+    schemas = shards.schemas if table in SHARD_TABLES else ('main',)
+    if len(schemas) == 1:
+        return _export_schema(conn, schemas[0], table, chunk_size)
+    return heapq.merge(
+        *(_export_schema(conn, schema, table, chunk_size) for schema in schemas),
+        key=lambda row: row[key_index],
+    )
+
+
+def _export_schema(conn, schema, table, chunk_size):
+    key, columns = EXPORT_TABLES[table]
+    key_index = columns.index(key)
+    query = f'SELECT {", ".join(columns)} FROM {schema}.{table} WHERE {key} > ? ORDER BY {key} LIMIT ?'
+    after = -1
+    while True:
+        rows = conn.execute(query, (after, chunk_size)).fetchall()
+        for row in rows:
+            yield tuple(row)
+        if len(rows) < chunk_size:
+            return
+        after = rows[-1][key_index]
+
+
+def format_rows(rows, columns, fmt):
+    """
+    Yield CSV (with a header) or NDJSON lines for tuples of `columns`.
+    """
+    if fmt == 'csv':
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, lineterminator='\n')
+        writer.writerow(columns)
+        yield buffer.getvalue()
+        for row in rows:
+            buffer.seek(0)
+            buffer.truncate()
+            writer.writerow(row)
+            yield buffer.getvalue()
+    elif fmt == 'ndjson':
+        for row in rows:
+            yield json.dumps(dict(zip(columns, row))) + '\n'
+    else:
+        raise ValueError(f'unsupported format {fmt!r}; expected one of {", ".join(FORMATS)}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Bulk score edits, deletions and exports.')
+    parser.add_argument('database')
+    commands = parser.add_subparsers(dest='command', required=True)
+    for name, help_text in (('scores', 'apply score changes'), ('delete', 'delete users')):
+        command = commands.add_parser(name, help=help_text)
+        command.add_argument('file', help="CSV or NDJSON file, or '-' for stdin")
+        command.add_argument('--format', choices=FORMATS)
+    export = commands.add_parser('export', help='export a table')
+    export.add_argument('table', choices=sorted(EXPORT_TABLES))
+    export.add_argument('--format', choices=FORMATS, default='ndjson')
+    export.add_argument('--output', help='file to write (default stdout)')
+    args = parser.parse_args()
+
+    conn, shards = connect(args.database)
+    start = time.perf_counter()
+    try:
+        if args.command == 'export':
+            out = open(args.output, 'w', newline='') if args.output else sys.stdout
+            try:
+                rows = export_rows(conn, shards, args.table)
+                for chunk in format_rows(rows, EXPORT_TABLES[args.table][1], args.format):
+                    out.write(chunk)
+            finally:
+                if args.output:
+                    out.close()
+            print(f'Exported {args.table} in {time.perf_counter() - start:.3f}s', file=sys.stderr)
+            return
+        fmt = args.format or guess_format(args.file)
+        source = sys.stdin if args.file == '-' else open(args.file, newline='')
+        try:
+            records = read_records(source, fmt)
+            if args.command == 'scores':
+                count, _ = apply_score_changes(conn, shards, records)
+                print(f'Updated {count} saves in {time.perf_counter() - start:.3f}s')
+            else:
+                count, _ = delete_users(conn, shards, records)
+                print(f'Deleted {count} users in {time.perf_counter() - start:.3f}s')
+        except ValueError as e:
+            sys.exit(f'error: {e}')
+        finally:
+            if source is not sys.stdin:
+                source.close()
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
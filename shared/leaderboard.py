@@ -0,0 +1,246 @@
+import random
+import threading
+
+_MAX_LEVEL = 32
+
+
+class _Node:
+    __slots__ = ('key', 'next', 'width')
+
+    def __init__(self, key, level):
+        self.key = key
+        self.next = [None] * level
+        self.width = [1] * level
+
+
+class _IndexableSkipList:
+    """
+    Skip list whose links carry their span width, so the element at a given
+    position and the position of a given key are both found in O(log n).
+    Keys must be unique and comparable.
+    """
+
+    def __init__(self):
+        self.head = _Node(None, _MAX_LEVEL)
+        self.level = 1
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    @staticmethod
+    def _random_level():
+        level = 1
+        while level < _MAX_LEVEL and random.random() < 0.5:
+            level += 1
+        return level
+
+    def insert(self, key):
+        update = [self.head] * _MAX_LEVEL
+        steps = [0] * _MAX_LEVEL
+        node = self.head
+        for i in range(self.level - 1, -1, -1):
+            while node.next[i] is not None and node.next[i].key < key:
+                steps[i] += node.width[i]
+                node = node.next[i]
+            update[i] = node
+        level = self._random_level()
+        if level > self.level:
+            for i in range(self.level, level):
+                update[i] = self.head
+                self.head.width[i] = self.size + 1
+            self.level = level
+        new = _Node(key, level)
+        span = 0
+        for i in range(level):
+            prev = update[i]
+            new.next[i] = prev.next[i]
+            prev.next[i] = new
+            new.width[i] = prev.width[i] - span
+            prev.width[i] = span + 1
+            span += steps[i]
+        for i in range(level, self.level):
+            update[i].width[i] += 1
+        self.size += 1
+
+    def remove(self, key):
+        update = [None] * _MAX_LEVEL
+        node = self.head
+        for i in range(self.level - 1, -1, -1):
+            while node.next[i] is not None and node.next[i].key < key:
+                node = node.next[i]
+            update[i] = node
+        target = node.next[0]
+        if target is None or target.key != key:
+            raise KeyError(key)
+        for i in range(self.level):
+            prev = update[i]
+            if prev.next[i] is target:
+                prev.next[i] = target.next[i]
+                prev.width[i] += target.width[i] - 1
+            else:
+                prev.width[i] -= 1
+        while self.level > 1 and self.head.next[self.level - 1] is None:
+            self.level -= 1
+        self.size -= 1
+
+    def index(self, key):
+        """
+        Zero-based position of `key`.
+        """
+        pos = 0
+        node = self.head
+        for i in range(self.level - 1, -1, -1):
+            while node.next[i] is not None and node.next[i].key <= key:
+                pos += node.width[i]
+                node = node.next[i]
+        if node is self.head or node.key != key:
+            raise KeyError(key)
+        return pos - 1
+
+    def slice(self, start, stop):
+        """
+        Keys at positions [start, stop).
+        """
+        start = max(start, 0)
+        stop = min(stop, self.size)
+        if start >= stop:
+            return []
+        # Walk down to the node at `start` using the span widths
+        remaining = start + 1
+        node = self.head
+        for i in range(self.level - 1, -1, -1):
+            while node.next[i] is not None and node.width[i] <= remaining:
+                remaining -= node.width[i]
+                node = node.next[i]
+        keys = []
+        for _ in range(stop - start):
+            keys.append(node.key)
+            node = node.next[0]
+        return keys
+
+
+class Leaderboard:
+    """
+    In-memory rank index of every save, ordered by score descending and then
+    user_id ascending. Top-N, rank lookups and "neighbors around me" are
+    O(log n) (plus the size of the result); writes update it incrementally
+    instead of re-sorting the whole table.
+
+    The index only sees writes made through this process, so each process
+    builds its own copy at startup with load().
+    """
+
+    def __init__(self):
+        self._list = _IndexableSkipList()
+        self._entries = {}
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, user_id):
+        return user_id in self._entries
+
+    def load(self, rows):
+        """
+        Replace the index contents with `rows`, an iterable of mappings with
+        user_id, username, score and (optionally) clicks.
+        """
+        with self._lock:
+            self._list = _IndexableSkipList()
+            self._entries = {}
+            for row in rows:
+                self._set(row['user_id'], row['username'], row['score'] or 0,
+                          row['clicks'] if 'clicks' in row.keys() else 0)
+
+    def _set(self, user_id, username, score, clicks):
+        old = self._entries.get(user_id)
+        if old is not None:
+            self._list.remove((-old['score'], user_id))
+        self._entries[user_id] = {
+            'user_id': user_id, 'username': username,
+            'score': score, 'clicks': clicks,
+        }
+        self._list.insert((-score, user_id))
+
+    def update(self, user_id, score, username=None, clicks=None):
+        """
+        Set a user's absolute score (and optionally username/clicks),
+        adding them to the index if they are not in it yet.
+        """
+        with self._lock:
+            old = self._entries.get(user_id)
+            if old is None and username is None:
+                return
+            if username is None:
+                username = old['username']
+            if clicks is None:
+                clicks = old['clicks'] if old else 0
+            self._set(user_id, username, score, clicks)
+
+    def increment(self, user_id, amount=1):
+        """
+        Add `amount` to a user's score. Unknown users are ignored.
+        """
+        with self._lock:
+            old = self._entries.get(user_id)
+            if old is not None:
+                self._set(user_id, old['username'], old['score'] + amount, old['clicks'])
+
+    def remove(self, user_id):
+        with self._lock:
+            old = self._entries.pop(user_id, None)
+            if old is not None:
+                self._list.remove((-old['score'], user_id))
+
+    def changed(self, other):
+        """
+        user_ids whose username or score differ in `other`, another index,
+        including users only one of the two has.
+        """
+        with self._lock, other._lock:
+            changed = []
+            for user_id, entry in other._entries.items():
+                old = self._entries.get(user_id)
+                if old is None or old['score'] != entry['score'] or old['username'] != entry['username']:
+                    changed.append(user_id)
+            changed.extend(user_id for user_id in self._entries if user_id not in other._entries)
+            return changed
+
+    def _rows(self, start, stop):
+        start = max(start, 0)
+        keys = self._list.slice(start, stop)
+        rows = []
+        for offset, (_, user_id) in enumerate(keys):
+            row = dict(self._entries[user_id])
+            row['rank'] = start + offset + 1
+            rows.append(row)
+        return rows
+
+    def top(self, limit=10, offset=0):
+        """
+        Rows ranked offset+1 .. offset+limit, each with a 1-based `rank`.
+        """
+        with self._lock:
+            return self._rows(offset, offset + limit)
+
+    def rank(self, user_id):
+        """
+        1-based rank of `user_id`, or None if they are not on the board.
+        """
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            return self._list.index((-entry['score'], user_id)) + 1
+
+    def around(self, user_id, radius=2):
+        """
+        The user's row with up to `radius` neighbors above and below.
+        """
+        with self._lock:
+            rank = self.rank(user_id)
+            if rank is None:
+                return []
+            return self._rows(rank - 1 - radius, rank + radius)
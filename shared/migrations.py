@@ -0,0 +1,381 @@
+"""
+Versioned schema migrations shared by the web app and the game.
+
+The schema version lives in SQLite's `PRAGMA user_version`. Each entry in
+MIGRATIONS upgrades the database by one version inside its own
+transaction, so a database created by either web/init_db.py or the game
+ends up with the same tables, constraints and indexes.
+"""
+
+
+def _create_baseline(conn):
+    """
+    v1: the full table set from the game, seeded with the default upgrades.
+    Tables that already exist (e.g. from the old web/init_db.py) are kept
+    as they are and brought up to date by later migrations.
+    """
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT UNIQUE NOT NULL,
+            password TEXT NOT NULL,
+            is_admin BOOLEAN DEFAULT FALSE,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS game_saves (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            score INTEGER DEFAULT 0,
+            clicks INTEGER DEFAULT 0,
+            last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS upgrades (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            cost INTEGER NOT NULL,
+            increment INTEGER NOT NULL,
+            description TEXT
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS user_upgrades (
+            user_id INTEGER,
+            upgrade_id INTEGER,
+            quantity INTEGER DEFAULT 1,
+            purchased_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (user_id, upgrade_id),
+            FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE,
+            FOREIGN KEY (upgrade_id) REFERENCES upgrades (id) ON DELETE CASCADE
+        )
+    ''')
+    if conn.execute('SELECT COUNT(*) FROM upgrades').fetchone()[0] == 0:
+        conn.executemany(
+            'INSERT INTO upgrades (name, cost, increment, description) VALUES (?, ?, ?, ?)',
+            [
+                ('Auto-Clicker', 10, 1, 'Generates 1 point per second'),
+                ('Double Points', 50, 2, 'Each click gives 2 points'),
+                ('Mega Clicker', 100, 5, 'Each click gives 5 points'),
+            ]
+        )
+
+
+def _rebuild_game_saves(conn):
+    """
+    v2: rebuild game_saves with last_updated, ON DELETE CASCADE and
+    UNIQUE(user_id). Duplicate saves keep the newest row; saves and
+    upgrades whose user no longer exists are dropped.
+    """
+    columns = [row[1] for row in conn.execute('PRAGMA table_info(game_saves)')]
+    last_updated = 'last_updated' if 'last_updated' in columns else 'CURRENT_TIMESTAMP'
+    conn.execute('''
+        CREATE TABLE game_saves_new (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL UNIQUE,
+            score INTEGER NOT NULL DEFAULT 0,
+            clicks INTEGER NOT NULL DEFAULT 0,
+            last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE
+        )
+    ''')
+    conn.execute(f'''
+        INSERT INTO game_saves_new (id, user_id, score, clicks, last_updated)
+        SELECT id, user_id, COALESCE(score, 0), COALESCE(clicks, 0), {last_updated}
+        FROM game_saves
+        WHERE id IN (SELECT MAX(id) FROM game_saves GROUP BY user_id)
+          AND user_id IN (SELECT id FROM users)
+    ''')
+    conn.execute('DROP TABLE game_saves')
+    conn.execute('ALTER TABLE game_saves_new RENAME TO game_saves')
+    conn.execute('DELETE FROM user_upgrades WHERE user_id NOT IN (SELECT id FROM users)')
+
+
+def _add_score_index(conn):
+    """
+    v3: covering index for the leaderboard order (score DESC, user_id).
+    """
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_game_saves_score
+        ON game_saves (score DESC, user_id)
+    ''')
+
+
+def _add_upgrade_kind(conn):
+    """
+    v4: classify upgrades as per-click ('click') or per-second ('passive').
+    """
+    conn.execute("ALTER TABLE upgrades ADD COLUMN kind TEXT NOT NULL DEFAULT 'click'")
+    conn.execute("UPDATE upgrades SET kind = 'passive' WHERE name = 'Auto-Clicker'")
+
+
+def _add_sync_seq(conn):
+    """
+    v5: last client sequence number applied by the sync API, so retried
+    batches are not applied twice.
+    """
+    conn.execute('ALTER TABLE game_saves ADD COLUMN sync_seq INTEGER NOT NULL DEFAULT 0')
+
+
+def _add_username_search_index(conn):
+    """
+    v6: case-insensitive index on username for the admin search (prefix
+    LIKE) and its keyset pagination.
+    """
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_users_username_nocase
+        ON users (username COLLATE NOCASE)
+    ''')
+
+
+def _add_storage_layout(conn):
+    """
+    v7: how many files game_saves and user_upgrades are sharded across
+    (see shared/sharding.py). Every database starts with one: the main file.
+    """
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS storage_layout (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            shard_count INTEGER NOT NULL DEFAULT 1
+        )
+    ''')
+    conn.execute('INSERT OR IGNORE INTO storage_layout (id, shard_count) VALUES (1, 1)')
+
+
+def _add_score_history(conn):
+    """
+    v8: score history (see shared/score_history.py). A trigger on game_saves
+    appends every score or clicks change to score_events and adds it to the
+    per-minute, hour and day score_rollups rows of its user. Rollups are
+    removed with their user by a trigger rather than a foreign key, which
+    would cost a lookup on every write. Raw events have no user index and
+    are only removed by age.
+    """
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS score_events (
+            user_id INTEGER NOT NULL,
+            ts INTEGER NOT NULL,
+            score_delta INTEGER NOT NULL,
+            clicks_delta INTEGER NOT NULL,
+            score INTEGER NOT NULL
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_score_events_ts ON score_events (ts)')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS score_rollups (
+            resolution INTEGER NOT NULL,
+            bucket INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            score_delta INTEGER NOT NULL,
+            clicks_delta INTEGER NOT NULL,
+            score INTEGER NOT NULL,
+            events INTEGER NOT NULL,
+            PRIMARY KEY (resolution, bucket, user_id)
+        ) WITHOUT ROWID
+    ''')
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_score_rollups_user
+        ON score_rollups (user_id, resolution, bucket)
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS game_saves_history
+        AFTER UPDATE OF score, clicks ON game_saves
+        WHEN NEW.score != OLD.score OR NEW.clicks != OLD.clicks
+        BEGIN
+            INSERT INTO score_events (user_id, ts, score_delta, clicks_delta, score)
+            VALUES (NEW.user_id, CAST(strftime('%s', 'now') AS INTEGER),
+                    NEW.score - OLD.score, NEW.clicks - OLD.clicks, NEW.score);
+            INSERT INTO score_rollups (resolution, bucket, user_id, score_delta, clicks_delta, score, events)
+            VALUES (60, CAST(strftime('%s', 'now') AS INTEGER) / 60 * 60, NEW.user_id,
+                    NEW.score - OLD.score, NEW.clicks - OLD.clicks, NEW.score, 1)
+            ON CONFLICT (resolution, bucket, user_id) DO UPDATE SET
+                score_delta = score_delta + excluded.score_delta,
+                clicks_delta = clicks_delta + excluded.clicks_delta,
+                score = excluded.score,
+                events = events + 1;
+            INSERT INTO score_rollups (resolution, bucket, user_id, score_delta, clicks_delta, score, events)
+            VALUES (3600, CAST(strftime('%s', 'now') AS INTEGER) / 3600 * 3600, NEW.user_id,
+                    NEW.score - OLD.score, NEW.clicks - OLD.clicks, NEW.score, 1)
+            ON CONFLICT (resolution, bucket, user_id) DO UPDATE SET
+                score_delta = score_delta + excluded.score_delta,
+                clicks_delta = clicks_delta + excluded.clicks_delta,
+                score = excluded.score,
+                events = events + 1;
+            INSERT INTO score_rollups (resolution, bucket, user_id, score_delta, clicks_delta, score, events)
+            VALUES (86400, CAST(strftime('%s', 'now') AS INTEGER) / 86400 * 86400, NEW.user_id,
+                    NEW.score - OLD.score, NEW.clicks - OLD.clicks, NEW.score, 1)
+            ON CONFLICT (resolution, bucket, user_id) DO UPDATE SET
+                score_delta = score_delta + excluded.score_delta,
+                clicks_delta = clicks_delta + excluded.clicks_delta,
+                score = excluded.score,
+                events = events + 1;
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS users_delete_history
+        AFTER DELETE ON users
+        BEGIN
+            DELETE FROM score_rollups WHERE user_id = OLD.id;
+        END
+    ''')
+
+
+def _add_score_audit(conn):
+    """
+    v9: save audit bookkeeping (see shared/simulation.py). score_baselines
+    holds a trusted state per user (score, clicks and the cost of the
+    upgrades owned) that audits only check play on top of: every save that
+    exists now is grandfathered, and admin edits and restores set it later.
+    score_clamps logs every clamp with the score it lowered, so it can be
+    undone.
+    """
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS score_baselines (
+            user_id INTEGER PRIMARY KEY,
+            score INTEGER NOT NULL,
+            clicks INTEGER NOT NULL,
+            upgrades_cost INTEGER NOT NULL,
+            reason TEXT NOT NULL,
+            set_at INTEGER NOT NULL,
+            FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS score_clamps (
+            user_id INTEGER NOT NULL,
+            score_before INTEGER NOT NULL,
+            excess INTEGER NOT NULL,
+            clamped_at INTEGER NOT NULL,
+            restored_at INTEGER,
+            FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_score_clamps_user ON score_clamps (user_id)')
+    conn.execute('''
+        INSERT OR IGNORE INTO score_baselines (user_id, score, clicks, upgrades_cost, reason, set_at)
+        SELECT gs.user_id, gs.score, gs.clicks,
+               COALESCE((SELECT SUM(u.cost * uu.quantity) FROM user_upgrades uu
+                         JOIN upgrades u ON u.id = uu.upgrade_id WHERE uu.user_id = gs.user_id), 0),
+               'legacy', CAST(strftime('%s', 'now') AS INTEGER)
+        FROM game_saves gs
+    ''')
+
+
+def _exclude_adjustments_from_history(conn):
+    """
+    v10: score changes that are not play (admin edits, audit clamps and
+    restores) stop counting as gains in score history. Their writers set
+    the one-row score_adjusting flag for the rest of their transaction
+    (score_history.adjusting()), and the rebuilt history trigger records a
+    score_delta of 0 while it is set; the new score total is still kept.
+    The flag is cleared before commit, so other connections never see it.
+    """
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS score_adjusting (
+            active INTEGER PRIMARY KEY CHECK (active = 1)
+        )
+    ''')
+    conn.execute('DROP TRIGGER IF EXISTS game_saves_history')
+    conn.execute('''
+        CREATE TRIGGER game_saves_history
+        AFTER UPDATE OF score, clicks ON game_saves
+        WHEN NEW.score != OLD.score OR NEW.clicks != OLD.clicks
+        BEGIN
+            INSERT INTO score_events (user_id, ts, score_delta, clicks_delta, score)
+            VALUES (NEW.user_id, CAST(strftime('%s', 'now') AS INTEGER),
+                    CASE WHEN EXISTS (SELECT 1 FROM score_adjusting) THEN 0 ELSE NEW.score - OLD.score END,
+                    NEW.clicks - OLD.clicks, NEW.score);
+            INSERT INTO score_rollups (resolution, bucket, user_id, score_delta, clicks_delta, score, events)
+            VALUES (60, CAST(strftime('%s', 'now') AS INTEGER) / 60 * 60, NEW.user_id,
+                    CASE WHEN EXISTS (SELECT 1 FROM score_adjusting) THEN 0 ELSE NEW.score - OLD.score END,
+                    NEW.clicks - OLD.clicks, NEW.score, 1)
+            ON CONFLICT (resolution, bucket, user_id) DO UPDATE SET
+                score_delta = score_delta + excluded.score_delta,
+                clicks_delta = clicks_delta + excluded.clicks_delta,
+                score = excluded.score,
+                events = events + 1;
+            INSERT INTO score_rollups (resolution, bucket, user_id, score_delta, clicks_delta, score, events)
+            VALUES (3600, CAST(strftime('%s', 'now') AS INTEGER) / 3600 * 3600, NEW.user_id,
+                    CASE WHEN EXISTS (SELECT 1 FROM score_adjusting) THEN 0 ELSE NEW.score - OLD.score END,
+                    NEW.clicks - OLD.clicks, NEW.score, 1)
+            ON CONFLICT (resolution, bucket, user_id) DO UPDATE SET
+                score_delta = score_delta + excluded.score_delta,
+                clicks_delta = clicks_delta + excluded.clicks_delta,
+                score = excluded.score,
+                events = events + 1;
+            INSERT INTO score_rollups (resolution, bucket, user_id, score_delta, clicks_delta, score, events)
+            VALUES (86400, CAST(strftime('%s', 'now') AS INTEGER) / 86400 * 86400, NEW.user_id,
+                    CASE WHEN EXISTS (SELECT 1 FROM score_adjusting) THEN 0 ELSE NEW.score - OLD.score END,
+                    NEW.clicks - OLD.clicks, NEW.score, 1)
+            ON CONFLICT (resolution, bucket, user_id) DO UPDATE SET
+                score_delta = score_delta + excluded.score_delta,
+                clicks_delta = clicks_delta + excluded.clicks_delta,
+                score = excluded.score,
+                events = events + 1;
+        END
+    ''')
+
+
+# Append new migrations to the end; never reorder or edit applied ones.
+# Migrations that change game_saves, user_upgrades or the score history
+# tables must also update the shard schema in shared/sharding.py.
+MIGRATIONS = [
+    _create_baseline,
+    _rebuild_game_saves,
+    _add_score_index,
+    _add_upgrade_kind,
+    _add_sync_seq,
+    _add_username_search_index,
+    _add_storage_layout,
+    _add_score_history,
+    _add_score_audit,
+    _exclude_adjustments_from_history,
+]
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def schema_version(conn):
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+
+def migrate(conn):
+    """
+    Apply every pending migration to `conn` and return the list of versions
+    applied. Each migration runs in its own BEGIN IMMEDIATE transaction and
+    re-checks the version under the write lock, so several processes can
+    call this at startup safely. Statistics are refreshed with ANALYZE
+    whenever anything changed, and foreign keys are left enabled.
+    """
+    applied = []
+    if schema_version(conn) >= SCHEMA_VERSION:
+        conn.execute('PRAGMA foreign_keys=ON')
+        return applied
+    isolation_level = conn.isolation_level
+    conn.commit()
+    conn.isolation_level = None
+    # Table rebuilds need foreign key enforcement off; it cannot be
+    # toggled inside a transaction.
+    conn.execute('PRAGMA foreign_keys=OFF')
+    try:
+        for version, migration in enumerate(MIGRATIONS, start=1):
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                if schema_version(conn) >= version:
+                    conn.execute('COMMIT')
+                    continue
+                migration(conn)
+                conn.execute(f'PRAGMA user_version = {version}')
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+            applied.append(version)
+        if applied:
+            conn.execute('ANALYZE')
+    finally:
+        conn.execute('PRAGMA foreign_keys=ON')
+        conn.isolation_level = isolation_level
+    return applied
@@ -0,0 +1,163 @@
+"""
+Password hashing shared by the web app and the game.
+
+Hashes are self-describing strings, so cost settings can change without
+invalidating stored passwords:
+
+    scrypt$<n>$<r>$<p>$<salt>$<digest>
+    pbkdf2_sha256$<iterations>$<salt>$<digest>
+
+Anything else is treated as a legacy plaintext password. It still
+verifies, and needs_rehash() reports it so the caller can store a real
+hash on the next successful login. The same check upgrades hashes made
+with another algorithm or cost.
+"""
+import base64
+import hashlib
+import hmac
+import os
+import threading
+import time
+from collections import OrderedDict
+
+ALGORITHMS = ('scrypt', 'pbkdf2_sha256')
+SALT_BYTES = 16
+DIGEST_BYTES = 32
+
+
+def _b64(data):
+    return base64.b64encode(data).decode('ascii').rstrip('=')
+
+
+def _unb64(text):
+    return base64.b64decode(text + '=' * (-len(text) % 4))
+
+
+class PasswordHasher:
+    """
+    scrypt or PBKDF2-HMAC-SHA256 hashing with configurable cost.
+
+    Successful verifications are remembered for `cache_ttl` seconds in a
+    bounded LRU keyed by the stored hash. An entry holds an HMAC of the
+    password under a per-process random key, never the password, so a
+    repeat login costs one SHA-256 instead of a full KDF run. Set
+    cache_size=0 to disable it.
+    """
+
+    def __init__(self, algorithm='scrypt', scrypt_n=2 ** 14, scrypt_r=8, scrypt_p=1,
+                 pbkdf2_iterations=600_000, cache_size=10_000, cache_ttl=300.0):
+        if algorithm not in ALGORITHMS:
+            raise ValueError(f'unknown password algorithm {algorithm!r}; expected one of {", ".join(ALGORITHMS)}')
+        self.algorithm = algorithm
+        self.scrypt_n = scrypt_n
+        self.scrypt_r = scrypt_r
+        self.scrypt_p = scrypt_p
+        self.pbkdf2_iterations = pbkdf2_iterations
+        self.cache_size = cache_size
+        self.cache_ttl = cache_ttl
+        self._cache_key = os.urandom(32)
+        # stored hash -> (expires_at, password tag), least recently used first
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        # Metrics
+        self._hashes = 0
+        self._verifications = 0
+        self._cache_hits = 0
+
+    @staticmethod
+    def _scrypt(password, salt, n, r, p):
+        # scrypt needs 128 * r * n bytes; allow twice that plus slack
+        return hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p,
+                              maxmem=256 * r * n + 1024 * 1024, dklen=DIGEST_BYTES)
+
+    @staticmethod
+    def _pbkdf2(password, salt, iterations):
+        return hashlib.pbkdf2_hmac('sha256', password.encode(), salt, iterations, DIGEST_BYTES)
+
+    def hash(self, password):
+        """
+        A new salted hash of `password` at the configured algorithm and cost.
+        """
+        salt = os.urandom(SALT_BYTES)
+        with self._lock:
+            self._hashes += 1
+        if self.algorithm == 'scrypt':
+            n, r, p = self.scrypt_n, self.scrypt_r, self.scrypt_p
+            return f'scrypt${n}${r}${p}${_b64(salt)}${_b64(self._scrypt(password, salt, n, r, p))}'
+        iterations = self.pbkdf2_iterations
+        return f'pbkdf2_sha256${iterations}${_b64(salt)}${_b64(self._pbkdf2(password, salt, iterations))}'
+
+    def _tag(self, password):
+        return hmac.new(self._cache_key, password.encode(), hashlib.sha256).digest()
+
+    def is_cached(self, password, stored):
+        """
+        True if `password` was verified against `stored` within the TTL.
+        """
+        if not self.cache_size:
+            return False
+        with self._lock:
+            entry = self._cache.get(stored)
+            if entry is None:
+                return False
+            expires_at, tag = entry
+            if expires_at < time.monotonic():
+                del self._cache[stored]
+                return False
+            if not hmac.compare_digest(tag, self._tag(password)):
+                return False
+            self._cache.move_to_end(stored)
+            self._cache_hits += 1
+            return True
+
+    def _remember(self, password, stored):
+        if not self.cache_size:
+            return
+        with self._lock:
+            self._cache[stored] = (time.monotonic() + self.cache_ttl, self._tag(password))
+            self._cache.move_to_end(stored)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def verify(self, password, stored):
+        """
+        True if `password` matches the stored hash (or legacy plaintext).
+        """
+        if stored is None:
+            return False
+        if self.is_cached(password, stored):
+            return True
+        with self._lock:
+            self._verifications += 1
+        parts = stored.split('$')
+        try:
+            if parts[0] == 'scrypt' and len(parts) == 6:
+                n, r, p = int(parts[1]), int(parts[2]), int(parts[3])
+                ok = hmac.compare_digest(self._scrypt(password, _unb64(parts[4]), n, r, p), _unb64(parts[5]))
+            elif parts[0] == 'pbkdf2_sha256' and len(parts) == 4:
+                ok = hmac.compare_digest(self._pbkdf2(password, _unb64(parts[2]), int(parts[1])), _unb64(parts[3]))
+            else:
+                ok = hmac.compare_digest(password.encode(), stored.encode())
+        except ValueError:
+            return False
+        if ok:
+            self._remember(password, stored)
+        return ok
+
+    def needs_rehash(self, stored):
+        """
+        True if `stored` is plaintext or uses another algorithm or cost.
+        """
+        parts = (stored or '').split('$')
+        if self.algorithm == 'scrypt':
+            return parts[:4] != ['scrypt', str(self.scrypt_n), str(self.scrypt_r), str(self.scrypt_p)] or len(parts) != 6
+        return parts[:2] != ['pbkdf2_sha256', str(self.pbkdf2_iterations)] or len(parts) != 4
+
+    def stats(self):
+        with self._lock:
+            return {
+                'hashes': self._hashes,
+                'verifications': self._verifications,
+                'cache_hits': self._cache_hits,
+                'cache_entries': len(self._cache),
+            }
@@ -0,0 +1,128 @@
+"""
+Score production rules for owned upgrades.
+
+Upgrades of kind 'click' add `increment` points to every click per unit
+owned; upgrades of kind 'passive' generate `increment` points per second
+per unit owned. Rates are precomputed once per change of owned upgrades,
+and idle income is computed in closed form from elapsed whole seconds
+rather than by ticking.
+
+Run as a script to settle offline progress for every save in one batch
+per shard:
+
+    python -m shared.production DATABASE.db [--max-offline-seconds N]
+"""
+import argparse
+import time
+from datetime import datetime, timezone
+
+from shared.sharding import connect
+
+BASE_CLICK_YIELD = 1
+
+
+def compute_rates(owned_upgrades):
+    """
+    Return (click_yield, passive_rate) for an iterable of owned upgrade
+    mappings with increment, quantity and kind.
+    """
+    click_yield = BASE_CLICK_YIELD
+    passive_rate = 0
+    for upgrade in owned_upgrades:
+        amount = upgrade['increment'] * upgrade['quantity']
+        if upgrade['kind'] == 'passive':
+            passive_rate += amount
+        else:
+            click_yield += amount
+    return click_yield, passive_rate
+
+
+def parse_timestamp(value):
+    """
+    Convert an SQLite CURRENT_TIMESTAMP string (UTC) to a Unix timestamp.
+    """
+    if value is None:
+        return None
+    dt = datetime.strptime(value[:19], '%Y-%m-%d %H:%M:%S')
+    return dt.replace(tzinfo=timezone.utc).timestamp()
+
+
+def format_timestamp(unix_time):
+    """
+    Inverse of parse_timestamp(), truncated to whole seconds.
+    """
+    return datetime.fromtimestamp(int(unix_time), timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+
+
+def idle_income(passive_rate, elapsed_seconds, max_seconds=None):
+    """
+    Points earned over `elapsed_seconds` whole seconds, optionally capped.
+    """
+    seconds = max(int(elapsed_seconds), 0)
+    if max_seconds is not None:
+        seconds = min(seconds, max_seconds)
+    return passive_rate * seconds
+
+
+def settle_offline_progress(conn, now=None, max_offline_seconds=None, user_ids=None, commit=True,
+                            schema='main'):
+    """
+    Credit passive income earned since each save's last_updated and move
+    last_updated to `now`, for every save with passive upgrades (or only
+    `user_ids`) in the `schema` shard (see shared/sharding.py). Runs as one
+    UPDATE in one transaction regardless of how many saves are settled.
+    Pass commit=False to run it inside a transaction the caller already
+    holds. Returns the number of saves updated.
+    """
+    now = format_timestamp(time.time() if now is None else now)
+    cap = max_offline_seconds if max_offline_seconds is not None else 2 ** 62
+    user_filter = ''
+    params = {'now': now, 'cap': cap}
+    if user_ids is not None:
+        user_ids = list(user_ids)
+        if not user_ids:
+            return 0
+        placeholders = ', '.join(f':u{i}' for i in range(len(user_ids)))
+        user_filter = f'AND uu.user_id IN ({placeholders})'
+        params.update({f'u{i}': user_id for i, user_id in enumerate(user_ids)})
+    # cursor.rowcount is not reported for statements starting with WITH, and
+    # total_changes would also count the history trigger's rows; changes()
+    # is only the UPDATE's own
+    conn.execute(f'''
+        WITH rates AS (
+            SELECT uu.user_id, SUM(u.increment * uu.quantity) AS rate
+            FROM {schema}.user_upgrades uu
+            JOIN main.upgrades u ON u.id = uu.upgrade_id
+            WHERE u.kind = 'passive' {user_filter}
+            GROUP BY uu.user_id
+        )
+        UPDATE {schema}.game_saves
+        SET score = score + (SELECT rate FROM rates WHERE rates.user_id = game_saves.user_id)
+                * MIN(MAX(CAST(strftime('%s', :now) AS INTEGER)
+                          - CAST(strftime('%s', COALESCE(last_updated, :now)) AS INTEGER), 0), :cap),
+            last_updated = :now
+        WHERE user_id IN (SELECT user_id FROM rates)
+    ''', params)
+    updated = conn.execute('SELECT changes()').fetchone()[0]
+    if commit:
+        conn.commit()
+    return updated
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Settle offline passive income for all saves.')
+    parser.add_argument('database')
+    parser.add_argument('--max-offline-seconds', type=int, default=None)
+    args = parser.parse_args()
+    conn, shards = connect(args.database)
+    start = time.perf_counter()
+    updated = sum(
+        settle_offline_progress(conn, max_offline_seconds=args.max_offline_seconds, schema=schema)
+        for schema in shards.schemas
+    )
+    conn.close()
+    print(f'Settled {updated} saves in {time.perf_counter() - start:.3f}s')
+
+
+if __name__ == '__main__':
+    main()
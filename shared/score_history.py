@@ -0,0 +1,281 @@
+"""
+Score history: append-only score events and the rollups built from them.
+
+Every UPDATE that changes a save's score or clicks fires the
+game_saves_history trigger (migrations v8 and v10, and the same DDL in
+every shard file), so the web app, the game and the offline tools all
+record history without calling anything. The trigger writes in the same
+transaction and file as the save:
+
+- one score_events row: (user_id, ts, score_delta, clicks_delta, score),
+  where score is the new total
+- one score_rollups row per resolution (minute, hour and day), with the
+  bucket's summed deltas, its last score and its event count, incremented
+  in place
+
+Score changes that are not play (admin edits, audit clamps and restores)
+are written inside adjusting(): they still update the totals, but with a
+score_delta of 0, so they never count as gains.
+
+Reads never touch raw events. Windowed leaderboards sum the fewest rollup
+buckets that cover the window, series() reads one user's buckets and
+activity() totals every user's.
+
+Downsampling is retention: prune() deletes raw events and each resolution's
+rollups once they are older than their retention, while coarser
+rollups still hold the same totals. Raw events have no user index, so the
+events of deleted users are only removed by age.
+
+    python -m shared.score_history DATABASE.db prune [--retention JSON]
+    python -m shared.score_history DATABASE.db top week [--limit N]
+    python -m shared.score_history DATABASE.db series USER_ID [--resolution hour] [--points N]
+"""
+import argparse
+import contextlib
+import itertools
+import json
+import time
+
+from shared.sharding import connect
+
+# Rollup resolutions in seconds, finest first. The trigger writes one
+# rollup row per entry and must match.
+RESOLUTIONS = {'minute': 60, 'hour': 3600, 'day': 86400}
+
+# Seconds each kind of row is kept; None keeps it forever
+DEFAULT_RETENTION = {
+    'events': 86400,
+    'minute': 2 * 86400,
+    'hour': 90 * 86400,
+    'day': None,
+}
+
+# Named windows ending now, for windowed leaderboards
+WINDOWS = {'hour': 3600, 'day': 86400, 'week': 7 * 86400, 'month': 30 * 86400}
+
+_TOP_QUERY = '''
+    SELECT g.user_id, u.username, g.score_gain, g.clicks
+    FROM (
+        SELECT user_id, SUM(score_delta) AS score_gain, SUM(clicks_delta) AS clicks
+        FROM {{schema}}.score_rollups
+        WHERE {ranges}
+        GROUP BY user_id
+        ORDER BY score_gain DESC, user_id
+        LIMIT ?
+    ) g
+    JOIN main.users u ON u.id = g.user_id
+    ORDER BY g.score_gain DESC, g.user_id
+'''
+
+
+def load_retention(overrides=None):
+    """
+    DEFAULT_RETENTION updated with `overrides`, e.g. parsed from JSON.
+    Raises ValueError on unknown keys or non-positive values.
+    """
+    retention = dict(DEFAULT_RETENTION)
+    for key, seconds in (overrides or {}).items():
+        if key not in retention:
+            raise ValueError(f'unknown score history retention {key!r}; expected one of {", ".join(retention)}')
+        if seconds is not None and (isinstance(seconds, bool) or not isinstance(seconds, (int, float))
+                                    or seconds <= 0):
+            raise ValueError(f'score history retention {key!r} must be a positive number of seconds or null')
+        retention[key] = seconds
+    return retention
+
+
+@contextlib.contextmanager
+def adjusting(conn, schemas):
+    """
+    Record the score changes written in the block to saves in `schemas`
+    as adjustments rather than gains. Runs inside the caller's write
+    transaction, whose rollback on error also clears the flag.
+    """
+    for schema in schemas:
+        conn.execute(f'INSERT OR IGNORE INTO {schema}.score_adjusting (active) VALUES (1)')
+    yield
+    for schema in schemas:
+        conn.execute(f'DELETE FROM {schema}.score_adjusting')
+
+
+def _delete_in_batches(conn, statement, params, batch_size):
+    # Short transactions, so writers never wait long behind a prune
+    deleted = 0
+    while True:
+        count = conn.execute(statement, params + (batch_size,)).rowcount
+        conn.commit()
+        deleted += count
+        if count < batch_size:
+            return deleted
+
+
+def prune(conn, shards, retention=None, now=None, batch_size=10_000):
+    """
+    Delete raw events older than their retention and rollup buckets that
+    ended before theirs, in every shard. Returns {kind: rows deleted}.
+    """
+    retention = retention or DEFAULT_RETENTION
+    now = int(time.time() if now is None else now)
+    deleted = dict.fromkeys(DEFAULT_RETENTION, 0)
+    for schema in shards.schemas:
+        if retention['events'] is not None:
+            deleted['events'] += _delete_in_batches(conn, f'''
+                DELETE FROM {schema}.score_events WHERE rowid IN (
+                    SELECT rowid FROM {schema}.score_events WHERE ts < ? LIMIT ?
+                )
+            ''', (now - retention['events'],), batch_size)
+        for name, seconds in RESOLUTIONS.items():
+            if retention[name] is None:
+                continue
+            deleted[name] += _delete_in_batches(conn, f'''
+                DELETE FROM {schema}.score_rollups WHERE (resolution, bucket, user_id) IN (
+                    SELECT resolution, bucket, user_id FROM {schema}.score_rollups
+                    WHERE resolution = ? AND bucket <= ? LIMIT ?
+                )
+            ''', (seconds, now - retention[name] - seconds), batch_size)
+    return deleted
+
+
+def _finest_retained(age, retention):
+    for name, seconds in RESOLUTIONS.items():
+        if retention[name] is None or age <= retention[name]:
+            return seconds
+    return seconds
+
+
+def window_ranges(since, until, retention=None, now=None):
+    """
+    Cover [since, until) with as few rollup buckets as possible, as
+    (resolution seconds, first bucket, end) ranges: minutes up to the first
+    hour boundary, hours up to the first day boundary, whole days, and back
+    down at the other end. Each edge is first widened to the finest
+    resolution still retained at its age, so a window reaching back past
+    the minute retention starts on an hour boundary.
+    """
+    retention = retention or DEFAULT_RETENTION
+    now = time.time() if now is None else now
+    step = _finest_retained(now - since, retention)
+    low = int(since) // step * step
+    step = _finest_retained(now - until, retention)
+    high = -(-int(until) // step) * step
+    ranges = []
+    steps = list(RESOLUTIONS.values())
+    for step, coarser in zip(steps, steps[1:]):
+        inner_low = -(-low // coarser) * coarser
+        inner_high = high // coarser * coarser
+        if inner_low >= inner_high:
+            ranges.append((step, low, high))
+            return ranges
+        if low < inner_low:
+            ranges.append((step, low, inner_low))
+        if inner_high < high:
+            ranges.append((step, inner_high, high))
+        low, high = inner_low, inner_high
+    ranges.append((steps[-1], low, high))
+    return ranges
+
+
+def top_gains(conn, shards, since, until=None, limit=10, retention=None, now=None):
+    """
+    The `limit` users who gained the most score in [since, until), read
+    from rollups: [{user_id, username, score_gain, clicks}, ...] ordered by
+    score_gain descending, then user_id.
+    """
+    now = time.time() if now is None else now
+    ranges = window_ranges(since, now if until is None else until, retention, now)
+    where = ' OR '.join(['(resolution = ? AND bucket >= ? AND bucket < ?)'] * len(ranges))
+    params = tuple(itertools.chain.from_iterable(ranges)) + (limit,)
+    rows = shards.merged(conn, _TOP_QUERY.format(ranges=where), params, key=lambda row: (-row[2], row[0]))
+    return [
+        {'user_id': row[0], 'username': row[1], 'score_gain': row[2], 'clicks': row[3]}
+        for row in itertools.islice(rows, limit)
+    ]
+
+
+def series(conn, shards, user_id, resolution, since, until=None):
+    """
+    One user's history at `resolution` ('minute', 'hour' or 'day') for the
+    buckets overlapping [since, until): [{bucket, score, score_gain, clicks,
+    events}, ...] oldest first, where score is the total at the end of the
+    bucket. Buckets without changes are omitted.
+    """
+    step = RESOLUTIONS[resolution]
+    until = time.time() if until is None else until
+    rows = conn.execute(f'''
+        SELECT bucket, score, score_delta, clicks_delta, events
+        FROM {shards.schema_for(user_id)}.score_rollups
+        WHERE user_id = ? AND resolution = ? AND bucket >= ? AND bucket < ?
+        ORDER BY bucket
+    ''', (user_id, step, int(since) // step * step, until))
+    return [
+        {'bucket': row[0], 'score': row[1], 'score_gain': row[2], 'clicks': row[3], 'events': row[4]}
+        for row in rows
+    ]
+
+
+def activity(conn, shards, resolution, since, until=None):
+    """
+    Totals across all users per `resolution` bucket overlapping [since,
+    until): [{bucket, score_gain, clicks, events, players}, ...] oldest
+    first, where players counts users with at least one change.
+    """
+    step = RESOLUTIONS[resolution]
+    until = time.time() if until is None else until
+    rows = shards.merged(conn, '''
+        SELECT bucket, SUM(score_delta), SUM(clicks_delta), SUM(events), COUNT(*)
+        FROM {schema}.score_rollups
+        WHERE resolution = ? AND bucket >= ? AND bucket < ?
+        GROUP BY bucket
+        ORDER BY bucket
+    ''', (step, int(since) // step * step, until), key=lambda row: row[0])
+    totals = []
+    for bucket, group in itertools.groupby(rows, key=lambda row: row[0]):
+        group = list(group)
+        totals.append({
+            'bucket': bucket,
+            'score_gain': sum(row[1] for row in group),
+            'clicks': sum(row[2] for row in group),
+            'events': sum(row[3] for row in group),
+            'players': sum(row[4] for row in group),
+        })
+    return totals
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Prune or query the score history.')
+    parser.add_argument('database')
+    commands = parser.add_subparsers(dest='command', required=True)
+    command = commands.add_parser('prune', help='delete rows past their retention')
+    command.add_argument('--retention', type=json.loads, default=None,
+                         help='JSON object overriding retention seconds, e.g. {"events": 3600}')
+    command = commands.add_parser('top', help='users with the largest score gain in a window')
+    command.add_argument('window', choices=list(WINDOWS))
+    command.add_argument('--limit', type=int, default=10)
+    command = commands.add_parser('series', help="one user's score over time")
+    command.add_argument('user_id', type=int)
+    command.add_argument('--resolution', choices=list(RESOLUTIONS), default='hour')
+    command.add_argument('--points', type=int, default=24, help='buckets to go back')
+    args = parser.parse_args()
+
+    conn, shards = connect(args.database)
+    if args.command == 'prune':
+        try:
+            retention = load_retention(args.retention)
+        except ValueError as e:
+            parser.error(str(e))
+        start = time.perf_counter()
+        deleted = prune(conn, shards, retention)
+        print(f'Deleted {deleted} in {time.perf_counter() - start:.3f}s')
+    elif args.command == 'top':
+        for rank, row in enumerate(top_gains(conn, shards, time.time() - WINDOWS[args.window],
+                                             limit=args.limit), start=1):
+            print(f'{rank}\t{row["username"]}\t{row["score_gain"]}\t{row["clicks"]}')
+    else:
+        since = time.time() - RESOLUTIONS[args.resolution] * args.points
+        for row in series(conn, shards, args.user_id, args.resolution, since):
+            print(f'{row["bucket"]}\t{row["score"]}\t{row["score_gain"]}\t{row["clicks"]}')
+    conn.close()
+
+
+if __name__ == '__main__':
+    main()
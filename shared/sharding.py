@@ -0,0 +1,432 @@
+"""
+Hash partitioning of per-user game state across SQLite files.
+
+`users` and the `upgrades` catalog always live in the main database file.
+`game_saves`, `user_upgrades`, the score history tables
+(shared/score_history.py) and the save audit tables (shared/simulation.py)
+live either there too (one shard: the default, and the layout every
+database starts in) or in N shard files next to it
+(DATABASE.shard0of4.db ...), each holding the rows of the users that hash
+to it. Shard files are ATTACHed to every connection as shard0 ..
+shardN-1, so one user's rows are reached by qualifying the table with
+ShardMap.schema_for(user_id), joins against main.users and main.upgrades
+keep working, and reads across every user run once per schema and are
+merged. Each file has its own write lock, so writes for users on
+different shards do not wait for each other.
+
+Commits that touch several shards are atomic per file, not across files
+(SQLite's rule for WAL databases), and shard tables carry no foreign keys:
+deleting a user must also call ShardMap.delete_rows().
+
+The shard count is stored in the main database and only changed by
+reshard(), with the web app and game stopped:
+
+    python -m shared.sharding DATABASE.db status
+    python -m shared.sharding DATABASE.db reshard 4
+"""
+import argparse
+import heapq
+import os
+import sqlite3
+import sys
+import time
+
+from shared.migrations import migrate
+
+# SQLite's default limit on attached databases
+MAX_SHARDS = 10
+
+SHARD_SCHEMA_VERSION = 4
+
+# Sharded tables and the columns copied when resharding, user_id first.
+# Keep these and _SHARD_DDL in step with migrations that change game_saves,
+# user_upgrades, the score history or the save audit tables.
+SHARD_TABLES = {
+    'game_saves': ('user_id', 'score', 'clicks', 'last_updated', 'sync_seq'),
+    'user_upgrades': ('user_id', 'upgrade_id', 'quantity', 'purchased_at'),
+    'score_events': ('user_id', 'ts', 'score_delta', 'clicks_delta', 'score'),
+    'score_rollups': ('user_id', 'resolution', 'bucket', 'score_delta', 'clicks_delta', 'score', 'events'),
+    'score_baselines': ('user_id', 'score', 'clicks', 'upgrades_cost', 'reason', 'set_at'),
+    'score_clamps': ('user_id', 'score_before', 'excess', 'clamped_at', 'restored_at'),
+}
+# Not indexed by user; deleted users' rows expire with score_history.prune()
+_KEPT_ON_DELETE = ('score_events',)
+
+_SHARD_DDL = (
+    '''
+    CREATE TABLE IF NOT EXISTS {schema}.game_saves (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL UNIQUE,
+        score INTEGER NOT NULL DEFAULT 0,
+        clicks INTEGER NOT NULL DEFAULT 0,
+        last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        sync_seq INTEGER NOT NULL DEFAULT 0
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS {schema}.user_upgrades (
+        user_id INTEGER,
+        upgrade_id INTEGER,
+        quantity INTEGER DEFAULT 1,
+        purchased_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (user_id, upgrade_id)
+    )
+    ''',
+    'CREATE INDEX IF NOT EXISTS {schema}.idx_game_saves_score ON game_saves (score DESC, user_id)',
+    '''
+    CREATE TABLE IF NOT EXISTS {schema}.score_events (
+        user_id INTEGER NOT NULL,
+        ts INTEGER NOT NULL,
+        score_delta INTEGER NOT NULL,
+        clicks_delta INTEGER NOT NULL,
+        score INTEGER NOT NULL
+    )
+    ''',
+    'CREATE INDEX IF NOT EXISTS {schema}.idx_score_events_ts ON score_events (ts)',
+    '''
+    CREATE TABLE IF NOT EXISTS {schema}.score_rollups (
+        resolution INTEGER NOT NULL,
+        bucket INTEGER NOT NULL,
+        user_id INTEGER NOT NULL,
+        score_delta INTEGER NOT NULL,
+        clicks_delta INTEGER NOT NULL,
+        score INTEGER NOT NULL,
+        events INTEGER NOT NULL,
+        PRIMARY KEY (resolution, bucket, user_id)
+    ) WITHOUT ROWID
+    ''',
+    'CREATE INDEX IF NOT EXISTS {schema}.idx_score_rollups_user ON score_rollups (user_id, resolution, bucket)',
+    '''
+    CREATE TABLE IF NOT EXISTS {schema}.score_baselines (
+        user_id INTEGER PRIMARY KEY,
+        score INTEGER NOT NULL,
+        clicks INTEGER NOT NULL,
+        upgrades_cost INTEGER NOT NULL,
+        reason TEXT NOT NULL,
+        set_at INTEGER NOT NULL
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS {schema}.score_clamps (
+        user_id INTEGER NOT NULL,
+        score_before INTEGER NOT NULL,
+        excess INTEGER NOT NULL,
+        clamped_at INTEGER NOT NULL,
+        restored_at INTEGER
+    )
+    ''',
+    'CREATE INDEX IF NOT EXISTS {schema}.idx_score_clamps_user ON score_clamps (user_id)',
+    'CREATE TABLE IF NOT EXISTS {schema}.score_adjusting (active INTEGER PRIMARY KEY CHECK (active = 1))',
+    # Tables in a trigger body resolve to the trigger's own file
+    '''
+    CREATE TRIGGER IF NOT EXISTS {schema}.game_saves_history
+    AFTER UPDATE OF score, clicks ON game_saves
+    WHEN NEW.score != OLD.score OR NEW.clicks != OLD.clicks
+    BEGIN
+        INSERT INTO score_events (user_id, ts, score_delta, clicks_delta, score)
+        VALUES (NEW.user_id, CAST(strftime('%s', 'now') AS INTEGER),
+                CASE WHEN EXISTS (SELECT 1 FROM score_adjusting) THEN 0 ELSE NEW.score - OLD.score END,
+                NEW.clicks - OLD.clicks, NEW.score);
+        INSERT INTO score_rollups (resolution, bucket, user_id, score_delta, clicks_delta, score, events)
+        VALUES (60, CAST(strftime('%s', 'now') AS INTEGER) / 60 * 60, NEW.user_id,
+                CASE WHEN EXISTS (SELECT 1 FROM score_adjusting) THEN 0 ELSE NEW.score - OLD.score END,
+                NEW.clicks - OLD.clicks, NEW.score, 1)
+        ON CONFLICT (resolution, bucket, user_id) DO UPDATE SET
+            score_delta = score_delta + excluded.score_delta,
+            clicks_delta = clicks_delta + excluded.clicks_delta,
+            score = excluded.score,
+            events = events + 1;
+        INSERT INTO score_rollups (resolution, bucket, user_id, score_delta, clicks_delta, score, events)
+        VALUES (3600, CAST(strftime('%s', 'now') AS INTEGER) / 3600 * 3600, NEW.user_id,
+                CASE WHEN EXISTS (SELECT 1 FROM score_adjusting) THEN 0 ELSE NEW.score - OLD.score END,
+                NEW.clicks - OLD.clicks, NEW.score, 1)
+        ON CONFLICT (resolution, bucket, user_id) DO UPDATE SET
+            score_delta = score_delta + excluded.score_delta,
+            clicks_delta = clicks_delta + excluded.clicks_delta,
+            score = excluded.score,
+            events = events + 1;
+        INSERT INTO score_rollups (resolution, bucket, user_id, score_delta, clicks_delta, score, events)
+        VALUES (86400, CAST(strftime('%s', 'now') AS INTEGER) / 86400 * 86400, NEW.user_id,
+                CASE WHEN EXISTS (SELECT 1 FROM score_adjusting) THEN 0 ELSE NEW.score - OLD.score END,
+                NEW.clicks - OLD.clicks, NEW.score, 1)
+        ON CONFLICT (resolution, bucket, user_id) DO UPDATE SET
+            score_delta = score_delta + excluded.score_delta,
+            clicks_delta = clicks_delta + excluded.clicks_delta,
+            score = excluded.score,
+            events = events + 1;
+    END
+    ''',
+)
+
+_ID_CHUNK = 500
+_MASK64 = (1 << 64) - 1
+
+
+def shard_index(user_id, count):
+    """
+    Shard number in [0, count) for `user_id`, by Fibonacci hashing so that
+    consecutive ids spread evenly.
+    """
+    return ((user_id * 0x9E3779B97F4A7C15) & _MASK64) * count >> 64
+
+
+def shard_path(db_path, index, count):
+    root, ext = os.path.splitext(db_path)
+    return f'{root}.shard{index}of{count}{ext}'
+
+
+def read_shard_count(conn):
+    return conn.execute('SELECT shard_count FROM main.storage_layout').fetchone()[0]
+
+
+class ShardMap:
+    """
+    Which file holds each user's game_saves and user_upgrades rows.
+    """
+
+    def __init__(self, db_path, count=1):
+        if not 1 <= count <= MAX_SHARDS:
+            raise ValueError(f'shard count must be between 1 and {MAX_SHARDS}')
+        self.db_path = db_path
+        self.count = count
+        self.schemas = ('main',) if count == 1 else tuple(f'shard{i}' for i in range(count))
+
+    @classmethod
+    def load(cls, conn, db_path):
+        """
+        The layout recorded in an up-to-date main database.
+        """
+        return cls(db_path, read_shard_count(conn))
+
+    def paths(self):
+        if self.count == 1:
+            return [self.db_path]
+        return [shard_path(self.db_path, i, self.count) for i in range(self.count)]
+
+    def schema_for(self, user_id):
+        if self.count == 1:
+            return 'main'
+        return self.schemas[shard_index(user_id, self.count)]
+
+    def group(self, user_ids):
+        """
+        {schema: [user_id, ...]} for the shards the given users live on.
+        """
+        groups = {}
+        for user_id in user_ids:
+            groups.setdefault(self.schema_for(user_id), []).append(user_id)
+        return groups
+
+    def attach(self, conn):
+        """
+        Attach every shard file to `conn` in WAL mode with the same
+        synchronous setting as the main database, creating shard tables on
+        first use. Must be called outside a transaction.
+        """
+        if self.count == 1:
+            return
+        synchronous = conn.execute('PRAGMA main.synchronous').fetchone()[0]
+        for schema, path in zip(self.schemas, self.paths()):
+            conn.execute('ATTACH DATABASE ? AS ' + schema, (path,))
+            conn.execute(f'PRAGMA {schema}.journal_mode=WAL')
+            conn.execute(f'PRAGMA {schema}.synchronous={synchronous}')
+            version = conn.execute(f'PRAGMA {schema}.user_version').fetchone()[0]
+            if version < SHARD_SCHEMA_VERSION:
+                if 0 < version < 4:
+                    # Recreated below to leave adjustments out of gains, as
+                    # migration v10 does
+                    conn.execute(f'DROP TRIGGER IF EXISTS {schema}.game_saves_history')
+                for statement in _SHARD_DDL:
+                    conn.execute(statement.format(schema=schema))
+                if 0 < version < 3:
+                    # As migration v9 does for unsharded saves
+                    conn.execute(f'''
+                        INSERT OR IGNORE INTO {schema}.score_baselines
+                            (user_id, score, clicks, upgrades_cost, reason, set_at)
+                        SELECT gs.user_id, gs.score, gs.clicks,
+                               COALESCE((SELECT SUM(u.cost * uu.quantity) FROM {schema}.user_upgrades uu
+                                         JOIN main.upgrades u ON u.id = uu.upgrade_id
+                                         WHERE uu.user_id = gs.user_id), 0),
+                               'legacy', CAST(strftime('%s', 'now') AS INTEGER)
+                        FROM {schema}.game_saves gs
+                    ''')
+                conn.execute(f'PRAGMA {schema}.user_version = {SHARD_SCHEMA_VERSION}')
+                conn.commit()
+
+    def lock_user(self, conn, user_id):
+        """
+        Begin a write transaction holding only the write lock of the shard
+        `user_id` lives on, for read-then-write work on that user's rows.
+        BEGIN IMMEDIATE would lock every attached shard.
+        """
+        conn.execute('BEGIN')
+        conn.execute(f'UPDATE {self.schema_for(user_id)}.game_saves SET user_id = user_id WHERE 0')
+
+    def select_by_user(self, conn, table, columns, user_ids):
+        """
+        {user_id: row} of `columns` from `table` for the given users,
+        queried per shard in chunks.
+        """
+        rows = {}
+        select = ', '.join(('user_id',) + tuple(columns))
+        for schema, ids in self.group(user_ids).items():
+            for start in range(0, len(ids), _ID_CHUNK):
+                chunk = ids[start:start + _ID_CHUNK]
+                placeholders = ', '.join('?' * len(chunk))
+                for row in conn.execute(
+                        f'SELECT {select} FROM {schema}.{table} WHERE user_id IN ({placeholders})', chunk):
+                    rows[row[0]] = row
+        return rows
+
+    def delete_rows(self, conn, user_ids):
+        """
+        Delete the sharded rows of deleted users. With one shard the main
+        database's ON DELETE CASCADE already did this.
+        """
+        if self.count == 1:
+            return
+        for schema, ids in self.group(user_ids).items():
+            for table in SHARD_TABLES:
+                if table in _KEPT_ON_DELETE:
+                    continue
+                conn.executemany(f'DELETE FROM {schema}.{table} WHERE user_id = ?', [(i,) for i in ids])
+
+    def merged(self, conn, query, params=(), key=None):
+        """
+        Run `query` (with a {schema} placeholder) against every shard and
+        k-way merge the results, which must each already be sorted by `key`.
+        Results are consumed lazily.
+        """
+        cursors = [conn.execute(query.format(schema=schema), params) for schema in self.schemas]
+        if len(cursors) == 1:
+            return cursors[0]
+        return heapq.merge(*cursors, key=key)
+
+    def stats(self, conn):
+        return {
+            'shards': self.count,
+            'saves_per_shard': [
+                conn.execute(f'SELECT COUNT(*) FROM {schema}.game_saves').fetchone()[0]
+                for schema in self.schemas
+            ],
+        }
+
+
+def connect(db_path, **kwargs):
+    """
+    sqlite3.connect() to an up-to-date database with its shards attached.
+    Returns (conn, shard_map).
+    """
+    conn = sqlite3.connect(db_path, **kwargs)
+    migrate(conn)
+    shards = ShardMap.load(conn, db_path)
+    shards.attach(conn)
+    return conn, shards
+
+
+def _remove_files(path):
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+
+
+def reshard(db_path, count, batch_size=50_000):
+    """
+    Move every game_saves and user_upgrades row from the current layout to
+    `count` shards, streaming `batch_size` rows per transaction. Rows are
+    copied into the new files first, which are then analyzed, and the
+    layout is switched in one main-database transaction, so an interrupted
+    run leaves the old layout intact and can simply be repeated. Old shard
+    files are removed at the end. Returns the number of rows moved.
+    """
+    source, old = connect(db_path)
+    if count == old.count:
+        source.close()
+        return 0
+    new = ShardMap(db_path, count)
+    if count > 1:
+        # Leftovers of an interrupted run; never live, since names carry the count
+        for path in new.paths():
+            _remove_files(path)
+        targets = []
+        for path in new.paths():
+            target = sqlite3.connect(path)
+            target.execute('PRAGMA journal_mode=WAL')
+            for statement in _SHARD_DDL:
+                target.execute(statement.format(schema='main'))
+            target.execute(f'PRAGMA user_version = {SHARD_SCHEMA_VERSION}')
+            targets.append(target)
+    else:
+        targets = [source]
+        for table in SHARD_TABLES:
+            source.execute(f'DELETE FROM main.{table}')
+        source.commit()
+
+    moved = 0
+    for table, columns in SHARD_TABLES.items():
+        column_list = ', '.join(columns)
+        insert = f'INSERT INTO main.{table} ({column_list}) VALUES ({", ".join("?" * len(columns))})'
+        for schema in old.schemas:
+            # Rows of users that no longer exist are dropped on the way
+            rows = source.execute(
+                f'SELECT {column_list} FROM {schema}.{table} '
+                f'WHERE user_id IN (SELECT id FROM main.users)'
+            )
+            while True:
+                batch = rows.fetchmany(batch_size)
+                if not batch:
+                    break
+                buckets = {}
+                for row in batch:
+                    buckets.setdefault(shard_index(row[0], count), []).append(row)
+                for index, bucket in buckets.items():
+                    targets[index].executemany(insert, bucket)
+                    targets[index].commit()
+                moved += len(batch)
+    # Without statistics the planner drives leaderboard joins from users
+    for target in targets:
+        target.execute('ANALYZE main')
+        target.commit()
+        if target is not source:
+            target.close()
+
+    source.execute('BEGIN IMMEDIATE')
+    source.execute('UPDATE main.storage_layout SET shard_count = ?', (count,))
+    if old.count == 1:
+        for table in SHARD_TABLES:
+            source.execute(f'DELETE FROM main.{table}')
+    source.execute('COMMIT')
+    source.close()
+    if old.count > 1:
+        for path in old.paths():
+            _remove_files(path)
+    return moved
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Inspect or change how game saves are sharded.')
+    parser.add_argument('database')
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('status', help='show the shard count and saves per shard')
+    command = commands.add_parser('reshard', help='move rows to a new shard count')
+    command.add_argument('count', type=int)
+    command.add_argument('--batch-size', type=int, default=50_000)
+    args = parser.parse_args()
+
+    if args.command == 'status':
+        conn, shards = connect(args.database)
+        stats = shards.stats(conn)
+        conn.close()
+        print(f'{stats["shards"]} shard(s)')
+        for path, saves in zip(shards.paths(), stats['saves_per_shard']):
+            print(f'  {path}: {saves} saves')
+        return
+    if not 1 <= args.count <= MAX_SHARDS:
+        parser.error(f'count must be between 1 and {MAX_SHARDS}')
+    start = time.perf_counter()
+    moved = reshard(args.database, args.count, args.batch_size)
+    print(f'Moved {moved} rows to {args.count} shard(s) in {time.perf_counter() - start:.2f}s', file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,282 @@
+"""
+Server-side plausibility checks for saves whose score the client reports.
+
+The game writes whatever score it holds, so a save is checked against the
+most it could have earned under the upgrade rules in shared/production.py.
+Rates only grow as upgrades are bought, so crediting every click at the
+save's final click yield and every second since the account was created
+at its final passive rate, less what its upgrades cost, bounds every
+honest save whatever order it bought in:
+
+    ceiling = min(clicks, max_clicks) * click_yield + elapsed * passive_rate
+              - sum(cost * quantity)
+
+where max_clicks is `max_clicks_per_second` per second of account age. A
+save with a trusted baseline (score_baselines) is only checked for the
+play since: the baseline's score and the cost of the upgrades it owned are
+added to the ceiling, and only clicks since it count. Saves that existed
+before audits did (migration v9) are baselines, and so are scores set by
+admins (/edit_scores, bulk score changes) and restored ones, since none of
+them are play. Saves above their ceiling (plus `tolerance`), or with more
+clicks than max_clicks, are flagged. Each upgrade's per-unit rates are
+taken from compute_rates() once, so checking a save is a few multiply-adds
+per owned upgrade; audit() streams saves and owned upgrades per shard as
+two cursors in user_id order, checks them in batches, and can clamp
+flagged scores down to their ceiling. Every clamp is logged in
+score_clamps, in the same transaction, with the score it lowered, and
+restore() undoes them.
+
+    python -m shared.simulation DATABASE.db audit [--clamp] [--limit N]
+    python -m shared.simulation DATABASE.db restore [--since UNIX_TIME]
+"""
+import argparse
+import itertools
+import time
+
+from shared.production import BASE_CLICK_YIELD, compute_rates
+from shared.score_history import adjusting
+from shared.sharding import connect
+
+# Sustained clicks per second no human reaches; the web app's default
+# /increment_score rate limit is the same.
+MAX_CLICKS_PER_SECOND = 20
+
+_SAVES_QUERY = '''
+    SELECT gs.user_id, gs.score, gs.clicks - COALESCE(b.clicks, 0),
+           CAST(strftime('%s', COALESCE(u.created_at, 'now')) AS INTEGER),
+           COALESCE(b.score + b.upgrades_cost, 0)
+    FROM {schema}.game_saves gs
+    JOIN main.users u ON u.id = gs.user_id
+    LEFT JOIN {schema}.score_baselines b ON b.user_id = gs.user_id
+    ORDER BY gs.user_id
+'''
+
+_OWNED_QUERY = '''
+    SELECT user_id, upgrade_id, quantity FROM {schema}.user_upgrades ORDER BY user_id
+'''
+
+
+class SaveSimulator:
+    """
+    Score ceilings for saves under an upgrade catalog: an iterable of
+    mappings with id, cost, increment and kind, as in the upgrades table.
+    Owned upgrades missing from the catalog earn nothing and cost nothing.
+    """
+
+    def __init__(self, upgrades, max_clicks_per_second=MAX_CLICKS_PER_SECOND, tolerance=0):
+        self.max_clicks_per_second = max_clicks_per_second
+        self.tolerance = tolerance
+        # upgrade_id: (cost, click yield per unit, passive rate per unit)
+        self._rules = {}
+        for upgrade in upgrades:
+            click_yield, passive_rate = compute_rates([dict(upgrade, quantity=1)])
+            self._rules[upgrade['id']] = (upgrade['cost'], click_yield - BASE_CLICK_YIELD, passive_rate)
+
+    def ceiling(self, clicks, elapsed, owned, credit=0):
+        """
+        Most score a save could hold after `clicks` clicks over `elapsed`
+        seconds, owning {upgrade_id: quantity}, with `credit` trusted points
+        on top.
+        """
+        elapsed = max(int(elapsed), 0)
+        click_yield = BASE_CLICK_YIELD
+        passive_rate = spent = 0
+        for upgrade_id, quantity in owned.items():
+            rule = self._rules.get(upgrade_id)
+            if rule is not None:
+                spent += rule[0] * quantity
+                click_yield += rule[1] * quantity
+                passive_rate += rule[2] * quantity
+        max_clicks = int(self.max_clicks_per_second * max(elapsed, 1))
+        return credit + min(clicks, max_clicks) * click_yield + elapsed * passive_rate - spent
+
+    def check(self, saves):
+        """
+        Flag the implausible saves in a batch of (user_id, score, clicks,
+        elapsed seconds, {upgrade_id: quantity}, credit) tuples, as
+        iter_saves() yields them. Returns [{user_id, score, ceiling, excess,
+        clicks, max_clicks}, ...] in batch order, where excess is how far
+        the score is above its ceiling, or above 0 when the upgrades alone
+        cost more than the play could earn: what clamping removes.
+        """
+        flagged = []
+        for user_id, score, clicks, elapsed, owned, credit in saves:
+            ceiling = self.ceiling(clicks, elapsed, owned, credit)
+            max_clicks = int(self.max_clicks_per_second * max(int(elapsed), 1))
+            if score > ceiling + self.tolerance or clicks > max_clicks:
+                flagged.append({
+                    'user_id': user_id, 'score': score, 'ceiling': ceiling,
+                    'excess': max(score - max(ceiling, 0), 0), 'clicks': clicks, 'max_clicks': max_clicks,
+                })
+        return flagged
+
+
+def load_simulator(conn, **kwargs):
+    """
+    A SaveSimulator for the upgrades catalog in `conn`.
+    """
+    rows = conn.execute('SELECT id, cost, increment, kind FROM main.upgrades')
+    return SaveSimulator(
+        ({'id': row[0], 'cost': row[1], 'increment': row[2], 'kind': row[3]} for row in rows), **kwargs
+    )
+
+
+def iter_saves(conn, schema, now=None):
+    """
+    (user_id, score, clicks since the baseline, seconds since the account
+    was created, {upgrade_id: quantity}, baseline credit) for every save in
+    the `schema` shard, where the credit is the baseline's score plus the
+    cost of the upgrades it owned, in user_id order, merged from one cursor
+    over saves and one over owned upgrades.
+    """
+    now = int(time.time() if now is None else now)
+    owned_rows = itertools.groupby(conn.execute(_OWNED_QUERY.format(schema=schema)), key=lambda row: row[0])
+    owned_next = next(owned_rows, None)
+    for user_id, score, clicks, created, credit in conn.execute(_SAVES_QUERY.format(schema=schema)):
+        while owned_next is not None and owned_next[0] < user_id:
+            owned_next = next(owned_rows, None)
+        owned = {}
+        if owned_next is not None and owned_next[0] == user_id:
+            owned = {row[1]: row[2] for row in owned_next[1]}
+            owned_next = next(owned_rows, None)
+        yield user_id, score, clicks, now - created, owned, credit
+
+
+def _lock_shard(conn, schema):
+    # Hold the shard's write lock for the rest of the transaction, as
+    # ShardMap.lock_user() does
+    conn.execute('BEGIN')
+    conn.execute(f'UPDATE {schema}.game_saves SET user_id = user_id WHERE 0')
+
+
+def set_baselines(conn, shards, user_ids, reason, now=None):
+    """
+    Trust the current score, clicks and upgrades of each of `user_ids`:
+    audits only check play on top of them from now on. Runs inside the
+    caller's transaction; call it in the one that set the scores.
+    """
+    now = int(time.time() if now is None else now)
+    for schema, ids in shards.group(user_ids).items():
+        conn.executemany(f'''
+            INSERT INTO {schema}.score_baselines (user_id, score, clicks, upgrades_cost, reason, set_at)
+            SELECT gs.user_id, gs.score, gs.clicks,
+                   COALESCE((SELECT SUM(u.cost * uu.quantity) FROM {schema}.user_upgrades uu
+                             JOIN main.upgrades u ON u.id = uu.upgrade_id
+                             WHERE uu.user_id = gs.user_id), 0),
+                   ?, ?
+            FROM {schema}.game_saves gs WHERE gs.user_id = ?
+            ON CONFLICT (user_id) DO UPDATE SET
+                score = excluded.score, clicks = excluded.clicks, upgrades_cost = excluded.upgrades_cost,
+                reason = excluded.reason, set_at = excluded.set_at
+        ''', [(reason, now, user_id) for user_id in ids])
+
+
+def audit(conn, shards, simulator=None, now=None, clamp=False, batch_size=10_000):
+    """
+    Check every save in every shard, `batch_size` saves at a time, and
+    return the flagged ones (see SaveSimulator.check()). With clamp=True
+    each flagged score is lowered by its excess, relative to the current
+    score so points earned since the scan are kept, and the score before
+    is logged in score_clamps, in one transaction per shard.
+    """
+    simulator = simulator or load_simulator(conn)
+    now = int(time.time() if now is None else now)
+    flagged = []
+    for schema in shards.schemas:
+        saves = iter_saves(conn, schema, now)
+        shard_flagged = []
+        while True:
+            batch = list(itertools.islice(saves, batch_size))
+            if not batch:
+                break
+            shard_flagged.extend(simulator.check(batch))
+        clamps = [(row['excess'], now, row['user_id']) for row in shard_flagged if row['excess']]
+        if clamp and clamps:
+            _lock_shard(conn, schema)
+            try:
+                conn.executemany(f'''
+                    INSERT INTO {schema}.score_clamps (user_id, score_before, excess, clamped_at)
+                    SELECT user_id, score, MIN(?, score), ? FROM {schema}.game_saves
+                    WHERE user_id = ? AND score > 0
+                ''', clamps)
+                with adjusting(conn, [schema]):
+                    conn.executemany(
+                        f'UPDATE {schema}.game_saves SET score = MAX(score - ?, 0) WHERE user_id = ?',
+                        [(excess, user_id) for excess, _, user_id in clamps]
+                    )
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+        flagged.extend(shard_flagged)
+    return flagged
+
+
+def restore(conn, shards, since=0, now=None):
+    """
+    Give back the points of every clamp made at or after `since` that is
+    not restored yet, and make the restored scores baselines so the next
+    audit does not clamp them again. One transaction per shard. Returns
+    {user_id: points restored}.
+    """
+    now = int(time.time() if now is None else now)
+    restored = {}
+    for schema in shards.schemas:
+        _lock_shard(conn, schema)
+        try:
+            points = conn.execute(f'''
+                SELECT user_id, SUM(excess) FROM {schema}.score_clamps
+                WHERE restored_at IS NULL AND clamped_at >= ?
+                GROUP BY user_id
+            ''', (since,)).fetchall()
+            with adjusting(conn, [schema]):
+                conn.executemany(f'UPDATE {schema}.game_saves SET score = score + ? WHERE user_id = ?',
+                                 [(excess, user_id) for user_id, excess in points])
+            conn.execute(f'''
+                UPDATE {schema}.score_clamps SET restored_at = ?
+                WHERE restored_at IS NULL AND clamped_at >= ?
+            ''', (now, since))
+            set_baselines(conn, shards, [user_id for user_id, _ in points], 'restored', now)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        restored.update(points)
+    return restored
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check saves against the most their play could earn.')
+    parser.add_argument('database')
+    commands = parser.add_subparsers(dest='command', required=True)
+    command = commands.add_parser('audit', help='flag, and optionally clamp, implausible saves')
+    command.add_argument('--clamp', action='store_true', help='lower flagged scores to their ceiling')
+    command.add_argument('--max-clicks-per-second', type=float, default=MAX_CLICKS_PER_SECOND)
+    command.add_argument('--tolerance', type=int, default=0, help='points allowed above the ceiling')
+    command.add_argument('--limit', type=int, default=20, help='flagged saves to print, largest excess first')
+    command = commands.add_parser('restore', help='undo clamps')
+    command.add_argument('--since', type=int, default=0, help='only clamps made at or after this Unix time')
+    args = parser.parse_args()
+
+    conn, shards = connect(args.database)
+    if args.command == 'restore':
+        restored = restore(conn, shards, args.since)
+        conn.close()
+        print(f'Restored {sum(restored.values())} points to {len(restored)} saves')
+        return
+    simulator = load_simulator(conn, max_clicks_per_second=args.max_clicks_per_second,
+                               tolerance=args.tolerance)
+    start = time.perf_counter()
+    flagged = audit(conn, shards, simulator, clamp=args.clamp)
+    elapsed = time.perf_counter() - start
+    saves = sum(shards.stats(conn)['saves_per_shard'])
+    conn.close()
+    flagged.sort(key=lambda row: (-row['excess'], row['user_id']))
+    for row in flagged[:args.limit]:
+        print(f'{row["user_id"]}\t{row["score"]}\t{row["ceiling"]}\t{row["clicks"]}\t{row["max_clicks"]}')
+    clamped = sum(1 for row in flagged if row['excess']) if args.clamp else 0
+    print(f'Flagged {len(flagged)} of {saves} saves, clamped {clamped}, in {elapsed:.3f}s')
+
+
+if __name__ == '__main__':
+    main()
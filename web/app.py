@@ -1,17 +1,53 @@
-from flask import Flask, render_template, request, redirect, url_for, session, flash
+from flask import Flask, render_template, request, redirect, url_for, session, flash, g, jsonify
+from flask import Response, stream_template, stream_with_context
+from flask import before_render_template, template_rendered
+from itsdangerous import URLSafeTimedSerializer, BadSignature
+from markupsafe import Markup
+from werkzeug.middleware.proxy_fix import ProxyFix
 import sqlite3
+import heapq
+import io
+import itertools
+import json
 import os
+import sys
 import logging
+import math
+import atexit
+import threading
+import time
+from db_pool import ConnectionPool
+from click_batcher import ClickBatcher
+from leaderboard_hub import LeaderboardHub
+from log_pipeline import setup_logging
+from password_pool import PasswordBusy, PasswordPool
+from rate_limiter import RateLimiter
+from response_cache import ResponseCache
+from request_metrics import InstrumentedConnection, RequestMetrics, RequestStats
+from sampling_profiler import SamplingProfiler
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from shared.leaderboard import Leaderboard
+from shared.migrations import migrate
+from shared.passwords import PasswordHasher
+from shared.production import compute_rates, settle_offline_progress
+from shared.simulation import MAX_CLICKS_PER_SECOND, SaveSimulator, audit, set_baselines
+from shared.sharding import ShardMap
+from shared import score_history
+from shared.bulk_admin import (
+    EXPORT_TABLES, FORMATS, apply_score_changes, delete_users, export_rows,
+    format_rows, guess_format, read_records,
+)
 
 
 
-# Set up log rotation: 1MB per file, keep 5 backups
-from logging.handlers import RotatingFileHandler
-log_handler = RotatingFileHandler('app.log', maxBytes=1_000_000, backupCount=5)
-log_handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(message)s'))
-logging.basicConfig(
-    level=logging.INFO,
-    handlers=[log_handler, logging.StreamHandler()]
+# Log rotation: 1MB per file, keep 5 backups. In the default async mode
+# requests only enqueue records; a listener thread formats, writes and rotates.
+log_queue_handler = setup_logging(
+    os.environ.get('LOG_FILE', 'app.log') or None, max_bytes=1_000_000, backup_count=5,
+    mode=os.environ.get('LOG_MODE', 'async'),
+    fmt=os.environ.get('LOG_FORMAT', 'json'),
+    queue_size=int(os.environ.get('LOG_QUEUE_SIZE', 10000)),
 )
 
 app = Flask(__name__)
@@ -32,74 +68,529 @@ def edit_scores():
         user_id = request.form.get('user_id')
         if key == ADMIN_EDIT_KEY:
             try:
+                new_score = int(new_score)
+                user_id = int(user_id)
                 conn = get_db_connection()
-                conn.execute('UPDATE game_saves SET score = ? WHERE user_id = ?', (new_score, user_id))
-                conn.commit()
-                conn.close()
+                # Clicks queued before the edit must not land on top of it
+                with click_batcher.paused():
+                    schema = shard_map.schema_for(user_id)
+                    # Not play, so not a gain in score history
+                    with score_history.adjusting(conn, [schema]):
+                        conn.execute(f'UPDATE {schema}.game_saves SET score = ? WHERE user_id = ?',
+                                     (new_score, user_id))
+                    # Audits check play on top of the score an admin set
+                    set_baselines(conn, shard_map, [user_id], 'admin')
+                    conn.commit()
+                    click_batcher.discard([user_id])
+                get_leaderboard_index().update(user_id, new_score)
+                publish_rank_change(user_id)
                 flash(f'Score for user {user_id} updated to {new_score}.', 'success')
-                logging.info(f'Admin updated score for user {user_id} to {new_score}')
+                logging.info('Admin updated score for user %s to %s', user_id, new_score)
             except Exception as e:
                 flash(f'Error updating score: {e}', 'error')
-                logging.error(f'Error updating score for user {user_id}: {e}')
+                logging.error('Error updating score for user %s: %s', user_id, e)
         else:
             flash('Invalid admin key.', 'error')
-            logging.warning(f'Invalid admin key attempt for score edit (user_id={user_id})')
+            logging.warning('Invalid admin key attempt for score edit (user_id=%s)', user_id)
         return redirect(url_for('edit_scores'))
-    # Show all users and scores for editing
+    # Show one searchable page of users and scores for editing
     conn = get_db_connection()
-    users = conn.execute('SELECT u.id, u.username, gs.score FROM users u JOIN game_saves gs ON u.id = gs.user_id').fetchall()
-    conn.close()
-    return render_template('edit_scores.html', users=users)
-DATABASE = 'DATABASE.db'
+    return render_template('edit_scores.html', **admin_user_page(conn))
+DATABASE = os.environ.get('DATABASE', 'DATABASE.db')
+
+# Bring the schema up to date and read the shard layout before serving any request
+_conn = sqlite3.connect(DATABASE)
+try:
+    migrate(_conn)
+    shard_map = ShardMap.load(_conn, DATABASE)
+finally:
+    _conn.close()
+
+# Shared connection pool, with every shard file attached to each connection;
+# size and tuning can be overridden from the environment
+db_pool = ConnectionPool(
+    DATABASE,
+    size=int(os.environ.get('DB_POOL_SIZE', 8)),
+    timeout=float(os.environ.get('DB_POOL_TIMEOUT', 5.0)),
+    busy_timeout_ms=int(os.environ.get('DB_BUSY_TIMEOUT_MS', 5000)),
+    mmap_size=int(os.environ.get('DB_MMAP_SIZE', 64 * 1024 * 1024)),
+    setup=shard_map.attach,
+)
+
+# Rendered leaderboard fragments and query results, invalidated on every score write
+response_cache = ResponseCache(
+    ttl=float(os.environ.get('RESPONSE_CACHE_TTL', 5.0)),
+    max_entries=int(os.environ.get('RESPONSE_CACHE_MAX_ENTRIES', 1024)),
+)
+
+# Write-behind aggregator for /increment_score clicks. A flush changes what
+# the database-backed /leaderboard pages read, so it invalidates them too.
+click_batcher = ClickBatcher(
+    db_pool,
+    flush_interval_ms=int(os.environ.get('CLICK_FLUSH_INTERVAL_MS', 200)),
+    max_pending=int(os.environ.get('CLICK_FLUSH_MAX_PENDING', 500)),
+    on_flush=response_cache.invalidate,
+    shards=shard_map,
+)
 
 def get_db_connection():
     """
-    Create and return a new SQLite database connection.
+    Return the pooled SQLite connection for the current app context.
+    The first call checks one out of the pool; later calls in the same
+    request reuse it, and it is returned to the pool on teardown. Inside a
+    request the connection counts and times its statements for /metrics.
+    """
+    if 'db_conn' not in g:
+        conn = db_pool.acquire()
+        stats = g.get('request_stats')
+        if stats is not None:
+            stats.connections += 1
+            conn = InstrumentedConnection(conn, stats)
+        g.db_conn = conn
+    return g.db_conn
+
+# Per-endpoint latency, SQL and render metrics served at /metrics
+request_metrics = RequestMetrics()
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+
+# Opt-in: dump folded stacks of requests slower than PROFILE_SLOW_REQUEST_MS
+PROFILE_SLOW_REQUEST_MS = int(os.environ.get('PROFILE_SLOW_REQUEST_MS', 0))
+profiler = SamplingProfiler(
+    os.environ.get('PROFILE_OUTPUT_DIR', 'profiles'),
+    slow_ms=PROFILE_SLOW_REQUEST_MS,
+    interval_ms=int(os.environ.get('PROFILE_INTERVAL_MS', 5)),
+) if PROFILE_SLOW_REQUEST_MS > 0 else None
+
+@app.before_request
+def start_request_metrics():
+    g.request_stats = RequestStats()
+    if profiler is not None:
+        profiler.start()
+
+@app.teardown_request
+def record_request_metrics(exception=None):
+    """
+    Record the finished request's latency, SQL time and connection count,
+    and dump its stacks if profiling is on and it was slow.
+    """
+    stats = g.pop('request_stats', None)
+    if stats is None:
+        return
+    endpoint = request.endpoint or 'unmatched'
+    elapsed = request_metrics.record_request(endpoint, stats, failed=exception is not None)
+    if profiler is not None:
+        path = profiler.finish(endpoint, elapsed)
+        if path is not None:
+            logging.warning('Slow request %s took %.0fms; stacks in %s', endpoint, elapsed * 1000, path)
+
+def _template_render_started(sender, template, context, **extra):
+    stats = g.get('request_stats')
+    if stats is not None:
+        stats.render_starts.append(time.perf_counter())
+
+def _template_render_finished(sender, template, context, **extra):
+    stats = g.get('request_stats')
+    if stats is not None and stats.render_starts:
+        request_metrics.record_render(template.name, time.perf_counter() - stats.render_starts.pop())
+
+before_render_template.connect(_template_render_started, app)
+template_rendered.connect(_template_render_finished, app)
+
+# Per-route token buckets for POSTs: endpoint -> {scope: (tokens per second, burst)}.
+# Scopes are 'ip' (client address), 'user' (session or API token user) and
+# 'username' (the name a login attempt is for). RATE_LIMITS in the
+# environment is JSON in the same shape and replaces an endpoint's rules;
+# map an endpoint to {} to turn its limits off.
+RATE_LIMITS = {
+    'login': {'ip': (1, 20), 'username': (0.2, 5)},
+    'api_login': {'ip': (1, 20), 'username': (0.2, 5)},
+    'register': {'ip': (0.2, 5)},
+    'edit_scores': {'ip': (0.5, 5)},
+    'increment_score': {'user': (20, 40), 'ip': (50, 100)},
+    'api_sync': {'user': (5, 20), 'ip': (20, 50)},
+}
+
+def parse_rate_limits(overrides):
+    """
+    RATE_LIMITS-shaped rules from parsed JSON. Raises ValueError unless
+    every rule is [rate > 0 per second, burst >= 1]; a bucket that never
+    refills would lock its clients out for good.
+    """
+    rules = {}
+    for endpoint, scopes in overrides.items():
+        rules[endpoint] = {}
+        for scope, limit in scopes.items():
+            rate, burst = limit
+            if rate <= 0 or burst < 1:
+                raise ValueError(f'RATE_LIMITS {endpoint}.{scope}: rate must be > 0 and burst >= 1, got {limit}')
+            rules[endpoint][scope] = (rate, burst)
+    return rules
+
+RATE_LIMITS.update(parse_rate_limits(json.loads(os.environ.get('RATE_LIMITS', '{}'))))
+rate_limiter = RateLimiter(max_keys=int(os.environ.get('RATE_LIMIT_MAX_KEYS', 100_000)))
+
+# Behind a reverse proxy every request comes from the proxy's address, so
+# the 'ip' scope would put all clients in one bucket. TRUSTED_PROXY_HOPS is
+# how many proxies in front of the app append to X-Forwarded-For; the
+# client address is taken from there. Leave it 0 when clients connect
+# directly, or they could pick their own address.
+TRUSTED_PROXY_HOPS = int(os.environ.get('TRUSTED_PROXY_HOPS', 0))
+if TRUSTED_PROXY_HOPS > 0:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=TRUSTED_PROXY_HOPS)
+
+def rate_limit_identity(scope):
+    """
+    Who a request counts against for `scope`, or None to skip that bucket.
+    """
+    if scope == 'ip':
+        return request.remote_addr
+    if scope == 'user':
+        return api_user_id()
+    if scope == 'username':
+        data = request.get_json(silent=True) if request.is_json else request.form
+        username = data.get('username') if hasattr(data, 'get') else None
+        return str(username)[:64] if username else None
+    return None
+
+@app.before_request
+def enforce_rate_limits():
+    """
+    Reject POSTs over their route's limits with 429 before the view runs,
+    so throttled requests never check out a database connection.
+    """
+    if request.method != 'POST':
+        return None
+    rules = RATE_LIMITS.get(request.endpoint)
+    if not rules:
+        return None
+    limits = []
+    for scope, (rate, burst) in rules.items():
+        identity = rate_limit_identity(scope)
+        if identity is not None:
+            limits.append(((request.endpoint, scope, identity), rate, burst))
+    retry_after = rate_limiter.check(limits)
+    if not retry_after:
+        return None
+    response = jsonify({'error': 'rate limit exceeded', 'retry_after': round(retry_after, 3)})
+    response.status_code = 429
+    response.headers['Retry-After'] = str(math.ceil(retry_after))
+    return response
+
+# Password hashing runs on a bounded pool so logins cannot starve other requests
+password_pool = PasswordPool(
+    PasswordHasher(
+        algorithm=os.environ.get('PASSWORD_ALGORITHM', 'scrypt'),
+        scrypt_n=int(os.environ.get('PASSWORD_SCRYPT_N', 2 ** 14)),
+        scrypt_r=int(os.environ.get('PASSWORD_SCRYPT_R', 8)),
+        scrypt_p=int(os.environ.get('PASSWORD_SCRYPT_P', 1)),
+        pbkdf2_iterations=int(os.environ.get('PASSWORD_PBKDF2_ITERATIONS', 600_000)),
+        cache_size=int(os.environ.get('PASSWORD_CACHE_SIZE', 10_000)),
+        cache_ttl=float(os.environ.get('PASSWORD_CACHE_TTL', 300)),
+    ),
+    workers=int(os.environ.get('PASSWORD_HASH_WORKERS', max(1, (os.cpu_count() or 2) // 2))),
+    max_pending=int(os.environ.get('PASSWORD_HASH_MAX_PENDING', 64)),
+)
+
+def authenticate(conn, username, password):
+    """
+    The user row for valid credentials, else None. A plaintext or outdated
+    stored hash is replaced with one at the current cost after a
+    successful check. Raises PasswordBusy when the hashing pool is full.
+    """
+    user = conn.execute(
+        'SELECT id, username, password, is_admin FROM users WHERE username = ?', (username,)
+    ).fetchone()
+    if user is None:
+        return password_pool.verify_missing_user(password or '')
+    if not password_pool.verify(password or '', user['password']):
+        return None
+    if password_pool.hasher.needs_rehash(user['password']):
+        # Only replace the hash we verified, in case it changed meanwhile
+        conn.execute(
+            'UPDATE users SET password = ? WHERE id = ? AND password = ?',
+            (password_pool.hash(password), user['id'], user['password'])
+        )
+        conn.commit()
+        logging.info('Upgraded password hash for user %s', user['id'])
+    return user
+
+# In-memory rank index, built from the database on first use
+leaderboard_index = Leaderboard()
+_leaderboard_loaded = False
+_leaderboard_load_lock = threading.Lock()
+LEADERBOARD_INDEX_QUERY = '''
+    SELECT gs.user_id, u.username, gs.score, gs.clicks
+    FROM {schema}.game_saves gs
+    JOIN main.users u ON gs.user_id = u.id
+'''
+# Each worker process keeps its own index, so with several workers it is
+# rebuilt from the database this often to pick up the others' writes,
+# which are then published to this worker's stream subscribers.
+LEADERBOARD_RELOAD_SECONDS = float(os.environ.get('LEADERBOARD_RELOAD_SECONDS', 0))
+
+def get_leaderboard_index():
+    """
+    Return the process-wide leaderboard index, loading it on first call.
+    """
+    global _leaderboard_loaded
+    if not _leaderboard_loaded:
+        with _leaderboard_load_lock:
+            if not _leaderboard_loaded:
+                conn = get_db_connection()
+                leaderboard_index.load(leaderboard_index_rows(conn))
+                _leaderboard_loaded = True
+    return leaderboard_index
+
+def leaderboard_index_rows(conn):
+    return itertools.chain.from_iterable(
+        conn.execute(LEADERBOARD_INDEX_QUERY.format(schema=schema)) for schema in shard_map.schemas
+    )
+
+def reload_leaderboard_index():
+    """
+    Rebuild the index from the database off to the side and swap it in.
+    Queued clicks are flushed first so this process's own recent clicks
+    are part of the snapshot. Every user whose score changed since the
+    last load, e.g. through another worker, is published to stream
+    subscribers.
+    """
+    global leaderboard_index, _leaderboard_loaded
+    click_batcher.flush()
+    fresh = Leaderboard()
+    conn = db_pool.acquire()
+    try:
+        fresh.load(leaderboard_index_rows(conn))
+    finally:
+        db_pool.release(conn)
+    with _leaderboard_load_lock:
+        stale, was_loaded = leaderboard_index, _leaderboard_loaded
+        leaderboard_index = fresh
+        _leaderboard_loaded = True
+    response_cache.invalidate()
+    if was_loaded:
+        for user_id in stale.changed(fresh):
+            publish_rank_change(user_id)
+
+_background_stop = threading.Event()
+
+def _reload_leaderboard_periodically():
+    while not _background_stop.wait(LEADERBOARD_RELOAD_SECONDS):
+        try:
+            reload_leaderboard_index()
+        except Exception:
+            logging.exception('Leaderboard index reload failed')
+
+if LEADERBOARD_RELOAD_SECONDS > 0:
+    threading.Thread(target=_reload_leaderboard_periodically, name='leaderboard-reload', daemon=True).start()
+
+# Score history is recorded by a trigger on every save write; rows past
+# their retention are deleted this often. SCORE_HISTORY_RETENTION in the
+# environment is a JSON object of seconds (or null to keep forever) for
+# 'events', 'minute', 'hour' and 'day'.
+SCORE_HISTORY_RETENTION = score_history.load_retention(json.loads(os.environ.get('SCORE_HISTORY_RETENTION', '{}')))
+SCORE_HISTORY_PRUNE_SECONDS = float(os.environ.get('SCORE_HISTORY_PRUNE_SECONDS', 600))
+# Windowed leaderboards sum every rollup in the window, so they are cached
+# for a fixed time instead of being invalidated by each score write
+history_cache = ResponseCache(ttl=float(os.environ.get('SCORE_HISTORY_CACHE_TTL', 60.0)), max_entries=64)
+
+def _prune_score_history_periodically():
+    while not _background_stop.wait(SCORE_HISTORY_PRUNE_SECONDS):
+        conn = db_pool.acquire()
+        try:
+            deleted = score_history.prune(conn, shard_map, SCORE_HISTORY_RETENTION)
+            logging.info('Pruned score history: %s', deleted)
+        except Exception:
+            logging.exception('Score history prune failed')
+        finally:
+            db_pool.release(conn)
+
+if SCORE_HISTORY_PRUNE_SECONDS > 0:
+    threading.Thread(target=_prune_score_history_periodically, name='score-history-prune', daemon=True).start()
+
+_shutdown_lock = threading.Lock()
+_shut_down = False
+
+def shutdown():
+    """
+    Stop background threads, write clicks still queued in memory and close
+    idle database connections. Runs at exit, and earlier from the gunicorn
+    worker_exit hook; only the first call does anything.
+    """
+    global _shut_down
+    with _shutdown_lock:
+        if _shut_down:
+            return
+        _shut_down = True
+    _background_stop.set()
+    click_batcher.stop()
+    db_pool.close_all()
+    logging.info('Shut down process %s', os.getpid())
+
+atexit.register(shutdown)
+
+# Pub/sub hub feeding /leaderboard/stream
+leaderboard_hub = LeaderboardHub(
+    history=int(os.environ.get('LEADERBOARD_STREAM_HISTORY', 4096)),
+    max_subscribers=int(os.environ.get('LEADERBOARD_STREAM_MAX_SUBSCRIBERS', 5000)),
+)
+LEADERBOARD_STREAM_HEARTBEAT = 15.0
+LEADERBOARD_STREAM_MIN_INTERVAL = float(os.environ.get('LEADERBOARD_STREAM_MIN_INTERVAL', 0.25))
+
+def publish_rank_change(user_id):
+    """
+    Invalidate cached leaderboard responses and push a user's new score and
+    rank (or their removal) to stream subscribers. Every score write calls
+    this once it is applied to the leaderboard index.
+    """
+    response_cache.invalidate()
+    rows = get_leaderboard_index().around(user_id, 0)
+    if rows:
+        row = rows[0]
+        leaderboard_hub.publish({
+            'user_id': row['user_id'], 'username': row['username'],
+            'score': row['score'], 'rank': row['rank'],
+        })
+    else:
+        leaderboard_hub.publish({'user_id': user_id, 'removed': True})
+
+@app.teardown_appcontext
+def release_db_connection(exception=None):
+    """
+    Return the request's connection (if any) to the pool.
+    """
+    conn = g.pop('db_conn', None)
+    if isinstance(conn, InstrumentedConnection):
+        conn = conn.unwrap()
+    if conn is not None:
+        db_pool.release(conn)
+
+@app.route('/pool_stats')
+def pool_stats():
+    """
+    Admin-only JSON view of connection pool metrics.
+    """
+    if not session.get('is_admin'):
+        return jsonify({'error': 'admin privileges required'}), 403
+    return jsonify(db_pool.stats())
+
+@app.route('/click_stats')
+def click_stats():
+    """
+    Admin-only JSON view of click batching metrics.
+    """
+    if not session.get('is_admin'):
+        return jsonify({'error': 'admin privileges required'}), 403
+    return jsonify(click_batcher.stats())
+
+@app.route('/metrics')
+def metrics():
+    """
+    Request metrics and subsystem stats in the Prometheus text format.
+    Requires an admin session, or `Authorization: Bearer $METRICS_TOKEN`
+    when METRICS_TOKEN is set so a scraper can read it.
+    """
+    scraper = METRICS_TOKEN and request.headers.get('Authorization') == f'Bearer {METRICS_TOKEN}'
+    if not scraper and not session.get('is_admin'):
+        return jsonify({'error': 'admin privileges required'}), 403
+    gauges = {
+        'db_pool': db_pool.stats(),
+        'click_batcher': click_batcher.stats(),
+        'response_cache': response_cache.stats(),
+        'history_cache': history_cache.stats(),
+        'leaderboard_stream': leaderboard_hub.stats(),
+    }
+    if profiler is not None:
+        gauges['profiler'] = profiler.stats()
+    if log_queue_handler is not None:
+        gauges['logging'] = log_queue_handler.stats()
+    gauges['passwords'] = password_pool.stats()
+    gauges['rate_limiter'] = rate_limiter.stats()
+    return Response(request_metrics.render(gauges), mimetype='text/plain; version=0.0.4')
+
+@app.route('/password_stats')
+def password_stats():
+    """
+    Admin-only JSON view of password hashing pool and cache metrics.
     """
-    conn = sqlite3.connect(DATABASE)
-    conn.row_factory = sqlite3.Row
-    return conn
+    if not session.get('is_admin'):
+        return jsonify({'error': 'admin privileges required'}), 403
+    return jsonify(password_pool.stats())
+
+@app.route('/cache_stats')
+def cache_stats():
+    """
+    Admin-only JSON view of response cache metrics.
+    """
+    if not session.get('is_admin'):
+        return jsonify({'error': 'admin privileges required'}), 403
+    return jsonify(response_cache.stats())
+
+def not_modified(etag):
+    """
+    The 304 response for a request whose If-None-Match matches `etag`,
+    or None when the body has to be sent.
+    """
+    if etag is None or not request.if_none_match.contains(etag):
+        return None
+    response_cache.count_not_modified()
+    return with_etag(Response(status=304), etag)
+
+def with_etag(response, etag):
+    """
+    Tag a per-session page so browsers revalidate it on every view.
+    """
+    if etag is not None:
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'private, no-cache'
+        response.vary.add('Cookie')
+    return response
 
 @app.route('/')
 def index():
     """
     Main page: Shows leaderboard and user info if logged in.
+    The top-10 table is rendered once per cache generation; a repeat view
+    with a matching ETag gets a 304 without rendering anything.
     """
+    # Clear the score increment flash flag so the button can be clicked again
+    if session.get('score_incremented_flash'):
+        session.pop('score_incremented_flash')
+    # Pages carrying flash messages are one-off and never revalidated
+    etag = None if '_flashes' in session else response_cache.etag('index', session.get('user_id'))
+    cached = not_modified(etag)
+    if cached is not None:
+        return cached
+
+    top_table = response_cache.get('index:top10', lambda: Markup(
+        render_template('_top_table.html', leaderboard=get_leaderboard_index().top(10))
+    ))
+
     conn = get_db_connection()
-    leaderboard = conn.execute('''
-        SELECT u.username, gs.score 
-        FROM game_saves gs 
-        JOIN users u ON gs.user_id = u.id 
-        ORDER BY gs.score DESC 
-        LIMIT 10
-    ''').fetchall()
-    conn.close()
-    
     user = None
     if 'user_id' in session:
-        conn = get_db_connection()
         user = conn.execute(
             'SELECT id, username, is_admin FROM users WHERE id = ?',
             (session['user_id'],)
         ).fetchone()
-        conn.close()
     
-    # Get user's score if logged in
+    # Get user's score and rank if logged in
     user_score = None
+    user_rank = None
     if user:
-        conn = get_db_connection()
-        score_row = conn.execute('SELECT score FROM game_saves WHERE user_id = ?', (user['id'],)).fetchone()
+        user_rank = get_leaderboard_index().rank(user['id'])
+        score_row = conn.execute(
+            f'SELECT score FROM {shard_map.schema_for(user["id"])}.game_saves WHERE user_id = ?', (user['id'],)
+        ).fetchone()
         if score_row:
-            user_score = score_row['score']
-        conn.close()
-    # Clear the score increment flash flag so the button can be clicked again
-    if session.get('score_incremented_flash'):
-        session.pop('score_incremented_flash')
-    return render_template('index.html', leaderboard=leaderboard, user=user, user_score=user_score)
+            # Include clicks that are still waiting in the write-behind batch
+            user_score = score_row['score'] + click_batcher.pending_for(user['id'])
+    page = render_template('index.html', top_table=top_table, user=user, user_score=user_score, user_rank=user_rank)
+    return with_etag(app.make_response(page), etag)
 @app.route('/increment_score', methods=['POST'])
 def increment_score():
     """
     Increments the logged-in user's score by 1. Prevents duplicate flash messages.
+    The increment is queued in the click batcher and written asynchronously.
     """
     if 'user_id' not in session:
         flash('You must be logged in to increment your score.', 'error')
@@ -109,13 +600,12 @@ def increment_score():
     if session.get('score_incremented_flash'):
         session.pop('score_incremented_flash')
         return redirect(url_for('index'))
-    conn = get_db_connection()
-    conn.execute('UPDATE game_saves SET score = score + 1 WHERE user_id = ?', (session['user_id'],))
-    conn.commit()
-    conn.close()
+    click_batcher.add(session['user_id'])
+    get_leaderboard_index().increment(session['user_id'])
+    publish_rank_change(session['user_id'])
     flash('Score incremented!', 'success')
     session['score_incremented_flash'] = True
-    logging.info(f'User {session["user_id"]} incremented their score')
+    logging.info('User %s incremented their score', session['user_id'])
     return redirect(url_for('index'))
 
 @app.route('/login', methods=['GET', 'POST'])
@@ -128,22 +618,23 @@ def login():
         password = request.form['password']
         
         conn = get_db_connection()
-        user = conn.execute(
-            'SELECT * FROM users WHERE username = ? AND password = ?',
-            (username, password)
-        ).fetchone()
-        conn.close()
+        try:
+            user = authenticate(conn, username, password)
+        except PasswordBusy:
+            flash('The server is busy, please try again in a moment.', 'error')
+            logging.warning('Login for %s rejected: password pool full', username)
+            return render_template('login.html'), 503
         
         if user:
             session['user_id'] = user['id']
             session['username'] = user['username']
             session['is_admin'] = user['is_admin']
             flash('Login successful!', 'success')
-            logging.info(f'User {username} logged in (id={user["id"]})')
+            logging.info('User %s logged in (id=%s)', username, user['id'])
             return redirect(url_for('index'))
         else:
             flash('Invalid credentials', 'error')
-            logging.warning(f'Failed login attempt for username: {username}')
+            logging.warning('Failed login attempt for username: %s', username)
     
     return render_template('login.html')
 
@@ -156,27 +647,33 @@ def register():
         username = request.form['username']
         password = request.form['password']
         
+        try:
+            password_hash = password_pool.hash(password)
+        except PasswordBusy:
+            flash('The server is busy, please try again in a moment.', 'error')
+            return render_template('register.html'), 503
         conn = get_db_connection()
         try:
             conn.execute(
                 'INSERT INTO users (username, password) VALUES (?, ?)',
-                (username, password)
+                (username, password_hash)
             )
             user_id = conn.execute('SELECT last_insert_rowid()').fetchone()[0]
             conn.execute(
-                'INSERT INTO game_saves (user_id) VALUES (?)',
+                f'INSERT INTO {shard_map.schema_for(user_id)}.game_saves (user_id) VALUES (?)',
                 (user_id,)
             )
             conn.commit()
-            conn.close()
+            get_leaderboard_index().update(user_id, 0, username=username)
+            publish_rank_change(user_id)
             
             flash('Registration successful! Please login.', 'success')
-            logging.info(f'New user registered: {username} (id={user_id})')
+            logging.info('New user registered: %s (id=%s)', username, user_id)
             return redirect(url_for('login'))
         except sqlite3.IntegrityError:
-            conn.close()
+            conn.rollback()
             flash('Username already exists', 'error')
-            logging.warning(f'Registration failed: username already exists ({username})')
+            logging.warning('Registration failed: username already exists (%s)', username)
     
     return render_template('register.html')
 
@@ -190,30 +687,217 @@ def logout():
     logging.info('User logged out')
     return redirect(url_for('index'))
 
+# Keyset pagination limits for /leaderboard
+LEADERBOARD_PAGE_SIZE = 50
+LEADERBOARD_MAX_PAGE_SIZE = 500
+LEADERBOARD_CHUNK_SIZE = 500
+
+def iter_leaderboard_rows(conn, after_score=None, after_id=None, limit=None):
+    """
+    Yield leaderboard rows ordered by (score DESC, user_id ASC), starting
+    after the (after_score, after_id) cursor. Each shard is read in keyset
+    chunks and the shards are k-way merged, so memory stays constant and no
+    read transaction is held open between chunks. `limit=None` streams to
+    the end of the board.
+    """
+    shard_rows = [
+        iter_shard_leaderboard_rows(conn, schema, after_score, after_id, limit)
+        for schema in shard_map.schemas
+    ]
+    if len(shard_rows) == 1:
+        return shard_rows[0]
+    merged = heapq.merge(*shard_rows, key=lambda row: (-row['score'], row['user_id']))
+    return itertools.islice(merged, limit)
+
+def iter_shard_leaderboard_rows(conn, schema, after_score=None, after_id=None, limit=None):
+    """
+    iter_leaderboard_rows() for the users on one shard.
+    """
+    remaining = limit
+    while remaining is None or remaining > 0:
+        chunk = LEADERBOARD_CHUNK_SIZE if remaining is None else min(remaining, LEADERBOARD_CHUNK_SIZE)
+        if after_score is None:
+            rows = conn.execute(f'''
+                SELECT gs.user_id, u.username, gs.score, gs.clicks
+                FROM {schema}.game_saves gs
+                JOIN main.users u ON gs.user_id = u.id
+                ORDER BY gs.score DESC, gs.user_id
+                LIMIT ?
+            ''', (chunk,)).fetchall()
+        else:
+            rows = conn.execute(f'''
+                SELECT gs.user_id, u.username, gs.score, gs.clicks
+                FROM {schema}.game_saves gs
+                JOIN main.users u ON gs.user_id = u.id
+                WHERE gs.score <= ? AND (gs.score < ? OR gs.user_id > ?)
+                ORDER BY gs.score DESC, gs.user_id
+                LIMIT ?
+            ''', (after_score, after_score, after_id, chunk)).fetchall()
+        for row in rows:
+            yield row
+        if len(rows) < chunk:
+            return
+        after_score, after_id = rows[-1]['score'], rows[-1]['user_id']
+        if remaining is not None:
+            remaining -= len(rows)
+
 @app.route('/leaderboard')
 def leaderboard():
     """
-    Shows the full leaderboard with scores and clicks.
+    Shows the leaderboard with scores and clicks, one keyset page at a time,
+    plus the logged-in user's rank and the players around them. HTML pages
+    are served from the response cache, and every format honours
+    If-None-Match against an ETag of the cache generation and the query.
+    Query parameters:
+      after_score, after_id: cursor from the last row of the previous page
+      limit: page size (HTML) or maximum rows (JSON/NDJSON, default all)
+      format: 'ndjson' or 'json' to stream rows instead of HTML
     """
+    after_score = request.args.get('after_score', type=int)
+    after_id = request.args.get('after_id', type=int)
+    if after_score is None or after_id is None:
+        after_score = after_id = None
+    fmt = request.args.get('format', 'html')
+    etag = response_cache.etag(
+        'leaderboard', fmt, after_score, after_id,
+        request.args.get('limit', type=int), session.get('user_id')
+    )
+    cached = not_modified(etag)
+    if cached is not None:
+        return cached
     conn = get_db_connection()
-    leaderboard = conn.execute('''
-        SELECT u.username, gs.score, gs.clicks 
-        FROM game_saves gs 
-        JOIN users u ON gs.user_id = u.id 
-        ORDER BY gs.score DESC
-    ''').fetchall()
-    conn.close()
+
+    if fmt in ('ndjson', 'json'):
+        limit = request.args.get('limit', type=int)
+        if limit is not None:
+            limit = max(0, limit)
+        rows = iter_leaderboard_rows(conn, after_score, after_id, limit)
+        if fmt == 'ndjson':
+            def generate():
+                for row in rows:
+                    yield json.dumps(dict(row)) + '\n'
+            mimetype = 'application/x-ndjson'
+        else:
+            def generate():
+                yield '['
+                first = True
+                for row in rows:
+                    yield ('' if first else ',') + json.dumps(dict(row))
+                    first = False
+                yield ']'
+            mimetype = 'application/json'
+        return with_etag(Response(stream_with_context(generate()), mimetype=mimetype), etag)
+
+    limit = request.args.get('limit', LEADERBOARD_PAGE_SIZE, type=int)
+    limit = max(1, min(limit, LEADERBOARD_MAX_PAGE_SIZE))
     
     user = None
+    neighbors = []
+    user_rank = None
     if 'user_id' in session:
-        conn = get_db_connection()
+        index = get_leaderboard_index()
+        neighbors = index.around(session['user_id'])
+        user_rank = index.rank(session['user_id'])
         user = conn.execute(
             'SELECT id, username, is_admin FROM users WHERE id = ?',
             (session['user_id'],)
         ).fetchone()
-        conn.close()
     
-    return render_template('leaderboard.html', leaderboard=leaderboard, user=user)
+    rows = response_cache.get(
+        ('leaderboard', after_score, after_id, limit),
+        lambda: [dict(row) for row in iter_leaderboard_rows(conn, after_score, after_id, limit)]
+    )
+    return with_etag(Response(stream_template(
+        'leaderboard.html',
+        leaderboard=rows,
+        limit=limit, first_page=after_score is None,
+        user=user, user_rank=user_rank, neighbors=neighbors
+    )), etag)
+
+@app.route('/leaderboard/stream')
+def leaderboard_stream():
+    """
+    Server-Sent Events feed of leaderboard changes. The first event is a
+    'snapshot' of the top `limit` rows; later 'diff' events carry the new
+    score and rank of every user that changed, coalesced per user. A client
+    reconnecting with Last-Event-ID only receives what it missed, or a
+    fresh snapshot if it fell too far behind.
+    """
+    # Load the index now: the generator runs without a request context
+    get_leaderboard_index()
+    limit = max(1, min(request.args.get('limit', 10, type=int), LEADERBOARD_MAX_PAGE_SIZE))
+    last_event_id = request.headers.get('Last-Event-ID', type=int)
+
+    def sse(event, version, data):
+        return f'id: {version}\nevent: {event}\ndata: {json.dumps(data)}\n\n'
+
+    def snapshot():
+        # Read the version first so nothing published meanwhile is missed;
+        # the index is looked up each time since a reload swaps it out
+        version = leaderboard_hub.version
+        return version, sse('snapshot', version, {'top': get_leaderboard_index().top(limit)})
+
+    def generate():
+        yield 'retry: 3000\n\n'
+        since = last_event_id
+        if since is None:
+            since, event = snapshot()
+            yield event
+        for version, changes in leaderboard_hub.listen(
+                since, LEADERBOARD_STREAM_HEARTBEAT, LEADERBOARD_STREAM_MIN_INTERVAL):
+            if changes is None:
+                _, event = snapshot()
+                yield event
+            elif changes:
+                yield sse('diff', version, {'changes': changes})
+            else:
+                yield ': keepalive\n\n'
+
+    # Reserve the slot only once the request has been parsed, and release it
+    # here if the response that would release it on close is never built
+    if not leaderboard_hub.try_subscribe():
+        return api_error('too many leaderboard subscribers', 503)
+    try:
+        response = Response(generate(), mimetype='text/event-stream')
+        response.headers['Cache-Control'] = 'no-cache'
+        response.headers['X-Accel-Buffering'] = 'no'
+        response.call_on_close(leaderboard_hub.unsubscribe)
+    except Exception:
+        leaderboard_hub.unsubscribe()
+        raise
+    return response
+
+@app.route('/leaderboard/top')
+def leaderboard_top():
+    """
+    Windowed leaderboard: the users who gained the most score in the last
+    hour, day, week or month, as JSON, summed from score history rollups
+    and up to SCORE_HISTORY_CACHE_TTL seconds old.
+    Query parameters:
+      window: 'hour', 'day', 'week' (default) or 'month'
+      limit: rows (default 10)
+    """
+    window = request.args.get('window', 'week')
+    if window not in score_history.WINDOWS:
+        return jsonify({'error': f'window must be one of {", ".join(score_history.WINDOWS)}'}), 400
+    limit = max(1, min(request.args.get('limit', 10, type=int), LEADERBOARD_MAX_PAGE_SIZE))
+    rows = history_cache.get(
+        ('leaderboard_top', window, limit),
+        lambda: score_history.top_gains(
+            get_db_connection(), shard_map, time.time() - score_history.WINDOWS[window],
+            limit=limit, retention=SCORE_HISTORY_RETENTION
+        )
+    )
+    return jsonify({'window': window, 'rows': rows})
+
+@app.route('/stream_stats')
+def stream_stats():
+    """
+    Admin-only JSON view of leaderboard stream hub metrics.
+    """
+    if not session.get('is_admin'):
+        return jsonify({'error': 'admin privileges required'}), 403
+    return jsonify(leaderboard_hub.stats())
 
 @app.route('/admin', methods=['GET', 'POST'])
 def admin():
@@ -229,16 +913,449 @@ def admin():
     
     if request.method == 'POST':
         if 'delete_user' in request.form:
-            user_id = request.form['user_id']
+            user_id = int(request.form['user_id'])
             conn.execute('DELETE FROM users WHERE id = ?', (user_id,))
+            shard_map.delete_rows(conn, [user_id])
             conn.commit()
+            get_leaderboard_index().remove(user_id)
+            publish_rank_change(user_id)
             flash('User deleted successfully', 'success')
-            logging.info(f'Admin deleted user {user_id}')
+            logging.info('Admin deleted user %s', user_id)
     
-    users = conn.execute('SELECT id, username, is_admin, created_at FROM users').fetchall()
-    conn.close()
-    
-    return render_template('admin.html', users=users)
+    return render_template('admin.html', **admin_user_page(conn))
+
+# Page size for the admin user listings
+ADMIN_PAGE_SIZE = 50
+ADMIN_MAX_PAGE_SIZE = 500
+
+def search_users(conn, prefix='', after_name=None, after_id=None, limit=ADMIN_PAGE_SIZE):
+    """
+    Users whose username starts with `prefix` (case-insensitive), with their
+    score, ordered by username and then id and starting after the
+    (after_name, after_id) cursor. The prefix match and the cursor are both
+    range scans on idx_users_username_nocase; scores are then looked up on
+    each user's shard.
+    """
+    clauses = []
+    params = []
+    if prefix:
+        escaped = prefix.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+        clauses.append("u.username LIKE ? ESCAPE '\\'")
+        params.append(escaped + '%')
+    if after_name is not None and after_id is not None:
+        clauses.append('u.username COLLATE NOCASE >= ? AND (u.username COLLATE NOCASE > ? OR u.id > ?)')
+        params.extend((after_name, after_name, after_id))
+    where = f'WHERE {" AND ".join(clauses)}' if clauses else ''
+    users = conn.execute(f'''
+        SELECT u.id, u.username, u.is_admin, u.created_at
+        FROM users u
+        {where}
+        ORDER BY u.username COLLATE NOCASE, u.id
+        LIMIT ?
+    ''', params + [limit]).fetchall()
+    saves = shard_map.select_by_user(conn, 'game_saves', ('score',), [user['id'] for user in users])
+    return [dict(user, score=saves[user['id']]['score'] if user['id'] in saves else None) for user in users]
+
+def admin_user_page(conn):
+    """
+    Template context for one page of the admin user listing, read from
+    the q, after_name, after_id and limit query parameters.
+    """
+    query = request.args.get('q', '').strip()
+    limit = max(1, min(request.args.get('limit', ADMIN_PAGE_SIZE, type=int), ADMIN_MAX_PAGE_SIZE))
+    users = search_users(
+        conn, query,
+        request.args.get('after_name'), request.args.get('after_id', type=int), limit
+    )
+    return {'users': users, 'query': query, 'limit': limit, 'has_next': len(users) == limit}
+
+def bulk_records():
+    """
+    Records from a bulk upload: the multipart `file` field, or else the raw
+    request body. The format comes from ?format=, the file name or the
+    content type, defaulting to NDJSON. Records are parsed lazily.
+    """
+    upload = request.files.get('file')
+    if upload is not None:
+        stream, default = upload.stream, guess_format(upload.filename)
+    else:
+        stream, default = request.stream, 'csv' if request.mimetype == 'text/csv' else 'ndjson'
+    fmt = request.args.get('format') or default
+    return read_records(io.TextIOWrapper(stream, encoding='utf-8', newline=''), fmt)
+
+def bulk_result(message, result):
+    """
+    Flash and go back to /admin for uploads from the admin page; return
+    JSON for raw-body API calls.
+    """
+    if request.files:
+        flash(message, 'success')
+        return redirect(url_for('admin'))
+    return jsonify(result)
+
+def bulk_error(message):
+    if request.files:
+        flash(message, 'error')
+        return redirect(url_for('admin'))
+    return jsonify({'error': message}), 400
+
+@app.route('/admin/bulk/scores', methods=['POST'])
+def bulk_scores():
+    """
+    Admin-only: apply a CSV/NDJSON file of score changes in one transaction.
+    Each record has user_id or username plus score (absolute) or delta.
+    """
+    if not session.get('is_admin'):
+        return jsonify({'error': 'admin privileges required'}), 403
+    overwritten = set()
+    try:
+        # Clicks queued before the change must not land on top of absolute scores
+        with click_batcher.paused():
+            updated, scores = apply_score_changes(get_db_connection(), shard_map, bulk_records(), overwritten)
+            click_batcher.discard(overwritten)
+            # The index already counts the clicks still queued for delta records
+            index = get_leaderboard_index()
+            for user_id, score in scores.items():
+                index.update(user_id, score + click_batcher.pending_for(user_id))
+    except ValueError as e:
+        return bulk_error(f'No scores changed: {e}')
+    for user_id in scores:
+        publish_rank_change(user_id)
+    logging.info('Admin bulk-updated %s scores', updated)
+    return bulk_result(f'Updated {updated} scores.', {'updated': updated})
+
+@app.route('/admin/bulk/delete', methods=['POST'])
+def bulk_delete():
+    """
+    Admin-only: delete the users named in a CSV/NDJSON file (user_id or
+    username per record) in one transaction.
+    """
+    if not session.get('is_admin'):
+        return jsonify({'error': 'admin privileges required'}), 403
+    try:
+        deleted, user_ids = delete_users(get_db_connection(), shard_map, bulk_records())
+    except ValueError as e:
+        return bulk_error(f'No users deleted: {e}')
+    index = get_leaderboard_index()
+    for user_id in user_ids:
+        if user_id in index:
+            index.remove(user_id)
+            publish_rank_change(user_id)
+    logging.info('Admin bulk-deleted %s users', deleted)
+    return bulk_result(f'Deleted {deleted} users.', {'deleted': deleted})
+
+@app.route('/admin/export/<table>')
+def export_table(table):
+    """
+    Admin-only streaming export of `users` (without passwords) or
+    `game_saves` as NDJSON (default) or CSV (?format=csv).
+    """
+    if not session.get('is_admin'):
+        return jsonify({'error': 'admin privileges required'}), 403
+    fmt = request.args.get('format', 'ndjson')
+    if table not in EXPORT_TABLES or fmt not in FORMATS:
+        return jsonify({'error': 'unknown table or format'}), 404
+    rows = export_rows(get_db_connection(), shard_map, table)
+    response = Response(
+        stream_with_context(format_rows(rows, EXPORT_TABLES[table][1], fmt)),
+        mimetype='text/csv' if fmt == 'csv' else 'application/x-ndjson',
+    )
+    response.headers['Content-Disposition'] = f'attachment; filename={table}.{fmt}'
+    return response
+
+# JSON API: token lifetime and per-batch validation limits
+API_TOKEN_MAX_AGE = 30 * 24 * 3600
+SYNC_MAX_CLICKS = 10_000
+SYNC_MAX_PURCHASES = 100
+SYNC_MAX_IDLE_SECONDS = int(os.environ.get('SYNC_MAX_IDLE_SECONDS', 8 * 3600))
+api_tokens = URLSafeTimedSerializer(app.secret_key, salt='api-token')
+
+# Save audits (shared/simulation.py): sustained clicks per second a save
+# may have, points it may hold above its ceiling, and most flagged saves
+# one response lists
+AUDIT_MAX_CLICKS_PER_SECOND = float(os.environ.get('AUDIT_MAX_CLICKS_PER_SECOND', MAX_CLICKS_PER_SECOND))
+AUDIT_TOLERANCE = int(os.environ.get('AUDIT_TOLERANCE', 0))
+AUDIT_MAX_LISTED = 1000
+
+_upgrade_catalog = None
+
+def get_upgrade_catalog():
+    """
+    Upgrade rules keyed by id. The catalog is static at runtime, so it is
+    read once per process.
+    """
+    global _upgrade_catalog
+    if _upgrade_catalog is None:
+        conn = get_db_connection()
+        rows = conn.execute('SELECT id, name, cost, increment, kind FROM upgrades').fetchall()
+        _upgrade_catalog = {row['id']: dict(row) for row in rows}
+    return _upgrade_catalog
+
+def owned_rates(owned):
+    """
+    (click_yield, passive_rate) for a {upgrade_id: quantity} mapping.
+    """
+    catalog = get_upgrade_catalog()
+    return compute_rates(
+        dict(catalog[upgrade_id], quantity=quantity)
+        for upgrade_id, quantity in owned.items() if upgrade_id in catalog
+    )
+
+def api_error(message, status=400):
+    return jsonify({'error': message}), status
+
+def api_user_id():
+    """
+    The caller's user id from an `Authorization: Bearer` token, falling
+    back to the browser session.
+    """
+    auth = request.headers.get('Authorization', '')
+    if auth.startswith('Bearer '):
+        try:
+            return api_tokens.loads(auth[len('Bearer '):], max_age=API_TOKEN_MAX_AGE)
+        except BadSignature:
+            return None
+    return session.get('user_id')
+
+def parse_sync_batch(data):
+    """
+    Validate a sync request body and return (seq, clicks, score, purchases).
+    Raises ValueError with a client-facing message on bad input.
+    """
+    def is_int(value):
+        return isinstance(value, int) and not isinstance(value, bool)
+    seq = data.get('seq')
+    clicks = data.get('clicks', 0)
+    score = data.get('score')
+    purchases = data.get('purchases', [])
+    if not is_int(seq) or seq < 1:
+        raise ValueError('seq must be a positive integer')
+    if not is_int(clicks) or not 0 <= clicks <= SYNC_MAX_CLICKS:
+        raise ValueError(f'clicks must be an integer between 0 and {SYNC_MAX_CLICKS}')
+    if score is not None and (not is_int(score) or score < 0):
+        raise ValueError('score must be a non-negative integer')
+    if not isinstance(purchases, list) or len(purchases) > SYNC_MAX_PURCHASES:
+        raise ValueError(f'purchases must be a list of at most {SYNC_MAX_PURCHASES} upgrade ids')
+    if not all(is_int(p) for p in purchases):
+        raise ValueError('purchases must contain upgrade ids')
+    return seq, clicks, score, purchases
+
+def sync_state(user_id, save, owned, rejected=()):
+    """
+    JSON response describing the authoritative state after a sync.
+    """
+    click_yield, passive_rate = owned_rates(owned)
+    return jsonify({
+        'seq': save['sync_seq'],
+        'score': save['score'] + click_batcher.pending_for(user_id),
+        'clicks': save['clicks'],
+        'upgrades': {str(upgrade_id): quantity for upgrade_id, quantity in owned.items()},
+        'click_yield': click_yield,
+        'passive_rate': passive_rate,
+        'rejected': list(rejected),
+    })
+
+@app.route('/api/v1/login', methods=['POST'])
+def api_login():
+    """
+    Exchange a username and password for a bearer token for the JSON API.
+    """
+    data = request.get_json(silent=True) or {}
+    username, password = data.get('username'), data.get('password')
+    if not isinstance(username, str) or not isinstance(password, str):
+        return api_error('username and password are required')
+    try:
+        user = authenticate(get_db_connection(), username, password)
+    except PasswordBusy:
+        return api_error('server busy, retry shortly', 503)
+    if not user:
+        logging.warning('Failed API login attempt for username: %s', data.get('username'))
+        return api_error('invalid credentials', 401)
+    logging.info('User %s logged in via API (id=%s)', user['username'], user['id'])
+    return jsonify({'token': api_tokens.dumps(user['id']), 'user_id': user['id']})
+
+@app.route('/api/v1/sync', methods=['GET', 'POST'])
+def api_sync():
+    """
+    GET: return the authoritative state (including the last applied seq).
+    POST: apply a batch of client actions and return the authoritative state.
+    Body: {"seq": n, "clicks": n, "score": n (optional), "purchases": [upgrade_id, ...]}
+    Clicks earn the server-computed click yield; a client-reported score
+    gain can only lower that. Purchases are applied in order and rejected
+    when unaffordable. A seq at or below the last applied one is treated
+    as a retry and only returns the current state.
+    """
+    user_id = api_user_id()
+    if user_id is None:
+        return api_error('authentication required', 401)
+    schema = shard_map.schema_for(user_id)
+    if request.method == 'GET':
+        conn = get_db_connection()
+        save = conn.execute(
+            f'SELECT score, clicks, sync_seq FROM {schema}.game_saves WHERE user_id = ?', (user_id,)
+        ).fetchone()
+        if save is None:
+            return api_error('no save for this user', 404)
+        owned = {
+            row['upgrade_id']: row['quantity']
+            for row in conn.execute(
+                f'SELECT upgrade_id, quantity FROM {schema}.user_upgrades WHERE user_id = ?', (user_id,)
+            )
+        }
+        return sync_state(user_id, save, owned)
+    try:
+        seq, clicks, score_gain, purchases = parse_sync_batch(request.get_json(silent=True) or {})
+    except ValueError as e:
+        return api_error(str(e))
+    catalog = get_upgrade_catalog()
+
+    conn = get_db_connection()
+    shard_map.lock_user(conn, user_id)
+    try:
+        save = conn.execute(
+            f'SELECT score, clicks, sync_seq FROM {schema}.game_saves WHERE user_id = ?', (user_id,)
+        ).fetchone()
+        if save is None:
+            conn.rollback()
+            return api_error('no save for this user', 404)
+        owned = {
+            row['upgrade_id']: row['quantity']
+            for row in conn.execute(
+                f'SELECT upgrade_id, quantity FROM {schema}.user_upgrades WHERE user_id = ?', (user_id,)
+            )
+        }
+        if seq <= save['sync_seq']:
+            conn.rollback()
+            return sync_state(user_id, save, owned)
+
+        # Credit passive income since the last write, then price the batch
+        settle_offline_progress(conn, max_offline_seconds=SYNC_MAX_IDLE_SECONDS, user_ids=[user_id],
+                                commit=False, schema=schema)
+        settled_score = conn.execute(
+            f'SELECT score FROM {schema}.game_saves WHERE user_id = ?', (user_id,)
+        ).fetchone()['score']
+        click_yield, _ = owned_rates(owned)
+        earned = clicks * click_yield
+        if score_gain is not None:
+            earned = min(earned, score_gain)
+        balance = settled_score + earned
+        bought = {}
+        rejected = []
+        for upgrade_id in purchases:
+            upgrade = catalog.get(upgrade_id)
+            if upgrade is None or balance < upgrade['cost']:
+                rejected.append(upgrade_id)
+                continue
+            balance -= upgrade['cost']
+            bought[upgrade_id] = bought.get(upgrade_id, 0) + 1
+            owned[upgrade_id] = owned.get(upgrade_id, 0) + 1
+
+        # Relative update so increments still queued in the click batcher are kept
+        conn.execute(f'''
+            UPDATE {schema}.game_saves
+            SET score = score + ?, clicks = clicks + ?, sync_seq = ?, last_updated = CURRENT_TIMESTAMP
+            WHERE user_id = ?
+        ''', (balance - settled_score, clicks, seq, user_id))
+        if bought:
+            conn.executemany(f'''
+                INSERT INTO {schema}.user_upgrades (user_id, upgrade_id, quantity) VALUES (?, ?, ?)
+                ON CONFLICT (user_id, upgrade_id) DO UPDATE SET quantity = quantity + excluded.quantity
+            ''', [(user_id, upgrade_id, count) for upgrade_id, count in bought.items()])
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+    get_leaderboard_index().increment(user_id, balance - save['score'])
+    publish_rank_change(user_id)
+    logging.info('User %s synced seq=%s clicks=%s purchases=%s rejected=%s',
+                 user_id, seq, clicks, sum(bought.values()), len(rejected))
+    new_save = {'score': balance, 'clicks': save['clicks'] + clicks, 'sync_seq': seq}
+    return sync_state(user_id, new_save, owned, rejected)
+
+# Most buckets one history request may return
+HISTORY_MAX_POINTS = 1440
+
+def history_range():
+    """
+    (resolution, since) from the resolution and points query parameters:
+    the last `points` buckets up to now.
+    """
+    resolution = request.args.get('resolution', 'hour')
+    if resolution not in score_history.RESOLUTIONS:
+        raise ValueError(f'resolution must be one of {", ".join(score_history.RESOLUTIONS)}')
+    points = max(1, min(request.args.get('points', 24, type=int), HISTORY_MAX_POINTS))
+    return resolution, time.time() - score_history.RESOLUTIONS[resolution] * points
+
+@app.route('/api/v1/history')
+def api_history():
+    """
+    The caller's score over time, one entry per `resolution` ('minute',
+    'hour' or 'day') bucket in which it changed, for the last `points`
+    buckets. Each entry has the score at the end of the bucket and the
+    score and clicks gained in it.
+    """
+    user_id = api_user_id()
+    if user_id is None:
+        return api_error('authentication required', 401)
+    try:
+        resolution, since = history_range()
+    except ValueError as e:
+        return api_error(str(e))
+    rows = score_history.series(get_db_connection(), shard_map, user_id, resolution, since)
+    return jsonify({'resolution': resolution, 'points': rows})
+
+@app.route('/admin/activity')
+def admin_activity():
+    """
+    Admin-only: score and clicks gained, events and active players across
+    all users per `resolution` bucket, for the last `points` buckets.
+    """
+    if not session.get('is_admin'):
+        return jsonify({'error': 'admin privileges required'}), 403
+    try:
+        resolution, since = history_range()
+    except ValueError as e:
+        return api_error(str(e))
+    rows = score_history.activity(get_db_connection(), shard_map, resolution, since)
+    return jsonify({'resolution': resolution, 'points': rows})
+
+@app.route('/admin/audit', methods=['GET', 'POST'])
+def admin_audit():
+    """
+    Admin-only: check every save against the most its clicks, account age
+    and upgrades could have earned on top of its trusted baseline score.
+    GET returns the flagged saves, largest excess first, up to `limit`;
+    POST with confirm=1 also lowers flagged scores to their ceiling,
+    logging each score before so `python -m shared.simulation DATABASE.db
+    restore` can undo it.
+    """
+    if not session.get('is_admin'):
+        return jsonify({'error': 'admin privileges required'}), 403
+    limit = max(1, min(request.args.get('limit', 100, type=int), AUDIT_MAX_LISTED))
+    clamp = request.method == 'POST'
+    if clamp and request.values.get('confirm') != '1':
+        return jsonify({'error': 'clamping lowers scores; repeat with confirm=1, or GET for a dry run'}), 400
+    started = int(time.time())
+    # Queued clicks count towards the ceiling
+    click_batcher.flush()
+    simulator = SaveSimulator(get_upgrade_catalog().values(), max_clicks_per_second=AUDIT_MAX_CLICKS_PER_SECOND,
+                              tolerance=AUDIT_TOLERANCE)
+    conn = get_db_connection()
+    flagged = audit(conn, shard_map, simulator, now=started, clamp=clamp)
+    clamped = [row['user_id'] for row in flagged if row['excess']] if clamp else []
+    if clamped:
+        index = get_leaderboard_index()
+        # Clicks queued since the flush are already in the index
+        with click_batcher.paused():
+            for user_id, row in shard_map.select_by_user(conn, 'game_saves', ('score',), clamped).items():
+                index.update(user_id, row[1] + click_batcher.pending_for(user_id))
+        for user_id in clamped:
+            publish_rank_change(user_id)
+        logging.info('Admin clamped %s implausible scores; undo with restore --since %s',
+                     len(clamped), started)
+    flagged.sort(key=lambda row: (-row['excess'], row['user_id']))
+    return jsonify({'flagged': len(flagged), 'clamped': len(clamped), 'saves': flagged[:limit]})
 
 if __name__ == '__main__':
     app.run(debug=True)
\ No newline at end of file
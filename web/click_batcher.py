@@ -0,0 +1,193 @@
+import contextlib
+import logging
+import threading
+import time
+
+
+class ClickBatcher:
+    """
+    Write-behind aggregator for score increments.
+
+    Clicks are coalesced per user_id in memory, as points and a click
+    count, and written by a background thread in a single executemany()
+    transaction per shard, either every `flush_interval_ms` or as soon as
+    `max_pending` clicks are waiting.
+    Call stop() on shutdown to flush whatever is still pending. `on_flush`,
+    if given, is called after every batch that reaches the database.
+    Writes that overwrite scores run inside paused() and discard() the
+    overwritten users' increments, so a flush never adds them on top.
+    """
+
+    def __init__(self, pool, flush_interval_ms=200, max_pending=500, on_flush=None, shards=None):
+        self.pool = pool
+        self.shards = shards
+        self.on_flush = on_flush
+        self.flush_interval_ms = flush_interval_ms
+        self.max_pending = max_pending
+        # user_id: [points, clicks]
+        self._pending = {}
+        self._pending_clicks = 0
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = False
+        self._thread = None
+        # Metrics
+        self._flushes = 0
+        self._flushed_clicks = 0
+        self._flushed_points = 0
+        self._failed_flushes = 0
+        self._last_batch_size = 0
+        self._max_batch_size = 0
+        self._flush_time_total = 0.0
+        self._flush_time_max = 0.0
+        self._max_queue_depth = 0
+
+    def _ensure_started(self):
+        if self._thread is None:
+            self._thread = threading.Thread(
+                target=self._run, name='click-batcher', daemon=True
+            )
+            self._thread.start()
+
+    def add(self, user_id, amount=1):
+        """
+        Queue one click worth `amount` score points for `user_id`.
+        """
+        with self._lock:
+            if self._stopping:
+                raise RuntimeError('ClickBatcher is stopped')
+            self._ensure_started()
+            pending = self._pending.setdefault(user_id, [0, 0])
+            pending[0] += amount
+            pending[1] += 1
+            self._pending_clicks += 1
+            self._max_queue_depth = max(self._max_queue_depth, self._pending_clicks)
+            full = self._pending_clicks >= self.max_pending
+        if full:
+            self._wakeup.set()
+
+    def pending_for(self, user_id):
+        """
+        Points queued for `user_id` that have not reached the database yet.
+        """
+        with self._lock:
+            return self._pending.get(user_id, (0, 0))[0]
+
+    def discard(self, user_ids):
+        """
+        Drop the increments queued for `user_ids`. Call it inside paused(),
+        after overwriting their scores, so no flush already holding them
+        can still write them.
+        """
+        with self._lock:
+            for user_id in user_ids:
+                pending = self._pending.pop(user_id, None)
+                if pending is not None:
+                    self._pending_clicks -= pending[1]
+
+    @contextlib.contextmanager
+    def paused(self):
+        """
+        Hold off flushes, waiting for one in progress to finish, until the
+        block exits.
+        """
+        with self._flush_lock:
+            yield
+
+    def _run(self):
+        interval = self.flush_interval_ms / 1000.0
+        while True:
+            self._wakeup.wait(interval)
+            self._wakeup.clear()
+            if self._stopping:
+                return
+            try:
+                self.flush()
+            except Exception as e:
+                logging.error('Click batch flush failed: %s', e)
+
+    def flush(self):
+        """
+        Write all pending increments in one transaction per shard. On
+        failure the increments not yet committed are merged back into the
+        pending set so no clicks are lost or applied twice.
+        """
+        with self._flush_lock:
+            with self._lock:
+                if not self._pending:
+                    return 0
+                batch = self._pending
+                batch_clicks = self._pending_clicks
+                self._pending = {}
+                self._pending_clicks = 0
+            start = time.perf_counter()
+            batch_size = len(batch)
+            batch_points = sum(points for points, _ in batch.values())
+            groups = self.shards.group(batch) if self.shards is not None else {'main': list(batch)}
+            conn = self.pool.acquire()
+            try:
+                for schema, user_ids in groups.items():
+                    conn.executemany(
+                        f'UPDATE {schema}.game_saves SET score = score + ?, clicks = clicks + ? WHERE user_id = ?',
+                        [(*batch[user_id], user_id) for user_id in user_ids]
+                    )
+                    conn.commit()
+                    for user_id in user_ids:
+                        del batch[user_id]
+            except Exception:
+                with self._lock:
+                    self._failed_flushes += 1
+                    for user_id, (amount, clicks) in batch.items():
+                        pending = self._pending.setdefault(user_id, [0, 0])
+                        pending[0] += amount
+                        pending[1] += clicks
+                        self._pending_clicks += clicks
+                raise
+            finally:
+                self.pool.release(conn)
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self._flushes += 1
+                self._flushed_clicks += batch_clicks
+                self._flushed_points += batch_points
+                self._last_batch_size = batch_size
+                self._max_batch_size = max(self._max_batch_size, batch_size)
+                self._flush_time_total += elapsed
+                self._flush_time_max = max(self._flush_time_max, elapsed)
+            if self.on_flush is not None:
+                self.on_flush()
+            return batch_clicks
+
+    def stop(self):
+        """
+        Stop the background thread and durably flush remaining clicks.
+        """
+        with self._lock:
+            self._stopping = True
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.flush()
+
+    def stats(self):
+        """
+        Snapshot of batching knobs and metrics.
+        """
+        with self._lock:
+            flushes = self._flushes
+            return {
+                'flush_interval_ms': self.flush_interval_ms,
+                'max_pending': self.max_pending,
+                'queue_depth': self._pending_clicks,
+                'queue_users': len(self._pending),
+                'max_queue_depth': self._max_queue_depth,
+                'flushes': flushes,
+                'failed_flushes': self._failed_flushes,
+                'flushed_clicks': self._flushed_clicks,
+                'flushed_points': self._flushed_points,
+                'last_batch_size': self._last_batch_size,
+                'max_batch_size': self._max_batch_size,
+                'flush_latency_avg': self._flush_time_total / flushes if flushes else 0.0,
+                'flush_latency_max': self._flush_time_max,
+            }
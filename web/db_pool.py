@@ -0,0 +1,137 @@
+import sqlite3
+import threading
+import time
+import queue
+
+
+class PoolTimeout(Exception):
+    """Raised when no pooled connection becomes free within the checkout timeout."""
+
+
+class ConnectionPool:
+    """
+    Fixed-size pool of SQLite connections shared by all request threads.
+
+    Connections are opened lazily up to `size`, configured once with WAL
+    journaling and the tuning pragmas, and handed out LIFO so the most
+    recently used (warmest) handle is reused first. Foreign keys are
+    enforced on every connection. `setup`, if given, is called with each
+    new connection after the pragmas (e.g. to attach shard files).
+    """
+
+    def __init__(self, db_path, size=8, timeout=5.0, busy_timeout_ms=5000,
+                 mmap_size=64 * 1024 * 1024, setup=None):
+        self.db_path = db_path
+        self.setup = setup
+        self.size = size
+        self.timeout = timeout
+        self.busy_timeout_ms = busy_timeout_ms
+        self.mmap_size = mmap_size
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._open = 0
+        self._in_use = 0
+        self._checkouts = 0
+        self._wait_time = 0.0
+        self._max_wait = 0.0
+        self._timeouts = 0
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute(f'PRAGMA busy_timeout={int(self.busy_timeout_ms)}')
+        conn.execute(f'PRAGMA mmap_size={int(self.mmap_size)}')
+        conn.execute('PRAGMA foreign_keys=ON')
+        if self.setup is not None:
+            self.setup(conn)
+        return conn
+
+    def acquire(self):
+        """
+        Check out a connection, opening a new one if the pool is not yet full
+        and otherwise waiting up to `timeout` seconds for one to be released.
+        """
+        start = time.perf_counter()
+        conn = None
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                can_open = self._open < self.size
+                if can_open:
+                    self._open += 1
+            if can_open:
+                try:
+                    conn = self._connect()
+                except Exception:
+                    with self._lock:
+                        self._open -= 1
+                    raise
+            else:
+                try:
+                    conn = self._idle.get(timeout=self.timeout)
+                except queue.Empty:
+                    with self._lock:
+                        self._timeouts += 1
+                    raise PoolTimeout(
+                        f'No database connection available after {self.timeout}s'
+                    )
+        waited = time.perf_counter() - start
+        with self._lock:
+            self._in_use += 1
+            self._checkouts += 1
+            self._wait_time += waited
+            self._max_wait = max(self._max_wait, waited)
+        return conn
+
+    def release(self, conn):
+        """
+        Return a connection to the pool, rolling back any transaction the
+        caller left open so the next user starts clean.
+        """
+        try:
+            conn.rollback()
+        except sqlite3.Error:
+            # A broken handle is dropped rather than recycled
+            conn.close()
+            with self._lock:
+                self._open -= 1
+                self._in_use -= 1
+            return
+        with self._lock:
+            self._in_use -= 1
+        self._idle.put(conn)
+
+    def close_all(self):
+        """
+        Close every idle connection. Connections still checked out are closed
+        when they come back only if the pool is used again afterwards.
+        """
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+            with self._lock:
+                self._open -= 1
+
+    def stats(self):
+        """
+        Snapshot of pool metrics: checkouts, wait time and handle counts.
+        """
+        with self._lock:
+            checkouts = self._checkouts
+            return {
+                'size': self.size,
+                'open': self._open,
+                'in_use': self._in_use,
+                'idle': self._open - self._in_use,
+                'checkouts': checkouts,
+                'timeouts': self._timeouts,
+                'wait_time_total': self._wait_time,
+                'wait_time_avg': self._wait_time / checkouts if checkouts else 0.0,
+                'wait_time_max': self._max_wait,
+            }
@@ -0,0 +1,95 @@
+"""
+Gunicorn settings for serving web/app.py in production:
+
+    pip install gunicorn
+    gunicorn -c web/gunicorn.conf.py
+
+Runs WEB_WORKERS processes (default one per CPU) with WEB_THREADS threads
+each, so CPU-bound request handling is not serialized by one GIL.
+
+SQLite concurrency: every worker imports the app after the fork and opens
+its own pool of WAL connections. Readers never block each other or the
+writer. Writers take the database's single write lock in turn, waiting up
+to DB_BUSY_TIMEOUT_MS for it. Every write transaction starts with its
+write statement, so a waiting writer never has to retry. Clicks are
+batched per worker into one short transaction per flush, so the lock is
+held briefly and rarely. Per-process state is made safe for several
+workers below: the leaderboard index is periodically rebuilt, which also
+pushes the other workers' rank changes to this worker's stream
+subscribers, and logs go to stderr instead of one rotating file.
+
+Streams: gthread ties one thread to every open /leaderboard/stream
+connection for as long as it stays open, so the thousands of idle
+subscribers the hub allows under a single process (the
+LEADERBOARD_STREAM_MAX_SUBSCRIBERS default of 5000) do not fit here.
+Unless LEADERBOARD_STREAM_MAX_SUBSCRIBERS is set, this config caps streams
+at half of WEB_THREADS per worker (2 with the default 4 threads) so they
+never starve other requests, and logs the cap at startup; clients over it
+get 503. To serve many stream clients, run a second group with this
+config and many threads, e.g.
+
+    WEB_BIND=127.0.0.1:8001 WEB_THREADS=1000 DB_POOL_SIZE=8 \
+        LEADERBOARD_STREAM_MAX_SUBSCRIBERS=900 gunicorn -c web/gunicorn.conf.py
+
+and route /leaderboard/stream to it from the proxy in front.
+
+Rate limits per client IP: the default bind is loopback only, which
+assumes a reverse proxy in front, so unless TRUSTED_PROXY_HOPS is set this
+config trusts one proxy hop of X-Forwarded-For when every WEB_BIND address
+is loopback. Otherwise every client would share the proxy's bucket.
+
+SIGTERM (or SIGINT) stops accepting connections and lets in-flight
+requests finish within WEB_GRACEFUL_TIMEOUT. Each worker then flushes its
+queued clicks in worker_exit before it exits.
+"""
+import os
+import sys
+
+WEB_DIR = os.path.dirname(os.path.abspath(__file__))
+
+wsgi_app = 'app:app'
+pythonpath = WEB_DIR
+bind = os.environ.get('WEB_BIND', '127.0.0.1:8000').split(',')
+workers = int(os.environ.get('WEB_WORKERS', os.cpu_count() or 1))
+worker_class = 'gthread'
+threads = int(os.environ.get('WEB_THREADS', 4))
+timeout = int(os.environ.get('WEB_TIMEOUT', 30))
+graceful_timeout = int(os.environ.get('WEB_GRACEFUL_TIMEOUT', 30))
+keepalive = int(os.environ.get('WEB_KEEPALIVE', 5))
+max_requests = int(os.environ.get('WEB_MAX_REQUESTS', 0))
+max_requests_jitter = max_requests // 10
+accesslog = os.environ.get('WEB_ACCESS_LOG') or None
+# The click batcher, log writer and password pool start threads when the
+# app is imported, and threads do not survive fork(), so never preload.
+preload_app = False
+
+# Workers inherit these defaults; anything set explicitly wins
+if workers > 1:
+    os.environ.setdefault('LEADERBOARD_RELOAD_SECONDS', '5')
+    # Several processes rotating one file lose records at rollover
+    os.environ.setdefault('LOG_FILE', '')
+# Only a proxy on this host can reach a loopback bind, so its
+# X-Forwarded-For names the client
+if all(address.startswith(('127.', 'localhost:', '[::1]:')) for address in bind):
+    os.environ.setdefault('TRUSTED_PROXY_HOPS', '1')
+# A thread beyond the pool size would only wait for a connection
+os.environ.setdefault('DB_POOL_SIZE', str(max(8, threads)))
+# Each /leaderboard/stream client holds a thread; leave some for everyone
+# else (see the docstring for serving many streams)
+os.environ.setdefault('LEADERBOARD_STREAM_MAX_SUBSCRIBERS', str(max(1, threads // 2)))
+
+
+def when_ready(server):
+    server.log.info(
+        '/leaderboard/stream is capped at %s subscribers per worker (LEADERBOARD_STREAM_MAX_SUBSCRIBERS)',
+        os.environ['LEADERBOARD_STREAM_MAX_SUBSCRIBERS']
+    )
+
+
+def worker_exit(server, worker):
+    """
+    Flush queued clicks and stop background threads before the worker exits.
+    """
+    app = sys.modules.get('app')
+    if app is not None:
+        app.shutdown()
@@ -1,30 +1,17 @@
+import os
 import sqlite3
+import sys
 
-conn = sqlite3.connect('DATABASE.db')
-c = conn.cursor()
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from shared.migrations import migrate, SCHEMA_VERSION
 
-# Create users table
-c.execute('''
-CREATE TABLE IF NOT EXISTS users (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    username TEXT UNIQUE NOT NULL,
-    password TEXT NOT NULL,
-    is_admin INTEGER DEFAULT 0,
-    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-)
-''')
+conn = sqlite3.connect(os.environ.get('DATABASE', 'DATABASE.db'))
 
-# Create game_saves table
-c.execute('''
-CREATE TABLE IF NOT EXISTS game_saves (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    user_id INTEGER NOT NULL,
-    score INTEGER DEFAULT 0,
-    clicks INTEGER DEFAULT 0,
-    FOREIGN KEY(user_id) REFERENCES users(id)
-)
-''')
+# Create or upgrade every table and index to the current schema version
+applied = migrate(conn)
 
-conn.commit()
 conn.close()
-print('Database initialized.')
+if applied:
+    print(f'Database initialized (applied migrations {applied}, schema v{SCHEMA_VERSION}).')
+else:
+    print(f'Database already at schema v{SCHEMA_VERSION}.')
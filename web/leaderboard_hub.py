@@ -0,0 +1,114 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class LeaderboardHub:
+    """
+    In-process pub/sub hub for leaderboard changes.
+
+    Instead of one queue per subscriber, the hub keeps a single version
+    counter and the latest change per user_id, ordered by version. A
+    subscriber remembers the last version it saw and, when woken, collects
+    everything newer. Repeated changes to the same user are therefore
+    coalesced for free, an idle subscriber costs one blocked wait on a
+    shared Condition, and a slow subscriber never builds up a backlog: if it
+    falls behind the retained history it is told to resync from a snapshot.
+
+    The hub itself keeps `max_subscribers` idle streams cheaply, but the
+    server must also hold one open connection per subscriber: under
+    gunicorn's gthread workers each takes a whole thread, so
+    web/gunicorn.conf.py caps streams at half the worker's threads unless
+    told otherwise.
+    """
+
+    def __init__(self, history=4096, max_subscribers=5000):
+        self.history = history
+        self.max_subscribers = max_subscribers
+        self._cond = threading.Condition()
+        self._version = 0
+        # user_id -> (version, change), oldest version first
+        self._changes = OrderedDict()
+        # Changes at or below this version have been dropped from history
+        self._floor = 0
+        self._subscribers = 0
+        self._published = 0
+        self._resyncs = 0
+
+    @property
+    def version(self):
+        return self._version
+
+    def publish(self, change):
+        """
+        Record `change` (a dict with at least user_id) and wake subscribers.
+        """
+        with self._cond:
+            self._version += 1
+            self._published += 1
+            user_id = change['user_id']
+            self._changes.pop(user_id, None)
+            self._changes[user_id] = (self._version, change)
+            while len(self._changes) > self.history:
+                _, (version, _) = self._changes.popitem(last=False)
+                self._floor = version
+            self._cond.notify_all()
+
+    def _since(self, version):
+        # Walk back from the newest change; history is ordered by version
+        if version < self._floor or version > self._version:
+            return None
+        changes = []
+        for seen, change in reversed(self._changes.values()):
+            if seen <= version:
+                break
+            changes.append(change)
+        changes.reverse()
+        return changes
+
+    def try_subscribe(self):
+        """
+        Reserve a subscriber slot; False when the hub is full.
+        """
+        with self._cond:
+            if self._subscribers >= self.max_subscribers:
+                return False
+            self._subscribers += 1
+            return True
+
+    def unsubscribe(self):
+        with self._cond:
+            self._subscribers -= 1
+
+    def listen(self, since, heartbeat=15.0, min_interval=0.0):
+        """
+        Yield (version, changes) for every batch of changes after `since`.
+        `changes` is None when the subscriber fell behind the retained
+        history and must resync from a snapshot, and an empty list on an
+        idle heartbeat. `min_interval` spaces out batches so bursts are
+        coalesced into one message per interval.
+        """
+        version = since
+        while True:
+            with self._cond:
+                if self._version == version:
+                    self._cond.wait(heartbeat)
+                current = self._version
+                changes = self._since(version) if current != version else []
+                if changes is None:
+                    self._resyncs += 1
+            version = current
+            yield version, changes
+            if min_interval and changes:
+                time.sleep(min_interval)
+
+    def stats(self):
+        with self._cond:
+            return {
+                'version': self._version,
+                'subscribers': self._subscribers,
+                'max_subscribers': self.max_subscribers,
+                'published': self._published,
+                'retained_changes': len(self._changes),
+                'resyncs': self._resyncs,
+            }
@@ -0,0 +1,115 @@
+import atexit
+import json
+import logging
+import queue
+import threading
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+TEXT_FORMAT = '%(asctime)s %(levelname)s %(message)s'
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    One JSON object per line: time, level, logger, thread, message and any
+    traceback. The message is only interpolated here, on the listener thread.
+    """
+
+    def format(self, record):
+        entry = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'thread': record.threadName,
+            'message': record.getMessage(),
+        }
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exc'] = record.exc_text
+        return json.dumps(entry)
+
+
+class DroppingQueueHandler(QueueHandler):
+    """
+    QueueHandler over a bounded queue that never blocks the caller: when the
+    queue is full the record is dropped and counted per level. Records are
+    enqueued unformatted; only a traceback is rendered up front, because the
+    exception state does not survive the handoff to the listener thread.
+    """
+
+    def __init__(self, maxsize=10000):
+        super().__init__(queue.Queue(maxsize))
+        self._lock = threading.Lock()
+        self._enqueued = 0
+        self._dropped = {}
+        self._max_depth = 0
+
+    def prepare(self, record):
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with self._lock:
+                self._dropped[record.levelname] = self._dropped.get(record.levelname, 0) + 1
+            return
+        depth = self.queue.qsize()
+        with self._lock:
+            self._enqueued += 1
+            self._max_depth = max(self._max_depth, depth)
+
+    def stats(self):
+        with self._lock:
+            stats = {
+                'queue_size': self.queue.maxsize,
+                'queue_depth': self.queue.qsize(),
+                'max_queue_depth': self._max_depth,
+                'enqueued': self._enqueued,
+                'dropped': sum(self._dropped.values()),
+            }
+            for level, count in self._dropped.items():
+                stats[f'dropped_{level.lower()}'] = count
+            return stats
+
+
+class BlockingStopListener(QueueListener):
+    """
+    QueueListener whose stop() waits for room in a full bounded queue
+    instead of raising, so every record queued before shutdown is written.
+    """
+
+    def enqueue_sentinel(self):
+        self.queue.put(self._sentinel)
+
+
+def setup_logging(path='app.log', max_bytes=1_000_000, backup_count=5, mode='async',
+                  fmt='json', queue_size=10000, level=logging.INFO):
+    """
+    Configure the root logger to write to a rotating `path` and stderr, or
+    to stderr alone when `path` is None.
+
+    In 'async' mode callers only enqueue records on a DroppingQueueHandler;
+    a QueueListener thread formats them, writes them and does file rollover.
+    The listener is flushed and stopped at exit. In 'sync' mode the handlers
+    are attached directly, as before. Returns the queue handler (whose
+    stats() reports drops) or None in sync mode.
+    """
+    formatter = JsonFormatter() if fmt == 'json' else logging.Formatter(TEXT_FORMAT)
+    handlers = [logging.StreamHandler()]
+    if path is not None:
+        handlers.insert(0, RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backup_count))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+    if mode != 'async':
+        logging.basicConfig(level=level, handlers=handlers, force=True)
+        return None
+    queue_handler = DroppingQueueHandler(queue_size)
+    listener = BlockingStopListener(queue_handler.queue, *handlers, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    logging.basicConfig(level=level, handlers=[queue_handler], force=True)
+    return queue_handler
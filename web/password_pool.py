@@ -0,0 +1,83 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class PasswordBusy(Exception):
+    """Raised when too many password hashes are already queued."""
+
+
+class PasswordPool:
+    """
+    Bounded worker pool for password hashing and verification.
+
+    hashlib's scrypt and PBKDF2 release the GIL, so `workers` threads hash
+    in parallel while capping how many cores logins can take from other
+    requests. At most `max_pending` jobs may be running or queued; beyond
+    that PasswordBusy is raised at once instead of queueing more work.
+    Verifications found in the hasher's cache skip the pool entirely.
+    """
+
+    def __init__(self, hasher, workers=2, max_pending=64):
+        self.hasher = hasher
+        self.workers = workers
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='password')
+        self._lock = threading.Lock()
+        self._pending = 0
+        # Hashed on the pool as soon as it starts, so no login pays for it
+        self._dummy_hash = self._executor.submit(hasher.hash, 'dummy password')
+        # Metrics
+        self._jobs = 0
+        self._rejected = 0
+        self._wait_time = 0.0
+        self._max_wait = 0.0
+
+    def _run(self, fn, *args):
+        with self._lock:
+            if self._pending >= self.max_pending:
+                self._rejected += 1
+                raise PasswordBusy('too many password operations in progress')
+            self._pending += 1
+        start = time.perf_counter()
+        try:
+            return self._executor.submit(fn, *args).result()
+        finally:
+            waited = time.perf_counter() - start
+            with self._lock:
+                self._pending -= 1
+                self._jobs += 1
+                self._wait_time += waited
+                self._max_wait = max(self._max_wait, waited)
+
+    def hash(self, password):
+        return self._run(self.hasher.hash, password)
+
+    def verify(self, password, stored):
+        if self.hasher.is_cached(password, stored):
+            return True
+        return self._run(self.hasher.verify, password, stored)
+
+    def verify_missing_user(self, password):
+        """
+        Spend the same work as a real verification when the username does
+        not exist, so response times do not reveal which accounts exist.
+        Always returns False.
+        """
+        self._run(self.hasher.verify, password, self._dummy_hash.result())
+        return False
+
+    def stats(self):
+        with self._lock:
+            jobs = self._jobs
+            stats = {
+                'workers': self.workers,
+                'max_pending': self.max_pending,
+                'pending': self._pending,
+                'jobs': jobs,
+                'rejected': self._rejected,
+                'latency_avg': self._wait_time / jobs if jobs else 0.0,
+                'latency_max': self._max_wait,
+            }
+        stats.update(self.hasher.stats())
+        return stats
@@ -0,0 +1,68 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class RateLimiter:
+    """
+    Token buckets for many keys in one bounded LRU map.
+
+    Each bucket is a (tokens, last_refill) pair keyed by whatever the caller
+    passes, refilled lazily on access, so a check is one dict lookup and a
+    little arithmetic under a lock. When more than `max_keys` buckets exist
+    the least recently used is evicted; a returning client then starts with
+    a full bucket, which only ever errs on the side of allowing.
+    """
+
+    def __init__(self, max_keys=100_000):
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+        # Metrics
+        self._allowed = 0
+        self._limited = 0
+        self._evictions = 0
+
+    def check(self, limits, now=None):
+        """
+        Take one token from every bucket in `limits`, an iterable of
+        (key, rate_per_second, burst), if all of them have one. Returns 0.0
+        when allowed, else the seconds until the request would be allowed;
+        a rejected request consumes nothing.
+        """
+        now = time.monotonic() if now is None else now
+        buckets = self._buckets
+        with self._lock:
+            refilled = []
+            retry_after = 0.0
+            for key, rate, burst in limits:
+                entry = buckets.get(key)
+                if entry is None:
+                    tokens = burst
+                else:
+                    tokens = min(burst, entry[0] + (now - entry[1]) * rate)
+                    buckets.move_to_end(key)
+                if tokens < 1:
+                    retry_after = max(retry_after, (1 - tokens) / rate)
+                refilled.append((key, tokens))
+            spend = 0 if retry_after else 1
+            for key, tokens in refilled:
+                buckets[key] = (tokens - spend, now)
+            while len(buckets) > self.max_keys:
+                buckets.popitem(last=False)
+                self._evictions += 1
+            if retry_after:
+                self._limited += 1
+            else:
+                self._allowed += 1
+            return retry_after
+
+    def stats(self):
+        with self._lock:
+            return {
+                'max_keys': self.max_keys,
+                'keys': len(self._buckets),
+                'allowed': self._allowed,
+                'limited': self._limited,
+                'evictions': self._evictions,
+            }
@@ -0,0 +1,162 @@
+import threading
+import time
+from collections import deque
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+class _Series:
+    """
+    Count, sum and a sliding window of recent samples for one label set.
+    Quantiles are computed from the window when metrics are scraped.
+    """
+    __slots__ = ('count', 'total', 'window')
+
+    def __init__(self, window):
+        self.count = 0
+        self.total = 0.0
+        self.window = deque(maxlen=window)
+
+    def add(self, value):
+        self.count += 1
+        self.total += value
+        self.window.append(value)
+
+    def quantiles(self):
+        samples = sorted(self.window)
+        if not samples:
+            return [(q, 0.0) for q in QUANTILES]
+        return [(q, samples[min(int(q * len(samples)), len(samples) - 1)]) for q in QUANTILES]
+
+
+class InstrumentedConnection:
+    """
+    Proxy around a pooled sqlite3 connection that counts and times every
+    execute()/executemany() into a RequestStats. Only the statement call is
+    timed; rows fetched afterwards from the returned cursor are not.
+    """
+
+    def __init__(self, conn, stats):
+        self._conn = conn
+        self._stats = stats
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def unwrap(self):
+        return self._conn
+
+    def execute(self, *args):
+        start = time.perf_counter()
+        try:
+            return self._conn.execute(*args)
+        finally:
+            self._stats.sql_statements += 1
+            self._stats.sql_seconds += time.perf_counter() - start
+
+    def executemany(self, *args):
+        start = time.perf_counter()
+        try:
+            return self._conn.executemany(*args)
+        finally:
+            self._stats.sql_statements += 1
+            self._stats.sql_seconds += time.perf_counter() - start
+
+
+class RequestStats:
+    """
+    Per-request counters filled in while the request runs.
+    """
+    __slots__ = ('start', 'sql_statements', 'sql_seconds', 'connections', 'render_starts')
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.sql_statements = 0
+        self.sql_seconds = 0.0
+        self.connections = 0
+        self.render_starts = []
+
+
+class RequestMetrics:
+    """
+    Process-wide request metrics: latency, SQL statement count and time,
+    and connection checkouts per endpoint, plus render time per template.
+    render() emits them in the Prometheus text exposition format, with
+    p50/p95/p99 over the last `window` samples of each series.
+    """
+
+    def __init__(self, prefix='app', window=1024):
+        self.prefix = prefix
+        self.window = window
+        self._lock = threading.Lock()
+        self._latency = {}
+        self._sql_seconds = {}
+        self._sql_statements = {}
+        self._render = {}
+        self._connections = {}
+        self._errors = {}
+
+    def _series(self, table, key):
+        series = table.get(key)
+        if series is None:
+            series = table[key] = _Series(self.window)
+        return series
+
+    def record_request(self, endpoint, stats, failed=False):
+        elapsed = time.perf_counter() - stats.start
+        with self._lock:
+            self._series(self._latency, endpoint).add(elapsed)
+            self._series(self._sql_seconds, endpoint).add(stats.sql_seconds)
+            self._series(self._sql_statements, endpoint).add(stats.sql_statements)
+            self._connections[endpoint] = self._connections.get(endpoint, 0) + stats.connections
+            if failed:
+                self._errors[endpoint] = self._errors.get(endpoint, 0) + 1
+        return elapsed
+
+    def record_render(self, template, seconds):
+        with self._lock:
+            self._series(self._render, template).add(seconds)
+
+    def render(self, gauges=None):
+        """
+        Prometheus text format. `gauges` maps a subsystem name to a flat
+        dict of numeric stats (e.g. db_pool.stats()) exported as gauges.
+        """
+        lines = []
+
+        def summary(name, help_text, label, table):
+            metric = f'{self.prefix}_{name}'
+            lines.append(f'# HELP {metric} {help_text}')
+            lines.append(f'# TYPE {metric} summary')
+            for key, series in sorted(table.items()):
+                labels = f'{label}="{_escape(key)}"'
+                for q, value in series.quantiles():
+                    lines.append(f'{metric}{{{labels},quantile="{q}"}} {value}')
+                lines.append(f'{metric}_sum{{{labels}}} {series.total}')
+                lines.append(f'{metric}_count{{{labels}}} {series.count}')
+
+        def counter(name, help_text, label, table):
+            metric = f'{self.prefix}_{name}'
+            lines.append(f'# HELP {metric} {help_text}')
+            lines.append(f'# TYPE {metric} counter')
+            for key, value in sorted(table.items()):
+                lines.append(f'{metric}{{{label}="{_escape(key)}"}} {value}')
+
+        with self._lock:
+            summary('request_duration_seconds', 'Request latency by endpoint.', 'endpoint', self._latency)
+            summary('request_sql_seconds', 'Time spent executing SQL per request.', 'endpoint', self._sql_seconds)
+            summary('request_sql_statements', 'SQL statements executed per request.', 'endpoint', self._sql_statements)
+            summary('template_render_seconds', 'Template render time.', 'template', self._render)
+            counter('request_db_connections_total', 'Pooled connections checked out by requests.', 'endpoint', self._connections)
+            counter('request_errors_total', 'Requests that raised an exception.', 'endpoint', self._errors)
+        for subsystem, stats in (gauges or {}).items():
+            for key, value in stats.items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    metric = f'{self.prefix}_{subsystem}_{key}'
+                    lines.append(f'# TYPE {metric} gauge')
+                    lines.append(f'{metric} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
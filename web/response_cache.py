@@ -0,0 +1,125 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+
+
+class ResponseCache:
+    """
+    Process-local cache for rendered leaderboard fragments and query results.
+
+    Every entry is tagged with the generation counter current when it was
+    computed. Score writes call invalidate(), which bumps the generation and
+    drops all entries at once; `ttl` bounds how long an entry can outlive
+    writes this process does not see (another process, the game client's
+    offline settlement). Entries expire at the end of the `ttl` window they
+    were computed in, counted from the last invalidation. etag() hashes a
+    random per-process epoch, the generation and that window, so a page's
+    ETag changes whenever its cached inputs may have, and never repeats
+    across worker processes or restarts.
+    """
+
+    def __init__(self, ttl=5.0, max_entries=1024):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._epoch = os.urandom(8).hex()
+        self._generation = 0
+        # key -> (generation, window, created_at, value), least recently used first
+        self._entries = OrderedDict()
+        self._invalidated_at = time.monotonic()
+        # Metrics
+        self._hits = 0
+        self._misses = 0
+        self._expired = 0
+        self._invalidations = 0
+        self._not_modified = 0
+        self._served_age_total = 0.0
+        self._served_age_max = 0.0
+
+    @property
+    def generation(self):
+        return self._generation
+
+    def get(self, key, compute):
+        """
+        Return the cached value for `key`, calling `compute()` to fill it
+        when it is missing, expired or from an older generation. A value
+        computed while an invalidation happened is returned but not stored.
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                generation, window, created_at, value = entry
+                age = now - created_at
+                if generation == self._generation and window == self._window(now) and age < self.ttl:
+                    self._entries.move_to_end(key)
+                    self._hits += 1
+                    self._served_age_total += age
+                    self._served_age_max = max(self._served_age_max, age)
+                    return value
+                del self._entries[key]
+                self._expired += 1
+            self._misses += 1
+            generation = self._generation
+            window = self._window(now)
+        value = compute()
+        with self._lock:
+            if generation == self._generation and window == self._window(time.monotonic()):
+                self._entries[key] = (generation, window, now, value)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return value
+
+    def invalidate(self):
+        """
+        Bump the generation and drop every cached entry.
+        """
+        with self._lock:
+            self._generation += 1
+            self._invalidations += 1
+            self._entries = OrderedDict()
+            self._invalidated_at = time.monotonic()
+
+    def _window(self, now):
+        # Index of the ttl window `now` falls in since the last invalidation
+        if self.ttl <= 0:
+            return now
+        return int((now - self._invalidated_at) // self.ttl)
+
+    def etag(self, *parts):
+        """
+        Strong ETag for a response built from `parts` in this process at
+        the current generation and ttl window.
+        """
+        with self._lock:
+            key = repr((self._epoch, self._generation, self._window(time.monotonic())) + parts).encode()
+        return hashlib.blake2b(key, digest_size=8).hexdigest()
+
+    def count_not_modified(self):
+        with self._lock:
+            self._not_modified += 1
+
+    def stats(self):
+        """
+        Snapshot of hit ratio, invalidation and staleness metrics.
+        """
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                'ttl': self.ttl,
+                'max_entries': self.max_entries,
+                'entries': len(self._entries),
+                'generation': self._generation,
+                'hits': self._hits,
+                'misses': self._misses,
+                'hit_ratio': self._hits / lookups if lookups else 0.0,
+                'expired': self._expired,
+                'invalidations': self._invalidations,
+                'not_modified': self._not_modified,
+                'served_age_avg': self._served_age_total / self._hits if self._hits else 0.0,
+                'served_age_max': self._served_age_max,
+                'seconds_since_invalidation': time.monotonic() - self._invalidated_at,
+            }
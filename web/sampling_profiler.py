@@ -0,0 +1,95 @@
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+
+class SamplingProfiler:
+    """
+    Low-overhead sampling profiler for request threads.
+
+    A background thread wakes every `interval_ms`, reads the current stack
+    of every thread that is inside a request and counts it. When a request
+    finishes slower than `slow_ms`, its samples are written to `output_dir`
+    in the folded-stack format ("frame;frame;frame count" per line) read by
+    flamegraph.pl, speedscope and inferno. Fast requests cost one dict
+    insert and removal.
+    """
+
+    def __init__(self, output_dir, slow_ms=500, interval_ms=5):
+        self.output_dir = output_dir
+        self.slow_ms = slow_ms
+        self.interval_ms = interval_ms
+        self._lock = threading.Lock()
+        # thread id -> Counter of folded stacks
+        self._active = {}
+        self._thread = None
+        self._dumps = 0
+
+    def _ensure_started(self):
+        if self._thread is None:
+            self._thread = threading.Thread(
+                target=self._run, name='sampling-profiler', daemon=True
+            )
+            self._thread.start()
+
+    def _run(self):
+        interval = self.interval_ms / 1000.0
+        while True:
+            time.sleep(interval)
+            with self._lock:
+                if not self._active:
+                    continue
+                frames = sys._current_frames()
+                for thread_id, samples in self._active.items():
+                    frame = frames.get(thread_id)
+                    if frame is not None:
+                        samples[_fold(frame)] += 1
+
+    def start(self):
+        """
+        Begin sampling the calling thread.
+        """
+        with self._lock:
+            self._ensure_started()
+            self._active[threading.get_ident()] = Counter()
+
+    def finish(self, name, elapsed):
+        """
+        Stop sampling the calling thread and dump its stacks if the request
+        took longer than `slow_ms`. Returns the path written, if any.
+        """
+        with self._lock:
+            samples = self._active.pop(threading.get_ident(), None)
+        if not samples or elapsed * 1000 < self.slow_ms:
+            return None
+        os.makedirs(self.output_dir, exist_ok=True)
+        path = os.path.join(
+            self.output_dir, f'{time.strftime("%Y%m%d-%H%M%S")}-{int(elapsed * 1000)}ms-{name}.folded'
+        )
+        with open(path, 'w') as f:
+            for stack, count in samples.most_common():
+                f.write(f'{stack} {count}\n')
+        with self._lock:
+            self._dumps += 1
+        return path
+
+    def stats(self):
+        with self._lock:
+            return {
+                'slow_ms': self.slow_ms,
+                'interval_ms': self.interval_ms,
+                'active': len(self._active),
+                'dumps': self._dumps,
+            }
+
+
+def _fold(frame):
+    stack = []
+    while frame is not None:
+        code = frame.f_code
+        stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+        frame = frame.f_back
+    stack.reverse()
+    return ';'.join(stack)